@@ -0,0 +1,21 @@
+# Настройки gunicorn: читаются из текущего каталога при запуске `gunicorn` из корня проекта
+import os
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'voentorgsystem.settings')
+
+wsgi_app = 'voentorgsystem.wsgi:application'
+
+
+def on_starting(server):
+    """Мастер до запуска воркеров: файлы метрик прошлого запуска больше не нужны"""
+    import django
+    django.setup()
+
+    from voentorg.metrics import clear_metrics_dir
+    server.log.info('Удалено файлов метрик прошлого запуска: %d', clear_metrics_dir())
+
+
+def child_exit(server, worker):
+    """Воркер завершился: его значения метрик переносятся в общий архив, а файл удаляется"""
+    from voentorg.metrics import mark_process_dead
+    mark_process_dead(worker.pid)
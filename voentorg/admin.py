@@ -1,7 +1,14 @@
 # admin.py
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
+from django.db import transaction
+from django.http import HttpResponse
+from django.shortcuts import get_object_or_404
+from django.urls import path, reverse
+from django.utils import timezone
+from django.utils.html import format_html
 from .models import *
+from .exports import orders_csv_response
 
 @admin.register(CustomUser)
 class CustomUserAdmin(UserAdmin):
@@ -25,12 +32,183 @@ class ProductAdmin(admin.ModelAdmin):
     list_editable = ('price', 'stock', 'is_available')
     prepopulated_fields = {'slug': ('name',)}
 
+    def save_model(self, request, obj, form, change):
+        """Изменение остатка из админки записывается в журнал как корректировка"""
+        if change and 'stock' not in form.changed_data:
+            super().save_model(request, obj, form, change)
+            return
+
+        with transaction.atomic():
+            previous = 0
+            if change:
+                previous = Product.objects.select_for_update().values_list('stock', flat=True).get(pk=obj.pk)
+            super().save_model(request, obj, form, change)
+            if obj.stock != previous:
+                StockMovement.objects.create(
+                    product=obj,
+                    change=obj.stock - previous,
+                    reason=StockMovement.REASON_ADJUSTMENT,
+                    note=f'Админка: {request.user.username}'
+                )
+
 @admin.register(Order)
 class OrderAdmin(admin.ModelAdmin):
     list_display = ('id', 'user', 'status', 'total_amount', 'created_at')
     list_filter = ('status', 'created_at')
     search_fields = ('user__username', 'user__email', 'contact_phone')
     readonly_fields = ('created_at', 'updated_at')
+    list_select_related = ('user', 'status')
+    show_full_result_count = False
+    actions = ('export_csv',)
+
+    @admin.action(description='Выгрузить в CSV (с позициями заказов)')
+    def export_csv(self, request, queryset):
+        filename = f"orders_{timezone.localtime():%Y%m%d_%H%M%S}.csv"
+        return orders_csv_response(queryset, filename=filename)
+
+class ArchivedOrderItemInline(admin.TabularInline):
+    model = ArchivedOrderItem
+    extra = 0
+    can_delete = False
+    readonly_fields = ('product', 'quantity', 'price', 'subtotal')
+
+@admin.register(ArchivedOrder)
+class ArchivedOrderAdmin(admin.ModelAdmin):
+    list_display = ('id', 'user', 'status', 'total_amount', 'created_at', 'archived_at')
+    list_filter = ('status', 'created_at')
+    search_fields = ('user__username', 'user__email', 'guest_email', 'contact_phone')
+    inlines = (ArchivedOrderItemInline,)
+    actions = ('export_csv',)
+
+    @admin.action(description='Выгрузить в CSV (с позициями заказов)')
+    def export_csv(self, request, queryset):
+        filename = f"archived_orders_{timezone.localtime():%Y%m%d_%H%M%S}.csv"
+        return orders_csv_response(queryset, filename=filename)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+@admin.register(DailySales)
+class DailySalesAdmin(admin.ModelAdmin):
+    list_display = ('date', 'product', 'category', 'quantity', 'revenue')
+    list_filter = ('category', 'date')
+    date_hierarchy = 'date'
+
+@admin.register(StockMovement)
+class StockMovementAdmin(admin.ModelAdmin):
+    list_display = ('id', 'product', 'change', 'reason', 'order_id', 'note', 'created_at')
+    list_filter = ('reason', 'created_at')
+    search_fields = ('product__name', 'note')
+    raw_id_fields = ('product',)
+    show_full_result_count = False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+@admin.register(ReorderSuggestion)
+class ReorderSuggestionAdmin(admin.ModelAdmin):
+    list_display = ('product', 'stock', 'daily_demand', 'days_of_cover', 'suggested_quantity', 'computed_at')
+    list_select_related = ('product',)
+    search_fields = ('product__name',)
+    ordering = ('days_of_cover',)
+
+    def has_add_permission(self, request):
+        return False
+
+@admin.register(MediaBlob)
+class MediaBlobAdmin(admin.ModelAdmin):
+    list_display = ('name', 'size', 'references', 'created_at', 'updated_at')
+    list_filter = ('created_at',)
+    search_fields = ('name', 'sha256')
+    show_full_result_count = False
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+@admin.register(RequestProfile)
+class RequestProfileAdmin(admin.ModelAdmin):
+    list_display = ('created_at', 'method', 'path', 'view_name', 'status_code', 'duration_ms', 'query_count', 'peak_memory', 'user')
+    list_filter = ('view_name', 'created_at')
+    search_fields = ('path', 'view_name')
+    list_select_related = ('user',)
+    fields = (
+        'created_at', 'user', 'method', 'path', 'view_name', 'status_code', 'duration_ms',
+        'query_count', 'query_time_ms', 'peak_memory', 'download_link', 'cpu_summary_text', 'memory_summary_text',
+    )
+    readonly_fields = fields
+
+    def get_urls(self):
+        return [
+            path('<int:pk>/download/', self.admin_site.admin_view(self.download_view), name='voentorg_requestprofile_download'),
+        ] + super().get_urls()
+
+    def download_view(self, request, pk):
+        """Профиль в формате cProfile -o для snakeviz или pstats"""
+        if not self.has_view_permission(request):
+            return HttpResponse(status=403)
+        profile = get_object_or_404(RequestProfile, pk=pk)
+        response = HttpResponse(bytes(profile.profile_data), content_type='application/octet-stream')
+        response['Content-Disposition'] = f'attachment; filename="profile_{profile.pk}.prof"'
+        return response
+
+    @admin.display(description='Файл профиля')
+    def download_link(self, obj):
+        return format_html('<a href="{}">profile_{}.prof</a>', reverse('admin:voentorg_requestprofile_download', args=[obj.pk]), obj.pk)
+
+    @admin.display(description='Функции по суммарному времени')
+    def cpu_summary_text(self, obj):
+        return format_html('<pre>{}</pre>', obj.cpu_summary)
+
+    @admin.display(description='Выделения памяти')
+    def memory_summary_text(self, obj):
+        return format_html('<pre>{}</pre>', obj.memory_summary or '-')
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+@admin.register(SlowQuery)
+class SlowQueryAdmin(admin.ModelAdmin):
+    list_display = ('fingerprint_short', 'view_name', 'calls', 'total_time_ms', 'max_time_ms', 'last_seen')
+    list_filter = ('view_name', 'database')
+    search_fields = ('fingerprint',)
+    readonly_fields = [field.name for field in SlowQuery._meta.fields]
+
+    @admin.display(description='Запрос', ordering='fingerprint')
+    def fingerprint_short(self, obj):
+        return obj.fingerprint[:120]
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+@admin.register(ProductRecommendation)
+class ProductRecommendationAdmin(admin.ModelAdmin):
+    list_display = ('product', 'rank', 'recommended', 'kind', 'score')
+    list_select_related = ('product', 'recommended')
+    list_filter = ('kind',)
+    search_fields = ('product__name',)
+    raw_id_fields = ('product', 'recommended')
+    show_full_result_count = False
+
+    def has_add_permission(self, request):
+        return False
 
 admin.site.register(OrderStatus)
 admin.site.register(ProductImage)
@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class VoentorgConfig(AppConfig):
     name = 'voentorg'
+
+    def ready(self):
+        import voentorg.signals
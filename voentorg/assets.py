@@ -0,0 +1,208 @@
+import json
+import re
+from pathlib import Path
+
+from django.templatetags.static import static
+
+# Бандлы: имя -> исходные файлы в порядке подключения.
+# Бандл страницы уже содержит общие стили и скрипты, поэтому странице нужен один файл каждого типа
+ASSET_BUNDLES = {
+    'main.css': ['voentorg/css/main.css'],
+    'about.css': ['voentorg/css/main.css', 'voentorg/css/about.css'],
+    'auth.css': ['voentorg/css/main.css', 'voentorg/css/auth.css'],
+    'cart.css': ['voentorg/css/main.css', 'voentorg/css/cart.css'],
+    'checkout.css': ['voentorg/css/main.css', 'voentorg/css/checkout.css'],
+    'contacts.css': ['voentorg/css/main.css', 'voentorg/css/contacts.css'],
+    'product.css': ['voentorg/css/main.css', 'voentorg/css/product.css'],
+    'profile.css': ['voentorg/css/main.css', 'voentorg/css/profile.css'],
+    'main.js': ['voentorg/js/main.js'],
+    'auth.js': ['voentorg/js/main.js', 'voentorg/js/auth.js'],
+    'cart.js': ['voentorg/js/main.js', 'voentorg/js/cart.js'],
+    'checkout.js': ['voentorg/js/main.js', 'voentorg/js/checkout.js'],
+    'contacts.js': ['voentorg/js/main.js', 'voentorg/js/contacts.js'],
+    'product.js': ['voentorg/js/main.js', 'voentorg/js/product.js'],
+    'profile.js': ['voentorg/js/main.js', 'voentorg/js/profile.js'],
+}
+
+# Собранные файлы лежат в статике приложения на той же глубине, что css/ и js/,
+# поэтому относительные url(...) в стилях продолжают работать
+BUILD_ROOT = Path(__file__).resolve().parent / 'static'
+OUTPUT_DIR = 'voentorg/dist'
+MANIFEST_NAME = f'{OUTPUT_DIR}/manifest.json'
+
+_manifest = {'mtime': None, 'bundles': {}}
+
+
+def minify_css(source):
+    """Удаляет комментарии и незначащие пробелы из CSS"""
+    source = re.sub(r'/\*.*?\*/', '', source, flags=re.S)
+    source = re.sub(r'\s+', ' ', source)
+    source = re.sub(r'\s*([{};,>])\s*', r'\1', source)
+    source = re.sub(r':\s+', ':', source)
+    return source.replace(';}', '}').strip()
+
+
+def _skip_string(source, i, quote):
+    """Индекс после строки в кавычках, начинающейся с source[i]"""
+    i += 1
+    while i < len(source):
+        if source[i] == '\\':
+            i += 2
+            continue
+        if source[i] == quote or source[i] == '\n':
+            return i + 1
+        i += 1
+    return i
+
+
+def _skip_template(source, i):
+    """Индекс после шаблонной строки `...${выражение}...`, начинающейся с source[i]"""
+    i += 1
+    while i < len(source):
+        ch = source[i]
+        if ch == '\\':
+            i += 2
+        elif ch == '`':
+            return i + 1
+        elif source.startswith('${', i):
+            i = _skip_expression(source, i + 2)
+        else:
+            i += 1
+    return i
+
+
+def _skip_expression(source, i):
+    """Индекс после закрывающей скобки подстановки ${...} с учетом вложенных строк и скобок"""
+    depth = 0
+    while i < len(source):
+        ch = source[i]
+        if ch in '"\'':
+            i = _skip_string(source, i, ch)
+            continue
+        if ch == '`':
+            i = _skip_template(source, i)
+            continue
+        if ch == '{':
+            depth += 1
+        elif ch == '}':
+            if depth == 0:
+                return i + 1
+            depth -= 1
+        i += 1
+    return i
+
+
+def _skip_regex(source, i):
+    """Индекс после литерала регулярного выражения /.../флаги"""
+    i += 1
+    in_class = False
+    while i < len(source):
+        ch = source[i]
+        if ch == '\\':
+            i += 2
+            continue
+        if ch == '\n':
+            return i
+        if ch == '[':
+            in_class = True
+        elif ch == ']':
+            in_class = False
+        elif ch == '/' and not in_class:
+            i += 1
+            while i < len(source) and source[i].isalpha():
+                i += 1
+            return i
+        i += 1
+    return i
+
+
+REGEX_PRECEDING_CHARS = set('(,=:[!&|?{};+-*%<>~^')
+REGEX_PRECEDING_WORDS = {'return', 'typeof', 'case', 'do', 'else', 'in', 'of', 'new', 'delete', 'void', 'throw'}
+# Рядом с этими символами пробел никогда не нужен
+TIGHT_CHARS = set('{}()[];,')
+
+
+def minify_js(source):
+    """
+    Консервативная минификация JS: удаляет комментарии, отступы и пустые строки.
+    Переводы строк сохраняются (кроме позиций после { ( [ , ;), чтобы не зависеть
+    от автоматической расстановки точек с запятой; строки, шаблонные строки
+    и регулярные выражения копируются без изменений.
+    """
+    out = []
+    last = ''
+    pending_space = pending_newline = False
+    i = 0
+    while i < len(source):
+        ch = source[i]
+        if ch in ' \t\r\f\v':
+            pending_space = True
+            i += 1
+            continue
+        if ch == '\n':
+            pending_newline = True
+            i += 1
+            continue
+        if source.startswith('//', i):
+            end = source.find('\n', i)
+            i = len(source) if end == -1 else end
+            continue
+        if source.startswith('/*', i):
+            end = source.find('*/', i + 2)
+            i = len(source) if end == -1 else end + 2
+            pending_space = True
+            continue
+
+        if out:
+            if pending_newline and last not in '{([,;':
+                out.append('\n')
+            elif (pending_space or pending_newline) and last not in TIGHT_CHARS and ch not in TIGHT_CHARS:
+                out.append(' ')
+        pending_space = pending_newline = False
+
+        if ch in '"\'':
+            end = _skip_string(source, i, ch)
+        elif ch == '`':
+            end = _skip_template(source, i)
+        elif ch == '/' and _regex_allowed(out, last):
+            end = _skip_regex(source, i)
+        else:
+            end = i + 1
+        token = source[i:end]
+        out.append(token)
+        last = token[-1]
+        i = end
+
+    return ''.join(out).strip()
+
+
+def _regex_allowed(out, last):
+    """Может ли в этой позиции начинаться регулярное выражение (а не деление)"""
+    if not last or last in REGEX_PRECEDING_CHARS:
+        return True
+    word = re.search(r'[A-Za-z_$][\w$]*$', ''.join(out[-20:]))
+    return bool(word) and word.group(0) in REGEX_PRECEDING_WORDS
+
+
+def load_manifest():
+    """Соответствие имен бандлов и собранных файлов; перечитывается после каждой сборки"""
+    path = BUILD_ROOT / MANIFEST_NAME
+    try:
+        mtime = path.stat().st_mtime
+    except OSError:
+        return {}
+    if _manifest['mtime'] != mtime:
+        with open(path, encoding='utf-8') as file:
+            _manifest['bundles'] = json.load(file)['bundles']
+        _manifest['mtime'] = mtime
+    return _manifest['bundles']
+
+
+def bundle_urls(name):
+    """URL собранного бандла, а если сборки не было - URL исходных файлов"""
+    if name not in ASSET_BUNDLES:
+        raise ValueError(f'Неизвестный бандл: {name}')
+    built = load_manifest().get(name)
+    if built:
+        return [static(built)]
+    return [static(source) for source in ASSET_BUNDLES[name]]
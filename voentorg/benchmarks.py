@@ -0,0 +1,234 @@
+import json
+import random
+import time
+from io import StringIO
+
+from django.core.management import call_command
+from django.db import transaction
+from django.test import Client
+
+from .models import Cart, CartItem, CustomUser, Product
+from .queries import QueryRecorder
+from .slow_queries import explain
+
+BENCHMARK_PASSWORD = 'benchmark-password-1'
+PERCENTILES = (50, 90, 95, 99)
+
+# Данные формы оформления заказа
+USER_ORDER_FORM = {
+    'shipping_address': 'г. Иркутск, ул. Ленина, д. 1',
+    'contact_phone': '+79990000000',
+    'agree_terms': 'on',
+}
+GUEST_ORDER_FORM = {
+    'email': 'guest@example.com',
+    'first_name': 'Гость',
+    'last_name': 'Тестовый',
+    'phone': '+79990000000',
+    'shipping_address': 'г. Иркутск, ул. Ленина, д. 1',
+}
+
+# Сценарии: имя представления -> зависит ли от размера корзины
+SCENARIOS = {
+    'home': False,
+    'home_category_price': False,
+    'home_newest': False,
+    'catalog': False,
+    'product_detail': False,
+    'search': False,
+    'ajax_add_to_cart': True,
+    'get_cart_count': True,
+    'process_user_order': True,
+    'guest_checkout': True,
+}
+
+
+def percentile(sorted_values, percent):
+    """Процентиль с линейной интерполяцией по отсортированному списку"""
+    if not sorted_values:
+        return None
+    position = (len(sorted_values) - 1) * percent / 100
+    lower = int(position)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
+
+
+def summarize(durations, query_counts, errors):
+    """Сводка замеров: задержки в миллисекундах и количество SQL-запросов"""
+    durations = sorted(duration * 1000 for duration in durations)
+    summary = {
+        'samples': len(durations),
+        'errors': errors,
+        'mean_ms': round(sum(durations) / len(durations), 3) if durations else None,
+        'max_ms': round(durations[-1], 3) if durations else None,
+        'queries': max(query_counts) if query_counts else None,
+    }
+    for percent in PERCENTILES:
+        value = percentile(durations, percent)
+        summary[f'p{percent}_ms'] = round(value, 3) if value is not None else None
+    return summary
+
+
+def catalog_queries(category_id):
+    """Основные запросы витрины (как в представлении home) для сравнения планов выполнения"""
+    available = Product.objects.available()
+    return {
+        'popular': available.order_by('-popularity_score', '-created_at'),
+        'newest': available.order_by('-created_at'),
+        'category_price': available.filter(category_id=category_id).order_by('price'),
+        'category_popular': available.filter(category_id=category_id).order_by('-popularity_score', '-created_at'),
+    }
+
+
+def query_plans(category_id, using='default'):
+    """Планы выполнения запросов витрины: имя запроса -> текст EXPLAIN"""
+    plans = {}
+    for name, queryset in catalog_queries(category_id).items():
+        sql, params = queryset.query.sql_with_params()
+        plans[name] = explain(using, sql, params)
+    return plans
+
+
+def seed_dataset(product_count, seed):
+    """
+    Доводит каталог до product_count синтетических товаров через populate_db.
+    Генерация детерминирована по seed и продолжается с контрольной точки,
+    поэтому размеры можно наращивать по возрастанию без пересоздания базы
+    """
+    call_command(
+        'populate_db',
+        products=product_count,
+        users=0,
+        orders=0,
+        seed=seed,
+        skip_images=True,
+        workers=1,
+        stdout=StringIO(),
+    )
+
+
+class StorefrontBenchmark:
+    """Замеры горячих путей витрины через тестовый клиент Django на текущей базе данных"""
+
+    def __init__(self, seed=42, iterations=20, warmup=2, time_limit=30.0, cart_sizes=(1, 10, 50)):
+        self.seed = seed
+        self.iterations = iterations
+        self.warmup = warmup
+        self.time_limit = time_limit
+        self.cart_sizes = cart_sizes
+
+    def prepare(self):
+        """Выбирает товары и покупателей для сценариев (детерминированно по seed)"""
+        rng = random.Random(f'{self.seed}:benchmark')
+        available = list(
+            Product.objects.available().filter(stock__gte=1).order_by('id').values_list('id', 'name')
+        )
+        if not available:
+            raise ValueError('В базе нет доступных товаров для замеров')
+        self.product_ids = [product_id for product_id, name in rng.sample(available, min(len(available), 100))]
+        self.category_id = Product.objects.available().filter(pk__in=self.product_ids).exclude(
+            category=None
+        ).order_by('id').values_list('category_id', flat=True).first()
+        self.search_terms = sorted({name.split()[0] for product_id, name in rng.sample(available, min(len(available), 20))})
+
+        self.cart_products = {}
+        self.users = {}
+        for size in self.cart_sizes:
+            self.cart_products[size] = [
+                product_id for product_id, name in rng.sample(available, min(len(available), size))
+            ]
+            user, created = CustomUser.objects.get_or_create(
+                username=f'bench_{self.seed}_{size}',
+                defaults={'email': f'bench_{self.seed}_{size}@example.com'}
+            )
+            if created:
+                user.set_password(BENCHMARK_PASSWORD)
+                user.save()
+            cart, created = Cart.objects.get_or_create(user=user)
+            cart.items.all().delete()
+            CartItem.objects.bulk_create([
+                CartItem(cart=cart, product_id=product_id, quantity=1) for product_id in self.cart_products[size]
+            ])
+            self.users[size] = user
+
+    def requests(self, scenario, cart_size):
+        """Клиент и функция, выполняющая i-й запрос сценария"""
+        client = Client()
+        if scenario in ('ajax_add_to_cart', 'get_cart_count', 'process_user_order'):
+            client.force_login(self.users[cart_size])
+        elif scenario == 'guest_checkout':
+            session = client.session
+            session['cart'] = json.dumps({str(product_id): 1 for product_id in self.cart_products[cart_size]})
+            session.save()
+
+        def product_id(i):
+            return self.product_ids[i % len(self.product_ids)]
+
+        return {
+            'home': lambda i: client.get('/'),
+            'home_category_price': lambda i: client.get('/', {'category': self.category_id, 'sort': 'price_asc'}),
+            'home_newest': lambda i: client.get('/', {'sort': 'newest'}),
+            'catalog': lambda i: client.get('/catalog/'),
+            'product_detail': lambda i: client.get(f'/product/{product_id(i)}/'),
+            'search': lambda i: client.get('/search/', {'q': self.search_terms[i % len(self.search_terms)]}),
+            'ajax_add_to_cart': lambda i: client.post(f'/cart/ajax_add/{product_id(i)}/'),
+            'get_cart_count': lambda i: client.get('/cart/get_count/'),
+            'process_user_order': lambda i: client.post('/order/create/', USER_ORDER_FORM),
+            'guest_checkout': lambda i: client.post('/order/guest/', GUEST_ORDER_FORM),
+        }[scenario]
+
+    def measure(self, scenario, cart_size=None):
+        """Замеряет один сценарий; изменения в базе после каждого запроса откатываются"""
+        make_request = self.requests(scenario, cart_size)
+        durations, query_counts, errors = [], [], 0
+        started = time.perf_counter()
+        for i in range(self.warmup + self.iterations):
+            recorder = QueryRecorder()
+            with transaction.atomic():
+                with recorder.record():
+                    request_started = time.perf_counter()
+                    response = make_request(i)
+                    duration = time.perf_counter() - request_started
+                transaction.set_rollback(True)
+            if i < self.warmup:
+                continue
+            durations.append(duration)
+            query_counts.append(recorder.count)
+            if response.status_code >= 400:
+                errors += 1
+            # Медленный сценарий на большом каталоге ограничиваем по времени, а не по числу повторов
+            if time.perf_counter() - started > self.time_limit:
+                break
+        return summarize(durations, query_counts, errors)
+
+    def run(self):
+        """Все сценарии: ключ вида 'home' или 'get_cart_count[cart=10]' -> сводка"""
+        self.prepare()
+        results = {}
+        for scenario, depends_on_cart in SCENARIOS.items():
+            for cart_size in (self.cart_sizes if depends_on_cart else (None,)):
+                key = scenario if cart_size is None else f'{scenario}[cart={cart_size}]'
+                results[key] = self.measure(scenario, cart_size)
+        return results
+
+
+def compare_results(results, baseline, tolerance=0.25):
+    """
+    Сравнивает результаты с эталоном по p50 и числу запросов.
+    Возвращает список (размер, сценарий, метрика, эталон, текущее значение) для ухудшений
+    """
+    regressions = []
+    for size, scenarios in results.items():
+        for key, current in scenarios.items():
+            reference = baseline.get(size, {}).get(key)
+            if not reference:
+                continue
+            if current['p50_ms'] is not None and reference['p50_ms'] is not None:
+                if current['p50_ms'] > reference['p50_ms'] * (1 + tolerance):
+                    regressions.append((size, key, 'p50_ms', reference['p50_ms'], current['p50_ms']))
+            if current['queries'] is not None and reference['queries'] is not None:
+                if current['queries'] > reference['queries']:
+                    regressions.append((size, key, 'queries', reference['queries'], current['queries']))
+            if current['errors'] > reference['errors']:
+                regressions.append((size, key, 'errors', reference['errors'], current['errors']))
+    return regressions
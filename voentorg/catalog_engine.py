@@ -0,0 +1,164 @@
+import threading
+import time
+from decimal import Decimal
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.db import models
+
+from .models import Product
+
+# Номер версии каталога в общем кэше и списки товаров, измененных в каждой версии
+VERSION_KEY = 'catalog_engine:version'
+CHANGES_KEY = 'catalog_engine:changes:{}'
+# Больше изменений в одной версии или пропущенных версий - дешевле перечитать каталог целиком
+MAX_CHANGED_IDS = 5000
+MAX_PENDING_VERSIONS = 100
+CHANGES_TIMEOUT = 24 * 60 * 60
+
+# Остатков в снимке нет: строки страницы читаются из базы, поэтому продажи (change_stock) версию не меняют
+COLUMNS = ('id', 'price', 'category_id', 'created_at', 'is_available', 'popularity_score')
+
+# Ключи lexsort (последний - главный) для каждой сортировки, тот же порядок, что views.SORT_ORDERS
+SORT_KEYS = {
+    'popular': lambda columns: (columns['id'], -columns['created_at'], -columns['popularity_score']),
+    'price_asc': lambda columns: (columns['id'], columns['price']),
+    'price_desc': lambda columns: (-columns['id'], -columns['price']),
+    'newest': lambda columns: (columns['id'], -columns['created_at']),
+}
+DEFAULT_SORT = 'popular'
+
+
+def enabled():
+    return getattr(settings, 'CATALOG_ENGINE', False)
+
+
+def load_columns(queryset):
+    """Столбцы товаров в массивах NumPy, упорядоченные по id"""
+    rows = list(queryset.order_by('id').values_list(*COLUMNS))
+    return {
+        'id': np.array([row[0] for row in rows], dtype=np.int64),
+        # Цена в копейках: сравнение и минимум без потери точности
+        'price': np.array([int(row[1] * 100) for row in rows], dtype=np.int64),
+        'category_id': np.array([-1 if row[2] is None else row[2] for row in rows], dtype=np.int64),
+        'created_at': np.array([int(row[3].timestamp() * 1_000_000) for row in rows], dtype=np.int64),
+        'is_available': np.array([row[4] for row in rows], dtype=bool),
+        'popularity_score': np.array([row[5] for row in rows], dtype=np.float64),
+    }
+
+
+class CatalogSnapshot:
+    """
+    Неизменяемый снимок каталога в памяти процесса: столбцы товаров и заранее посчитанные
+    перестановки для каждой сортировки. Фильтрация и сортировка - проход по массиву без SQL
+    """
+
+    def __init__(self, columns, version):
+        self.columns = columns
+        self.version = version
+        self.loaded_at = time.monotonic()
+        self.orders = {sort: np.lexsort(keys(columns)) for sort, keys in SORT_KEYS.items()}
+
+    def patched(self, changed_ids, version):
+        """Новый снимок, в котором перечитаны только измененные (и удаленные) товары"""
+        changed = np.array(sorted(changed_ids), dtype=np.int64)
+        fresh = load_columns(Product.objects.filter(pk__in=changed.tolist()))
+        keep = ~np.isin(self.columns['id'], changed)
+        columns = {name: np.concatenate([self.columns[name][keep], fresh[name]]) for name in COLUMNS}
+        order = np.argsort(columns['id'], kind='stable')
+        return CatalogSnapshot({name: values[order] for name, values in columns.items()}, version)
+
+    def select(self, category_id=None, sort=DEFAULT_SORT):
+        """Позиции доступных товаров (категории category_id) в порядке сортировки"""
+        order = self.orders.get(sort, self.orders[DEFAULT_SORT])
+        mask = self.columns['is_available'][order]
+        if category_id is not None:
+            mask &= self.columns['category_id'][order] == category_id
+        return order[mask]
+
+    def ids(self, positions):
+        return self.columns['id'][positions]
+
+    def price_range(self, positions):
+        """Минимальная и максимальная цена выбранных товаров (None, если выбор пуст)"""
+        if not len(positions):
+            return None, None
+        prices = self.columns['price'][positions]
+        return Decimal(int(prices.min())).scaleb(-2), Decimal(int(prices.max())).scaleb(-2)
+
+
+def products_by_ids(ids):
+    """Товары страницы одним запросом по первичному ключу в порядке ids (QuerySet ленивый)"""
+    ids = [int(product_id) for product_id in ids]
+    if not ids:
+        return Product.objects.none()
+    position = models.Case(
+        *[models.When(pk=product_id, then=models.Value(index)) for index, product_id in enumerate(ids)],
+        output_field=models.IntegerField(),
+    )
+    return Product.objects.filter(pk__in=ids).order_by(position)
+
+
+def bump_version(product_ids=None):
+    """
+    Сообщает процессам, что каталог изменился: увеличивает версию в общем кэше и запоминает
+    измененные товары (None - перечитать каталог целиком). Вызывается после фиксации транзакции
+    """
+    cache.add(VERSION_KEY, 0, None)
+    version = cache.incr(VERSION_KEY)
+    ids = None if product_ids is None or len(product_ids) > MAX_CHANGED_IDS else list(product_ids)
+    cache.set(CHANGES_KEY.format(version), ids, CHANGES_TIMEOUT)
+    return version
+
+
+_state = {'snapshot': None}
+_lock = threading.Lock()
+
+
+def invalidate():
+    """Сбрасывает снимок процесса: следующий запрос перечитает каталог"""
+    with _lock:
+        _state['snapshot'] = None
+
+
+def expired(snapshot):
+    """Снимок старше CATALOG_ENGINE_MAX_AGE: страховка от изменений в обход сигналов (QuerySet.update)"""
+    max_age = getattr(settings, 'CATALOG_ENGINE_MAX_AGE', None)
+    return max_age is not None and time.monotonic() - snapshot.loaded_at > max_age
+
+
+def refreshed(snapshot, version):
+    """Снимок версии version: догоняет изменения по спискам товаров или перечитывает все"""
+    if (
+        snapshot is None or expired(snapshot)
+        or not 0 <= version - snapshot.version <= MAX_PENDING_VERSIONS
+    ):
+        return CatalogSnapshot(load_columns(Product.objects.all()), version)
+
+    keys = [CHANGES_KEY.format(number) for number in range(snapshot.version + 1, version + 1)]
+    changes = cache.get_many(keys)
+    if any(changes.get(key) is None for key in keys):
+        # Список вытеснен из кэша, еще не записан или изменения массовые
+        return CatalogSnapshot(load_columns(Product.objects.all()), version)
+    changed_ids = set()
+    for key in keys:
+        changed_ids.update(changes[key])
+    return snapshot.patched(changed_ids, version)
+
+
+def is_current(snapshot, version):
+    return snapshot is not None and snapshot.version == version and not expired(snapshot)
+
+
+def get_snapshot():
+    """Актуальный снимок каталога процесса; проверка версии - одно чтение из кэша"""
+    version = cache.get(VERSION_KEY, 0)
+    snapshot = _state['snapshot']
+    if is_current(snapshot, version):
+        return snapshot
+    with _lock:
+        snapshot = _state['snapshot']
+        if not is_current(snapshot, version):
+            _state['snapshot'] = snapshot = refreshed(snapshot, version)
+        return snapshot
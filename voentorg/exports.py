@@ -0,0 +1,67 @@
+import csv
+import itertools
+
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+
+
+# Колонки выгрузки: заголовок CSV и соответствующий путь поля от модели Order (у ArchivedOrder те же)
+ORDER_EXPORT_COLUMNS = [
+    ('Номер заказа', 'id'),
+    ('Дата создания', 'created_at'),
+    ('Статус', 'status__name'),
+    ('Логин', 'user__username'),
+    ('Email пользователя', 'user__email'),
+    ('Email гостя', 'guest_email'),
+    ('Имя гостя', 'guest_name'),
+    ('Телефон', 'contact_phone'),
+    ('Адрес доставки', 'shipping_address'),
+    ('Сумма заказа', 'total_amount'),
+    ('ID товара', 'items__product_id'),
+    ('Товар', 'items__product__name'),
+    ('Количество', 'items__quantity'),
+    ('Цена', 'items__price'),
+    ('Подытог', 'items__subtotal'),
+]
+
+DEFAULT_CHUNK_SIZE = 2000
+
+
+class Echo:
+    """Псевдо-файл для csv.writer: возвращает строку вместо записи в буфер"""
+
+    def write(self, value):
+        return value
+
+
+def iter_order_rows(*order_sets, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Строки выгрузки: один заказ на каждую позицию (заказы без позиций - одной строкой).
+    Все связанные таблицы подтягиваются JOIN-ами одного запроса, строки читаются порциями.
+    Наборы заказов (например, архивные и текущие) выгружаются друг за другом
+    """
+    fields = [field for header, field in ORDER_EXPORT_COLUMNS]
+    created_at_index = fields.index('created_at')
+    rows = itertools.chain.from_iterable(
+        orders.order_by('id', 'items__id').values_list(*fields).iterator(chunk_size=chunk_size)
+        for orders in order_sets
+    )
+    for row in rows:
+        row = list(row)
+        row[created_at_index] = timezone.localtime(row[created_at_index]).strftime('%Y-%m-%d %H:%M:%S')
+        yield ['' if value is None else value for value in row]
+
+
+def iter_orders_csv(*order_sets, chunk_size=DEFAULT_CHUNK_SIZE, delimiter=','):
+    """Генератор строк CSV с заголовком; BOM нужен, чтобы Excel корректно открыл кириллицу"""
+    writer = csv.writer(Echo(), delimiter=delimiter)
+    yield '\ufeff' + writer.writerow([header for header, field in ORDER_EXPORT_COLUMNS])
+    for row in iter_order_rows(*order_sets, chunk_size=chunk_size):
+        yield writer.writerow(row)
+
+
+def orders_csv_response(orders, filename='orders.csv'):
+    """Потоковый HTTP-ответ с выгрузкой заказов в CSV"""
+    response = StreamingHttpResponse(iter_orders_csv(orders), content_type='text/csv; charset=utf-8')
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
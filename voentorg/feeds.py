@@ -0,0 +1,44 @@
+import csv
+import json
+import os
+
+from django.core.management.base import CommandError
+
+
+# Значения логических колонок, означающие «да»
+TRUE_VALUES = {'1', 'true', 'yes', 'да', '+'}
+
+
+def read_records(path):
+    """Потоково читает записи из CSV или JSON Lines; обычный JSON-массив читается целиком"""
+    extension = os.path.splitext(path)[1].lower()
+    with open(path, encoding='utf-8-sig', newline='') as source:
+        if extension == '.csv':
+            yield from csv.DictReader(source)
+        elif extension in ('.jsonl', '.ndjson'):
+            for line in source:
+                if line.strip():
+                    yield json.loads(line)
+        elif extension == '.json':
+            yield from json.load(source)
+        else:
+            raise CommandError(f'Неподдерживаемый формат файла: {extension} (ожидается .csv, .jsonl или .json)')
+
+
+def batched(records, size):
+    """Разбивает поток записей на пакеты фиксированного размера"""
+    batch = []
+    for record in records:
+        batch.append(record)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def parse_bool(value):
+    """Логическое значение из колонки файла (true/1/да или булево значение JSON)"""
+    if isinstance(value, bool):
+        return value
+    return str(value).strip().lower() in TRUE_VALUES
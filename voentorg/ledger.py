@@ -0,0 +1,28 @@
+from django.db.models import OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+from .models import StockMovement, StockSnapshot
+
+
+def ledger_stock_queryset(products, up_to_movement=None):
+    """
+    Аннотирует товары остатком по журналу: последний снимок + сумма движений после него.
+    Все считается одним запросом через коррелированные подзапросы.
+    """
+    latest_snapshot = StockSnapshot.objects.filter(product=OuterRef('pk')).order_by('-last_movement_id')
+    if up_to_movement is not None:
+        latest_snapshot = latest_snapshot.filter(last_movement_id__lte=up_to_movement)
+
+    products = products.annotate(
+        snapshot_stock=Coalesce(Subquery(latest_snapshot.values('stock')[:1]), Value(0)),
+        snapshot_movement=Coalesce(Subquery(latest_snapshot.values('last_movement_id')[:1]), Value(0)),
+    )
+
+    movements = StockMovement.objects.filter(product=OuterRef('pk'), id__gt=OuterRef('snapshot_movement'))
+    if up_to_movement is not None:
+        movements = movements.filter(id__lte=up_to_movement)
+    movements_total = movements.order_by().values('product').annotate(total=Sum('change')).values('total')
+
+    return products.annotate(
+        movements_total=Coalesce(Subquery(movements_total), Value(0)),
+    )
@@ -0,0 +1,96 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from voentorg.models import Order, OrderItem, ArchivedOrder, ArchivedOrderItem
+from voentorg.rollups import DAILY_SALES_CHECKPOINT, POPULARITY_CHECKPOINT, processed_up_to
+
+# Заказ переносится, только когда все его позиции уже учтены пересчетами по отметкам
+ROLLUP_CHECKPOINTS = [DAILY_SALES_CHECKPOINT, POPULARITY_CHECKPOINT]
+
+
+class Command(BaseCommand):
+    help = 'Переносит завершённые заказы старше N дней в архивные таблицы'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=180,
+            help='Архивировать заказы старше указанного количества дней (по умолчанию 180)',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Количество заказов, переносимых в одной транзакции',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только подсчитать заказы, не перенося их',
+        )
+
+    def handle(self, *args, **options):
+        days = options['days']
+        batch_size = options['batch_size']
+        if days < 0:
+            raise CommandError('Количество дней не может быть отрицательным')
+        if batch_size <= 0:
+            raise CommandError('Размер пакета должен быть положительным')
+
+        cutoff = timezone.now() - timedelta(days=days)
+        candidates = Order.objects.filter(
+            status__code__in=ArchivedOrder.ARCHIVABLE_STATUSES,
+            created_at__lt=cutoff,
+        )
+        processed_id = processed_up_to(ROLLUP_CHECKPOINTS)
+        pending = candidates.filter(items__id__gt=processed_id).distinct().count()
+        if pending:
+            self.stdout.write(self.style.WARNING(
+                f'Заказов с позициями, еще не учтенными в агрегатах: {pending}; они остаются в рабочих таблицах. '
+                f'Запустите update_sales_rollups и update_popularity'
+            ))
+        candidates = candidates.exclude(items__id__gt=processed_id)
+
+        if options['dry_run']:
+            self.stdout.write(f'Заказов для архивации: {candidates.count()}')
+            return
+
+        total_orders = 0
+        total_items = 0
+        while True:
+            # Берем очередной пакет по первичному ключу, чтобы транзакции оставались короткими
+            order_ids = list(candidates.order_by('id').values_list('id', flat=True)[:batch_size])
+            if not order_ids:
+                break
+
+            orders_count, items_count = self.archive_batch(order_ids)
+            total_orders += orders_count
+            total_items += items_count
+            self.stdout.write(f'Перенесено заказов: {total_orders} (позиций: {total_items})')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Архивация завершена. Заказов: {total_orders}, позиций: {total_items}'
+        ))
+
+    @transaction.atomic
+    def archive_batch(self, order_ids):
+        """Переносит пакет заказов вместе с позициями в архив и удаляет их из рабочих таблиц"""
+        orders = [
+            ArchivedOrder(**values)
+            for values in Order.objects.filter(id__in=order_ids).values(*ArchivedOrder.COPIED_FIELDS)
+        ]
+        items = [
+            ArchivedOrderItem(**values)
+            for values in OrderItem.objects.filter(order_id__in=order_ids).values(*ArchivedOrderItem.COPIED_FIELDS)
+        ]
+
+        ArchivedOrder.objects.bulk_create(orders)
+        ArchivedOrderItem.objects.bulk_create(items)
+
+        OrderItem.objects.filter(order_id__in=order_ids).delete()
+        Order.objects.filter(id__in=order_ids).delete()
+
+        return len(orders), len(items)
@@ -0,0 +1,206 @@
+import json
+import logging
+import os
+import platform
+import time
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+from django.utils import timezone
+from voentorg.benchmarks import StorefrontBenchmark, compare_results, query_plans, seed_dataset
+
+
+def parse_sizes(value):
+    """'1000,10000' -> [1000, 10000]"""
+    try:
+        sizes = sorted({int(item) for item in value.split(',') if item.strip()})
+    except ValueError:
+        raise CommandError(f'Ожидается список целых чисел через запятую: {value}')
+    if not sizes or sizes[0] <= 0:
+        raise CommandError(f'Размеры должны быть положительными: {value}')
+    return sizes
+
+
+class Command(BaseCommand):
+    help = (
+        'Воспроизводимые замеры витрины: на отдельной тестовой базе создает каталоги заданных размеров, '
+        'измеряет процентили задержки и число SQL-запросов основных представлений, сохраняет JSON '
+        'и сравнивает его с эталоном'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes',
+            default='1000,10000,100000',
+            help='Размеры каталога (число синтетических товаров) через запятую',
+        )
+        parser.add_argument(
+            '--cart-sizes',
+            default='1,10,50',
+            help='Количество позиций в корзине для сценариев корзины и заказа',
+        )
+        parser.add_argument(
+            '--iterations',
+            type=int,
+            default=20,
+            help='Число замеров каждого сценария',
+        )
+        parser.add_argument(
+            '--warmup',
+            type=int,
+            default=2,
+            help='Число прогревочных запросов, не входящих в замеры',
+        )
+        parser.add_argument(
+            '--time-limit',
+            type=float,
+            default=30.0,
+            help='Максимальное время на один сценарий в секундах (замеров будет меньше)',
+        )
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=42,
+            help='Начальное значение генератора данных',
+        )
+        parser.add_argument(
+            '--output',
+            default='benchmark_results.json',
+            help='Файл для результатов',
+        )
+        parser.add_argument(
+            '--baseline',
+            default='benchmark_baseline.json',
+            help='Файл эталонных результатов для сравнения',
+        )
+        parser.add_argument(
+            '--save-baseline',
+            action='store_true',
+            help='Сохранить результаты как новый эталон',
+        )
+        parser.add_argument(
+            '--tolerance',
+            type=float,
+            default=0.25,
+            help='Допустимый рост p50 относительно эталона (0.25 = 25%%)',
+        )
+        parser.add_argument(
+            '--fail-on-regression',
+            action='store_true',
+            help='Завершиться с ошибкой, если есть ухудшения относительно эталона',
+        )
+
+    def handle(self, *args, **options):
+        sizes = parse_sizes(options['sizes'])
+        cart_sizes = parse_sizes(options['cart_sizes'])
+        if options['iterations'] <= 0 or options['warmup'] < 0:
+            raise CommandError('Число замеров должно быть положительным, прогрева - неотрицательным')
+
+        benchmark = StorefrontBenchmark(
+            seed=options['seed'],
+            iterations=options['iterations'],
+            warmup=options['warmup'],
+            time_limit=options['time_limit'],
+            cart_sizes=cart_sizes,
+        )
+
+        # Сводки middleware по каждому запросу исказили бы замеры выводом в консоль
+        logger = logging.getLogger('voentorg')
+        log_level = logger.level
+        logger.setLevel(logging.ERROR)
+
+        # Замеры идут на отдельной тестовой базе: рабочие данные не меняются
+        setup_test_environment(debug=False)
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        results = {}
+        plans = {}
+        try:
+            for size in sizes:
+                self.stdout.write(f'Каталог {size} товаров: заполнение...')
+                started = time.perf_counter()
+                seed_dataset(size, options['seed'])
+                self.stdout.write(f'  заполнено за {time.perf_counter() - started:.1f} с, замеры...')
+                results[str(size)] = benchmark.run()
+                plans[str(size)] = query_plans(benchmark.category_id)
+                self.print_results(results[str(size)])
+                self.print_plans(plans[str(size)])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+            logger.setLevel(log_level)
+
+        report = {
+            'meta': {
+                'created_at': timezone.now().isoformat(),
+                'seed': options['seed'],
+                'iterations': options['iterations'],
+                'warmup': options['warmup'],
+                'cart_sizes': cart_sizes,
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'database': connection.vendor,
+                'machine': platform.machine(),
+                'cpu_count': os.cpu_count(),
+            },
+            'results': results,
+            'plans': plans,
+        }
+
+        regressions = []
+        if os.path.exists(options['baseline']):
+            with open(options['baseline'], encoding='utf-8') as file:
+                baseline = json.load(file)
+            regressions = compare_results(results, baseline['results'], options['tolerance'])
+            report['baseline'] = {'created_at': baseline['meta']['created_at'], 'regressions': regressions}
+            self.print_regressions(regressions)
+            self.print_plan_changes(plans, baseline.get('plans', {}))
+        elif not options['save_baseline']:
+            self.stdout.write(self.style.WARNING(
+                f'Эталон {options["baseline"]} не найден, сохраните его с --save-baseline'
+            ))
+
+        self.write_json(options['output'], report)
+        self.stdout.write(self.style.SUCCESS(f'Результаты сохранены в {options["output"]}'))
+        if options['save_baseline']:
+            self.write_json(options['baseline'], report)
+            self.stdout.write(self.style.SUCCESS(f'Эталон сохранен в {options["baseline"]}'))
+
+        if regressions and options['fail_on_regression']:
+            raise CommandError(f'Ухудшений относительно эталона: {len(regressions)}')
+
+    def write_json(self, path, data):
+        with open(path, 'w', encoding='utf-8') as file:
+            json.dump(data, file, ensure_ascii=False, indent=2)
+
+    def print_results(self, results):
+        self.stdout.write(f'  {"сценарий":<32} {"p50":>9} {"p95":>9} {"p99":>9} {"SQL":>6} {"ошибки":>6}')
+        for key, summary in results.items():
+            self.stdout.write(
+                f'  {key:<32} {summary["p50_ms"]:>9.2f} {summary["p95_ms"]:>9.2f} {summary["p99_ms"]:>9.2f} '
+                f'{summary["queries"]:>6} {summary["errors"]:>6}'
+            )
+
+    def print_regressions(self, regressions):
+        if not regressions:
+            self.stdout.write(self.style.SUCCESS('Ухудшений относительно эталона нет'))
+            return
+        self.stdout.write(self.style.WARNING(f'Ухудшения относительно эталона: {len(regressions)}'))
+        for size, key, metric, reference, current in regressions:
+            self.stdout.write(self.style.WARNING(f'  {size} товаров, {key}: {metric} {reference} -> {current}'))
+
+    def print_plans(self, plans):
+        self.stdout.write('  Планы запросов витрины:')
+        for name, plan in plans.items():
+            self.stdout.write(f'  {name:<20} {plan.replace(chr(10), "; ")}')
+
+    def print_plan_changes(self, plans, baseline_plans):
+        """Изменившиеся планы выполнения (например, после добавления индексов)"""
+        for size, size_plans in plans.items():
+            for name, plan in size_plans.items():
+                reference = baseline_plans.get(size, {}).get(name)
+                if reference is not None and reference != plan:
+                    self.stdout.write(f'  План {name} ({size} товаров) изменился:')
+                    self.stdout.write(f'    было:  {reference.replace(chr(10), "; ")}')
+                    self.stdout.write(f'    стало: {plan.replace(chr(10), "; ")}')
@@ -0,0 +1,107 @@
+import gzip
+import hashlib
+import json
+import os
+import time
+
+from django.contrib.staticfiles import finders
+from django.core.management.base import BaseCommand, CommandError
+from voentorg.assets import ASSET_BUNDLES, BUILD_ROOT, MANIFEST_NAME, OUTPUT_DIR, minify_css, minify_js
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+class Command(BaseCommand):
+    help = (
+        'Собирает бандлы CSS/JS: объединяет и минифицирует файлы, записывает их под именами с хэшем '
+        'содержимого, рядом кладет сжатые .gz/.br копии (для gzip_static/brotli_static) и manifest.json'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--no-minify',
+            action='store_true',
+            help='Только объединить файлы, без минификации',
+        )
+        parser.add_argument(
+            '--clean',
+            action='store_true',
+            help='Удалить собранные файлы, не упомянутые в новом манифесте',
+        )
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        output_dir = BUILD_ROOT / OUTPUT_DIR
+        os.makedirs(output_dir, exist_ok=True)
+        if brotli is None:
+            self.stdout.write(self.style.WARNING('Пакет brotli не установлен, файлы .br не создаются'))
+
+        manifest = {}
+        written = set()
+        for name, sources in ASSET_BUNDLES.items():
+            stem, extension = os.path.splitext(name)
+            parts = []
+            original_size = 0
+            for source in sources:
+                path = finders.find(source)
+                if not path:
+                    raise CommandError(f'Файл {source} из бандла {name} не найден в статике')
+                with open(path, encoding='utf-8') as file:
+                    text = file.read()
+                original_size += len(text.encode('utf-8'))
+                if not options['no_minify']:
+                    text = minify_css(text) if extension == '.css' else minify_js(text)
+                parts.append(text)
+
+            # Точка с запятой между скриптами: файл может заканчиваться выражением без нее
+            content = ('\n' if extension == '.css' else ';\n').join(parts).encode('utf-8')
+            digest = hashlib.sha256(content).hexdigest()[:12]
+            built_name = f'{OUTPUT_DIR}/{stem}.{digest}{extension}'
+            manifest[name] = built_name
+
+            sizes = self.write_bundle(BUILD_ROOT / built_name, content)
+            written.update(str(BUILD_ROOT / built_name) + suffix for suffix in ('', '.gz', '.br'))
+            self.stdout.write(
+                f'  {name} -> {built_name}: {original_size} -> {len(content)} байт'
+                + ''.join(f', {suffix} {size}' for suffix, size in sizes.items())
+            )
+
+        # Манифест записываем последним и атомарно: пока идет сборка, страницы ссылаются на прежние файлы
+        manifest_path = BUILD_ROOT / MANIFEST_NAME
+        temporary_path = f'{manifest_path}.tmp'
+        with open(temporary_path, 'w', encoding='utf-8') as file:
+            json.dump({'bundles': manifest}, file, ensure_ascii=False, indent=2, sort_keys=True)
+        os.replace(temporary_path, manifest_path)
+
+        if options['clean']:
+            removed = 0
+            for file_name in os.listdir(output_dir):
+                path = str(output_dir / file_name)
+                if path not in written and path != str(manifest_path):
+                    os.remove(path)
+                    removed += 1
+            self.stdout.write(f'Удалено устаревших файлов: {removed}')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Собрано бандлов: {len(manifest)} за {time.perf_counter() - started:.1f} с'
+        ))
+
+    def write_bundle(self, path, content):
+        """Записывает бандл и сжатые копии, возвращает размеры копий"""
+        sizes = {}
+        if not path.exists():
+            path.write_bytes(content)
+
+        # mtime=0 - одинаковое содержимое дает побайтно одинаковый архив
+        compressed = {'.gz': gzip.compress(content, compresslevel=9, mtime=0)}
+        if brotli is not None:
+            compressed['.br'] = brotli.compress(content, quality=11)
+        for suffix, data in compressed.items():
+            compressed_path = path.with_name(path.name + suffix)
+            if not compressed_path.exists():
+                compressed_path.write_bytes(data)
+            sizes[suffix] = len(data)
+        return sizes
@@ -0,0 +1,44 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from voentorg.recommendations import MAX_BASKET, MIN_SUPPORT, TOP_K, build_recommendations
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересчитывает рекомендации к товарам: «покупают вместе» по совместным покупкам в заказах, '
+        'недостающие позиции - популярные товары той же категории'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--top-k',
+            type=int,
+            default=TOP_K,
+            help='Сколько рекомендаций хранить для каждого товара',
+        )
+        parser.add_argument(
+            '--min-support',
+            type=int,
+            default=MIN_SUPPORT,
+            help='Минимальное число общих заказов для пары «покупают вместе»',
+        )
+        parser.add_argument(
+            '--max-basket',
+            type=int,
+            default=MAX_BASKET,
+            help='Заказы с большим числом разных товаров не учитываются',
+        )
+
+    def handle(self, *args, **options):
+        if options['top_k'] <= 0 or options['min_support'] <= 0 or options['max_basket'] < 2:
+            raise CommandError('--top-k и --min-support должны быть положительными, --max-basket - не меньше 2')
+
+        started = time.perf_counter()
+        together, created = build_recommendations(
+            top_k=options['top_k'], min_support=options['min_support'], max_basket=options['max_basket']
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Рекомендации пересчитаны за {time.perf_counter() - started:.1f} с: {created} строк, '
+            f'«покупают вместе» у {together} товаров'
+        ))
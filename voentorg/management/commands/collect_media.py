@@ -0,0 +1,141 @@
+import posixpath
+from collections import Counter
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from voentorg.models import Product, ProductImage, MediaBlob
+from voentorg.renditions import manifest_name, rendition_keys, rendition_name
+from voentorg.storage import CONTENT_ROOT, is_content_name, product_image_storage
+
+
+class Command(BaseCommand):
+    help = (
+        'Удаляет из хранилища по содержимому изображения товаров, на которые не осталось ссылок, '
+        'вместе с их уменьшенными копиями'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--recount',
+            action='store_true',
+            help='Пересчитать ссылки по товарам и изображениям (после массовых операций в обход модели)',
+        )
+        parser.add_argument(
+            '--grace-hours',
+            type=int,
+            default=24,
+            help='Не удалять файлы, загруженные или повторно использованные за последние N часов',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Количество записей, обрабатываемых за один проход',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только показать, что будет удалено',
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        if batch_size <= 0 or options['grace_hours'] < 0:
+            raise CommandError('Некорректные параметры')
+
+        self.storage = product_image_storage()
+        self.dry_run = options['dry_run']
+        cutoff = timezone.now() - timedelta(hours=options['grace_hours'])
+
+        if options['recount']:
+            self.recount_references()
+
+        removed = 0
+        freed = 0
+        orphans = MediaBlob.objects.filter(references__lte=0, updated_at__lt=cutoff).order_by('id')
+        last_id = 0
+        while True:
+            batch = list(orphans.filter(id__gt=last_id).values_list('id', 'name', 'size')[:batch_size])
+            if not batch:
+                break
+            last_id = batch[-1][0]
+            removed += len(batch)
+            freed += sum(size for blob_id, name, size in batch)
+            if not self.dry_run:
+                self.delete_blobs(batch, cutoff)
+
+        strays = self.delete_stray_files(set(self.iter_content_files()), cutoff)
+
+        action = 'Будет удалено' if self.dry_run else 'Удалено'
+        self.stdout.write(self.style.SUCCESS(
+            f'{action} файлов без ссылок: {removed} ({freed / 1024 / 1024:.1f} МБ), '
+            f'незарегистрированных файлов: {strays}'
+        ))
+
+    def recount_references(self):
+        """Пересчитывает счетчики ссылок по полям image товаров и изображений"""
+        references = Counter()
+        for model in (Product, ProductImage):
+            names = model.objects.exclude(image='').exclude(image__isnull=True).values_list('image', flat=True)
+            references.update(name for name in names.iterator(chunk_size=5000) if is_content_name(name))
+
+        with transaction.atomic():
+            MediaBlob.objects.exclude(references=0).update(references=0)
+            by_count = {}
+            for name, count in references.items():
+                by_count.setdefault(count, []).append(name)
+            for count, names in by_count.items():
+                for start in range(0, len(names), 1000):
+                    MediaBlob.objects.filter(name__in=names[start:start + 1000]).update(references=count)
+
+        self.stdout.write(f'Ссылки пересчитаны: файлов в использовании {len(references)}')
+
+    @transaction.atomic
+    def delete_blobs(self, batch, cutoff):
+        """Удаляет файлы пакета, если на них по-прежнему нет ссылок"""
+        # Повторная проверка под блокировкой: файл могли загрузить заново, пока шел обход
+        names = list(
+            MediaBlob.objects.select_for_update()
+            .filter(id__in=[blob_id for blob_id, name, size in batch], references__lte=0, updated_at__lt=cutoff)
+            .values_list('name', flat=True)
+        )
+        for name in names:
+            self.delete_file(name)
+        MediaBlob.objects.filter(name__in=names).delete()
+
+    def delete_file(self, name):
+        """Удаляет оригинал, все его уменьшенные копии и сведения о них"""
+        self.storage.delete(manifest_name(name))
+        for key in rendition_keys():
+            self.storage.delete(rendition_name(name, *key))
+        self.storage.delete(name)
+
+    def iter_content_files(self, path=CONTENT_ROOT):
+        """Обходит каталоги хранилища и возвращает имена оригиналов (без копий)"""
+        if not self.storage.exists(path):
+            return
+        directories, files = self.storage.listdir(path)
+        for directory in directories:
+            yield from self.iter_content_files(posixpath.join(path, directory))
+        for file in files:
+            name = posixpath.join(path, file)
+            if is_content_name(name):
+                yield name
+
+    def delete_stray_files(self, names, cutoff):
+        """Удаляет старые файлы, для которых нет записи MediaBlob (например, после прерванной загрузки)"""
+        known = set()
+        names = sorted(names)
+        for start in range(0, len(names), 1000):
+            known.update(MediaBlob.objects.filter(name__in=names[start:start + 1000]).values_list('name', flat=True))
+
+        strays = [
+            name for name in names
+            if name not in known and self.storage.get_modified_time(name) < cutoff
+        ]
+        if not self.dry_run:
+            for name in strays:
+                self.delete_file(name)
+        return len(strays)
@@ -0,0 +1,82 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from voentorg.exports import DEFAULT_CHUNK_SIZE, iter_orders_csv
+from voentorg.models import ArchivedOrder, Order
+
+
+class Command(BaseCommand):
+    help = (
+        'Потоковая выгрузка заказов с позициями в CSV. Заказы, перенесенные archive_orders в архив, '
+        'выгружаются только с --include-archived'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--output',
+            '-o',
+            default='-',
+            help='Файл для выгрузки (по умолчанию стандартный вывод)',
+        )
+        parser.add_argument(
+            '--since',
+            type=date.fromisoformat,
+            help='Выгружать заказы, созданные начиная с даты (ГГГГ-ММ-ДД)',
+        )
+        parser.add_argument(
+            '--until',
+            type=date.fromisoformat,
+            help='Выгружать заказы, созданные до даты включительно (ГГГГ-ММ-ДД)',
+        )
+        parser.add_argument(
+            '--status',
+            action='append',
+            help='Код статуса заказа (можно указать несколько раз)',
+        )
+        parser.add_argument(
+            '--include-archived',
+            action='store_true',
+            help='Добавить архивные заказы (перед текущими)',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=DEFAULT_CHUNK_SIZE,
+            help='Количество строк, читаемых из БД за один раз',
+        )
+        parser.add_argument(
+            '--delimiter',
+            default=',',
+            help='Разделитель колонок CSV',
+        )
+
+    def handle(self, *args, **options):
+        if options['chunk_size'] <= 0:
+            raise CommandError('Размер порции должен быть положительным')
+
+        sources = [ArchivedOrder, Order] if options['include_archived'] else [Order]
+        order_sets = []
+        for model in sources:
+            orders = model.objects.all()
+            if options['since']:
+                orders = orders.filter(created_at__date__gte=options['since'])
+            if options['until']:
+                orders = orders.filter(created_at__date__lte=options['until'])
+            if options['status']:
+                orders = orders.filter(status__code__in=options['status'])
+            order_sets.append(orders)
+
+        chunks = iter_orders_csv(*order_sets, chunk_size=options['chunk_size'], delimiter=options['delimiter'])
+
+        if options['output'] == '-':
+            for chunk in chunks:
+                self.stdout.write(chunk, ending='')
+            return
+
+        rows = 0
+        with open(options['output'], 'w', encoding='utf-8', newline='') as output:
+            for chunk in chunks:
+                output.write(chunk)
+                rows += 1
+
+        self.stdout.write(self.style.SUCCESS(f'Выгружено строк: {rows - 1} в {options["output"]}'))
@@ -0,0 +1,146 @@
+import time
+from datetime import timedelta
+
+import numpy as np
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from voentorg.models import Product, DailySales, ReorderSuggestion
+
+
+def smoothed_demand(product_index, days, quantities, first_days, end, alpha, size):
+    """
+    Экспоненциально сглаженный дневной спрос для всех товаров за один векторный проход.
+
+    Рекурсия s_t = alpha * x_t + (1 - alpha) * s_(t-1) при s = 0 до начала истории
+    разворачивается в сумму alpha * (1 - alpha)^(end - 1 - t) * x_t, поэтому достаточно
+    взвесить каждую продажу и сложить веса по товарам через bincount. Деление на
+    1 - (1 - alpha)^n убирает смещение к нулю у товаров с короткой историей.
+    """
+    decay = 1.0 - alpha
+    weights = alpha * np.power(decay, (end - 1 - days).astype(np.float64))
+    demand = np.bincount(product_index, weights=quantities * weights, minlength=size)
+
+    history = np.maximum(end - first_days, 1).astype(np.float64)
+    return demand / (1.0 - np.power(decay, history))
+
+
+class Command(BaseCommand):
+    help = 'Прогнозирует спрос по дневным продажам и формирует рекомендации по дозаказу'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--history-days',
+            type=int,
+            default=730,
+            help='Глубина истории продаж в днях',
+        )
+        parser.add_argument(
+            '--alpha',
+            type=float,
+            default=0.1,
+            help='Коэффициент экспоненциального сглаживания (0 < alpha <= 1)',
+        )
+        parser.add_argument(
+            '--lead-time',
+            type=int,
+            default=14,
+            help='Срок поставки в днях: товары, которых хватит на меньший срок, попадают в рекомендации',
+        )
+        parser.add_argument(
+            '--cover-days',
+            type=int,
+            default=30,
+            help='На сколько дней после поставки должен быть запас',
+        )
+        parser.add_argument(
+            '--skip-rollups',
+            action='store_true',
+            help='Не обновлять дневные агрегаты продаж перед расчетом',
+        )
+
+    def handle(self, *args, **options):
+        alpha = options['alpha']
+        history_days = options['history_days']
+        lead_time = options['lead_time']
+        cover_days = options['cover_days']
+        if not 0 < alpha <= 1:
+            raise CommandError('Коэффициент сглаживания должен быть в интервале (0, 1]')
+        if history_days <= 0 or lead_time < 0 or cover_days < 0:
+            raise CommandError('Некорректные параметры периода')
+
+        if not options['skip_rollups']:
+            call_command('update_sales_rollups', stdout=self.stdout)
+
+        started = time.perf_counter()
+        end = timezone.localdate().toordinal() + 1
+        start = end - history_days
+
+        # Товары: id, остаток и первый день, с которого товар мог продаваться
+        products = list(Product.objects.order_by('id').values_list('id', 'stock', 'created_at'))
+        count = len(products)
+        if not count:
+            self.stdout.write(self.style.WARNING('Товаров нет, расчет не выполнялся'))
+            return
+        product_ids = np.fromiter((row[0] for row in products), dtype=np.int64, count=count)
+        stock = np.fromiter((row[1] for row in products), dtype=np.float64, count=count)
+        created_days = np.fromiter(
+            (timezone.localtime(row[2]).date().toordinal() for row in products), dtype=np.int64, count=count
+        )
+        first_days = np.clip(created_days, start, end - 1)
+
+        sales = list(
+            DailySales.objects.filter(date__gte=timezone.localdate() - timedelta(days=history_days - 1))
+            .order_by()
+            .values_list('product_id', 'date', 'quantity')
+        )
+        sales_products = np.fromiter((row[0] for row in sales), dtype=np.int64, count=len(sales))
+        sales_days = np.fromiter((row[1].toordinal() for row in sales), dtype=np.int64, count=len(sales))
+        sales_quantities = np.fromiter((row[2] for row in sales), dtype=np.float64, count=len(sales))
+        loaded = time.perf_counter()
+
+        # Сопоставляем продажи с позициями в массиве товаров (product_ids отсортированы)
+        product_index = np.searchsorted(product_ids, sales_products)
+        known = (product_index < count) & (product_ids[np.minimum(product_index, count - 1)] == sales_products)
+        # Товар мог продаваться до даты добавления в каталог (например, после импорта)
+        np.minimum.at(first_days, product_index[known], sales_days[known])
+
+        demand = smoothed_demand(
+            product_index[known], sales_days[known], sales_quantities[known], first_days, end, alpha, count
+        )
+        with np.errstate(divide='ignore', invalid='ignore'):
+            days_of_cover = np.where(demand > 0, stock / demand, np.inf)
+        target = demand * (lead_time + cover_days)
+        suggested = np.ceil(np.maximum(target - stock, 0))
+        needs_reorder = (days_of_cover < lead_time) & (suggested > 0)
+        computed = time.perf_counter()
+
+        suggestions = [
+            ReorderSuggestion(
+                product_id=int(product_ids[index]),
+                stock=int(stock[index]),
+                daily_demand=round(float(demand[index]), 4),
+                days_of_cover=round(float(days_of_cover[index]), 1),
+                suggested_quantity=int(suggested[index]),
+            )
+            for index in np.flatnonzero(needs_reorder)[np.argsort(days_of_cover[needs_reorder], kind='stable')]
+        ]
+        with transaction.atomic():
+            ReorderSuggestion.objects.all().delete()
+            ReorderSuggestion.objects.bulk_create(suggestions, batch_size=1000)
+
+        self.stdout.write(
+            f'Товаров: {count}, дневных записей продаж: {len(sales)}. '
+            f'Загрузка: {(loaded - started) * 1000:.0f} мс, расчет: {(computed - loaded) * 1000:.1f} мс'
+        )
+        self.stdout.write(self.style.SUCCESS(f'Рекомендаций по дозаказу: {len(suggestions)}'))
+
+        for suggestion in suggestions[:10]:
+            self.stdout.write(
+                f'  Товар #{suggestion.product_id}: остаток {suggestion.stock}, '
+                f'спрос {suggestion.daily_demand:.2f} шт./день, хватит на {suggestion.days_of_cover} дн., '
+                f'заказать {suggestion.suggested_quantity} шт.'
+            )
+        if len(suggestions) > 10:
+            self.stdout.write(f'  ... и еще {len(suggestions) - 10} (см. раздел админки «Рекомендации по дозаказу»)')
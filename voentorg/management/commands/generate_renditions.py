@@ -0,0 +1,58 @@
+import time
+from itertools import chain
+
+from django.core.management.base import BaseCommand
+from voentorg.models import Product, ProductImage
+from voentorg.renditions import generate_renditions, generate_placeholder
+
+
+class Command(BaseCommand):
+    help = (
+        'Создает уменьшенные копии (JPEG и WebP) для уже загруженных изображений товаров '
+        'и заполняет заглушки изображений'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Пересоздать копии и заглушки, даже если они уже существуют',
+        )
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        images = 0
+        files = 0
+        placeholders = 0
+        errors = 0
+
+        field_files = chain(
+            (image.image for image in ProductImage.objects.exclude(image='').only('id', 'image', 'placeholder').iterator()),
+            (product.image for product in Product.objects.exclude(image='').exclude(image=None).only('id', 'image').iterator()),
+        )
+        pending = []
+        for field_file in field_files:
+            try:
+                files += generate_renditions(field_file, force=options['force'])
+                images += 1
+
+                instance = field_file.instance
+                if isinstance(instance, ProductImage) and (options['force'] or not instance.placeholder):
+                    instance.placeholder, instance.dominant_color = generate_placeholder(field_file)
+                    pending.append(instance)
+            except Exception as e:
+                errors += 1
+                self.stdout.write(self.style.WARNING(f'  Ошибка при обработке {field_file.name}: {e}'))
+
+            if len(pending) >= 500:
+                ProductImage.objects.bulk_update(pending, ['placeholder', 'dominant_color'])
+                placeholders += len(pending)
+                pending = []
+
+        ProductImage.objects.bulk_update(pending, ['placeholder', 'dominant_color'])
+        placeholders += len(pending)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Обработано изображений: {images}, создано файлов: {files}, заглушек: {placeholders}, '
+            f'ошибок: {errors} за {time.perf_counter() - started:.1f} с'
+        ))
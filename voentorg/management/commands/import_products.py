@@ -0,0 +1,187 @@
+import os
+import time
+import uuid
+from decimal import Decimal, InvalidOperation
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils.text import slugify
+from voentorg.feeds import read_records, batched, parse_bool
+from voentorg.models import Category, Product, StockMovement
+from voentorg.signals import products_changed
+
+
+class Command(BaseCommand):
+    help = (
+        'Массовый импорт товаров из CSV / JSON Lines с обновлением существующих по slug. '
+        'Колонки: name, price (обязательные), slug, category, stock, description, short_description, is_available'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path',
+            help='Путь к файлу .csv, .jsonl или .json',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Количество товаров, записываемых за одну транзакцию',
+        )
+        parser.add_argument(
+            '--create-categories',
+            action='store_true',
+            help='Создавать отсутствующие категории (иначе такие строки пропускаются)',
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        if batch_size <= 0:
+            raise CommandError('Размер пакета должен быть положительным')
+        if not os.path.exists(options['path']):
+            raise CommandError(f'Файл не найден: {options["path"]}')
+
+        self.create_categories = options['create_categories']
+        self.categories = {}
+        for category_id, slug, name in Category.objects.values_list('id', 'slug', 'name'):
+            self.categories[slug.lower()] = category_id
+            self.categories[name.lower()] = category_id
+
+        stats = {'created': 0, 'updated': 0, 'skipped': 0}
+        started = time.perf_counter()
+        processed = 0
+
+        for batch in batched(read_records(options['path']), batch_size):
+            batch_started = time.perf_counter()
+            self.import_batch(batch, stats)
+            processed += len(batch)
+
+            elapsed = time.perf_counter() - batch_started
+            self.stdout.write(
+                f'Обработано строк: {processed} '
+                f'({len(batch) / elapsed if elapsed else 0:.0f} строк/с в последнем пакете)'
+            )
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Импорт завершен за {elapsed:.1f} с ({processed / elapsed if elapsed else 0:.0f} строк/с). '
+            f'Создано: {stats["created"]}, обновлено: {stats["updated"]}, пропущено: {stats["skipped"]}'
+        ))
+
+    def resolve_category(self, value):
+        """Ищет категорию по slug или названию в кэше, при необходимости создает"""
+        if not value:
+            return None
+        key = str(value).strip().lower()
+        if key in self.categories:
+            return self.categories[key]
+        if not self.create_categories:
+            raise ValueError(f'категория "{value}" не найдена')
+
+        name = str(value).strip()
+        category = Category.objects.create(name=name, slug=slugify(name) or f'category-{uuid.uuid4().hex[:8]}')
+        self.categories[key] = category.id
+        self.categories[category.slug.lower()] = category.id
+        return category.id
+
+    def parse_record(self, record):
+        """Преобразует запись файла в словарь значений полей товара"""
+        name = (record.get('name') or '').strip()
+        if not name:
+            raise ValueError('не указано название')
+        try:
+            price = Decimal(str(record.get('price')).replace(',', '.'))
+        except InvalidOperation:
+            raise ValueError(f'некорректная цена "{record.get("price")}"')
+        if price < 0:
+            raise ValueError('цена не может быть отрицательной')
+
+        values = {
+            'name': name[:100],
+            'slug': (record.get('slug') or '').strip(),
+            'price': price,
+        }
+        if 'category' in record:
+            values['category_id'] = self.resolve_category(record['category'])
+        if 'stock' in record:
+            values['stock'] = int(record['stock'] or 0)
+            if values['stock'] < 0:
+                raise ValueError('остаток не может быть отрицательным')
+        if 'description' in record:
+            values['description'] = record['description'] or ''
+        if 'short_description' in record:
+            values['short_description'] = (record['short_description'] or '')[:300]
+        if 'is_available' in record:
+            values['is_available'] = parse_bool(record['is_available'])
+        return values
+
+    @transaction.atomic
+    def import_batch(self, batch, stats):
+        """Записывает пакет: новые товары вставляются, существующие (по slug) обновляются"""
+        rows = []
+        for record in batch:
+            try:
+                rows.append(self.parse_record(record))
+            except (ValueError, TypeError) as e:
+                stats['skipped'] += 1
+                self.stdout.write(self.style.WARNING(f'  Пропущена строка "{record.get("name", "")}": {e}'))
+
+        if not rows:
+            return
+
+        # Для строк с явным slug это upsert; для остальных подбираем свободный slug
+        explicit = [row['slug'] for row in rows if row['slug']]
+        # Строки существующих товаров блокируем до конца транзакции: оформленный между чтением
+        # и записью заказ исказил бы разницу остатка в журнале (как в sync_warehouse)
+        existing = dict(
+            Product.objects.select_for_update().filter(slug__in=explicit).values_list('slug', 'stock')
+        )
+        # Кириллическое название slugify сводит к пустой строке - как и для категорий, берем product-<uuid>
+        generated = Product.allocate_slugs(
+            [slugify(row['name']) or f'product-{uuid.uuid4().hex[:8]}' for row in rows if not row['slug']],
+            reserved=explicit,
+        )
+        generated = iter(generated)
+        for row in rows:
+            if not row['slug']:
+                row['slug'] = next(generated)
+
+        # Повторы одного slug внутри пакета: побеждает последняя строка
+        rows = list({row['slug']: row for row in rows}.values())
+
+        # Обновляются только поля, заданные во всех строках пакета, чтобы не затереть их значениями по умолчанию
+        update_fields = sorted(set.intersection(*(set(row) for row in rows)) - {'slug'})
+        Product.objects.bulk_create(
+            [Product(**row) for row in rows],
+            update_conflicts=True,
+            unique_fields=['slug'],
+            update_fields=update_fields,
+        )
+
+        created = sum(1 for row in rows if row['slug'] not in existing)
+        stats['created'] += created
+        stats['updated'] += len(rows) - created
+
+        # Изменения остатков фиксируем в журнале движения товара
+        changes = {}
+        for row in rows:
+            is_new = row['slug'] not in existing
+            if 'stock' in row and (is_new or 'stock' in update_fields):
+                change = row['stock'] - existing.get(row['slug'], 0)
+                if change:
+                    changes[row['slug']] = change
+
+        product_ids = dict(Product.objects.filter(slug__in=[row['slug'] for row in rows]).values_list('slug', 'id'))
+        if changes:
+            StockMovement.objects.bulk_create([
+                StockMovement(
+                    product_id=product_ids[slug],
+                    change=change,
+                    reason=StockMovement.REASON_IMPORT,
+                    note='import_products'
+                )
+                for slug, change in changes.items()
+            ])
+
+        ids = list(product_ids.values())
+        transaction.on_commit(lambda: products_changed.send(sender=Product, product_ids=ids))
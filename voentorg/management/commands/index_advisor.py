@@ -0,0 +1,82 @@
+from django.core.management.base import BaseCommand
+from django.db import NotSupportedError
+from voentorg.models import SlowQuery
+from voentorg.slow_queries import advise_indexes, index_definition, measure_index
+
+
+class Command(BaseCommand):
+    help = (
+        'Сводит медленные запросы (SlowQuery) по отпечаткам и предлагает составные и частичные индексы, '
+        'которых еще нет в базе, с оценкой выигрыша'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--min-time',
+            type=float,
+            default=0.0,
+            help='Учитывать отпечатки с суммарным временем не меньше заданного (мс)',
+        )
+        parser.add_argument(
+            '--limit',
+            type=int,
+            default=10,
+            help='Сколько предложений вывести',
+        )
+        parser.add_argument(
+            '--measure',
+            action='store_true',
+            help='Замерить самый медленный запрос до и после создания индекса (в откатываемой транзакции)',
+        )
+        parser.add_argument(
+            '--runs',
+            type=int,
+            default=5,
+            help='Число повторов запроса при замере (берется медиана)',
+        )
+        parser.add_argument(
+            '--reset',
+            action='store_true',
+            help='Очистить записанные медленные запросы после отчета',
+        )
+
+    def handle(self, *args, **options):
+        entries = SlowQuery.objects.filter(total_time_ms__gte=options['min_time'])
+        self.stdout.write(f'Медленных отпечатков: {entries.count()}')
+        proposals = advise_indexes(entries)
+        if not proposals:
+            self.stdout.write(self.style.SUCCESS('Новых индексов не требуется'))
+
+        for number, proposal in enumerate(proposals[:options['limit']], 1):
+            signs = [
+                sign for flag, sign in ((proposal['full_scan'], 'полный просмотр таблицы'),
+                                        (proposal['temp_sort'], 'сортировка без индекса'))
+                if flag
+            ]
+            self.stdout.write(self.style.WARNING(
+                f'{number}. {proposal["model"]._meta.label}: {index_definition(proposal)}'
+            ))
+            self.stdout.write(
+                f'   запросов: {len(proposal["queries"])}, вызовов: {proposal["calls"]}, '
+                f'суммарно {proposal["total_time_ms"]:.1f} мс (верхняя граница выигрыша)'
+                + (f'; в плане: {", ".join(signs)}' if signs else '')
+            )
+            for entry in proposal['queries'][:3]:
+                self.stdout.write(f'   - [{entry.view_name or "?"}] {entry.fingerprint[:160]}')
+            if options['measure']:
+                self.measure(proposal, options['runs'])
+
+        if options['reset']:
+            deleted, _ = SlowQuery.objects.all().delete()
+            self.stdout.write(self.style.SUCCESS(f'Удалено записей о медленных запросах: {deleted}'))
+
+    def measure(self, proposal, runs):
+        try:
+            before, after, plan = measure_index(proposal, runs)
+        except NotSupportedError as error:
+            self.stdout.write(self.style.ERROR(f'   замер невозможен: {error}'))
+            return
+        speedup = before / after if after else float('inf')
+        self.stdout.write(self.style.SUCCESS(
+            f'   замер: {before:.2f} мс -> {after:.2f} мс (x{speedup:.1f}), план: {plan.replace(chr(10), "; ")}'
+        ))
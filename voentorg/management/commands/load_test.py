@@ -0,0 +1,391 @@
+import json
+import random
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from http.cookiejar import CookieJar
+from urllib.error import HTTPError, URLError
+from urllib.parse import urlencode, urlsplit
+from urllib.request import HTTPCookieProcessor, HTTPRedirectHandler, Request, build_opener
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import F, Max, Sum
+from voentorg.benchmarks import GUEST_ORDER_FORM, USER_ORDER_FORM, percentile
+from voentorg.ledger import ledger_stock_queryset
+from voentorg.models import CartItem, CustomUser, Order, OrderItem, Product, StockMovement
+
+LOAD_TEST_PASSWORD = 'load-test-password-1'
+# Границы корзин гистограммы задержек, мс
+HISTOGRAM_BUCKETS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+HISTOGRAM_WIDTH = 40
+
+
+class NoRedirectHandler(HTTPRedirectHandler):
+    """Не следовать редиректам: по адресу редиректа определяется результат оформления заказа"""
+
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class VirtualShopper:
+    """Покупатель со своей сессией (cookies), проходящий сценарий покупки через HTTP"""
+
+    def __init__(self, index, base_url, options, products, search_terms):
+        self.index = index
+        self.base_url = base_url
+        self.timeout = options['timeout']
+        self.think_time = options['think_time']
+        self.guest_ratio = options['guest_ratio']
+        self.products = products
+        self.hot_products = products[:options['hot_products']]
+        self.search_terms = search_terms
+        self.email = f'loadtest_{index}@example.com'
+        self.rng = random.Random(f'{options["seed"]}:shopper:{index}')
+        self.cookies = CookieJar()
+        self.opener = build_opener(HTTPCookieProcessor(self.cookies), NoRedirectHandler)
+        # (шаг, длительность в секундах, код ответа или None, ошибка)
+        self.records = []
+        self.outcomes = Counter()
+
+    def csrf_token(self):
+        for cookie in self.cookies:
+            if cookie.name == 'csrftoken':
+                return cookie.value
+        return ''
+
+    def request(self, step, path, data=None):
+        """Выполняет запрос и записывает замер; возвращает (код, заголовки, тело) или None при сетевой ошибке"""
+        headers = {'Referer': self.base_url + '/'}
+        body = None
+        if data is not None:
+            body = urlencode(data).encode('utf-8')
+            headers['X-CSRFToken'] = self.csrf_token()
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        request = Request(self.base_url + path, data=body, headers=headers)
+
+        started = time.perf_counter()
+        try:
+            with self.opener.open(request, timeout=self.timeout) as response:
+                result = response.status, response.headers, response.read()
+        except HTTPError as error:
+            # Редиректы тоже приходят сюда, так как NoRedirectHandler их не выполняет
+            result = error.code, error.headers, error.read()
+        except (URLError, OSError) as error:
+            self.records.append((step, time.perf_counter() - started, None, str(error)))
+            return None
+        status = result[0]
+        self.records.append((step, time.perf_counter() - started, status, f'HTTP {status}' if status >= 400 else ''))
+        return result
+
+    def redirect_path(self, result):
+        return urlsplit(result[1].get('Location', '')).path if result else ''
+
+    def pause(self):
+        if self.think_time:
+            time.sleep(self.rng.uniform(0, self.think_time * 2))
+
+    def journey(self):
+        """Просмотр -> поиск -> корзина -> вход и объединение корзин -> оформление заказа"""
+        self.request('home', '/')
+        self.pause()
+        self.request('catalog', '/catalog/')
+        for product_id in self.rng.sample(self.products, min(2, len(self.products))):
+            self.pause()
+            self.request('product_detail', f'/product/{product_id}/')
+        self.pause()
+        self.request('search', '/search/?' + urlencode({'q': self.rng.choice(self.search_terms)}))
+
+        # Популярные товары разбирают все покупатели одновременно - здесь проявляются гонки за остаток
+        added = 0
+        for product_id in self.rng.sample(self.hot_products, self.rng.randint(1, min(3, len(self.hot_products)))):
+            self.pause()
+            result = self.request('ajax_add_to_cart', f'/cart/ajax_add/{product_id}/', {})
+            if result and result[0] == 200 and json.loads(result[2]).get('success'):
+                added += 1
+            else:
+                self.outcomes['add_rejected'] += 1
+        if not added:
+            self.outcomes['journey_without_cart'] += 1
+            return
+
+        self.pause()
+        if self.rng.random() < self.guest_ratio:
+            result = self.request('guest_checkout', '/order/guest/', GUEST_ORDER_FORM)
+            placed = self.redirect_path(result) == '/'
+        else:
+            result = self.request('login', '/login/', {'username': self.email, 'password': LOAD_TEST_PASSWORD})
+            if self.redirect_path(result) in ('', '/login/'):
+                self.outcomes['login_failed'] += 1
+                return
+            self.request('checkout_form', '/order/create/')
+            self.pause()
+            result = self.request('process_user_order', '/order/create/', USER_ORDER_FORM)
+            placed = self.redirect_path(result) == '/profile/'
+            self.request('logout', '/logout/', {})
+        self.outcomes['orders_placed' if placed else 'checkout_rejected'] += 1
+
+    def run(self, journeys, deadline):
+        completed = 0
+        while (not journeys or completed < journeys) and (not deadline or time.monotonic() < deadline):
+            self.journey()
+            completed += 1
+        self.outcomes['journeys'] += completed
+        return self
+
+
+class Command(BaseCommand):
+    help = (
+        'Нагрузочный тест: N параллельных покупателей проходят сценарий просмотр -> поиск -> корзина -> '
+        'вход -> заказ на запущенном сервере. Выводит пропускную способность, гистограммы задержек, '
+        'долю ошибок и проверяет остатки (перепродажу) по базе. '
+        'Сервер должен работать с той же базой данных, например: python manage.py runserver --noreload'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--url',
+            default='http://127.0.0.1:8000',
+            help='Адрес запущенного сервера',
+        )
+        parser.add_argument(
+            '--shoppers',
+            type=int,
+            default=10,
+            help='Число одновременных покупателей (потоков)',
+        )
+        parser.add_argument(
+            '--journeys',
+            type=int,
+            default=5,
+            help='Сценариев на покупателя (0 - без ограничения, до --duration)',
+        )
+        parser.add_argument(
+            '--duration',
+            type=float,
+            default=0,
+            help='Ограничение по времени в секундах (0 - без ограничения)',
+        )
+        parser.add_argument(
+            '--think-time',
+            type=float,
+            default=0,
+            help='Средняя пауза между шагами покупателя в секундах',
+        )
+        parser.add_argument(
+            '--guest-ratio',
+            type=float,
+            default=0.3,
+            help='Доля сценариев с оформлением заказа гостем',
+        )
+        parser.add_argument(
+            '--hot-products',
+            type=int,
+            default=5,
+            help='Число популярных товаров, которые покупатели кладут в корзину',
+        )
+        parser.add_argument(
+            '--hot-stock',
+            type=int,
+            help='Установить остаток популярных товаров перед тестом (движением в журнале)',
+        )
+        parser.add_argument(
+            '--timeout',
+            type=float,
+            default=30,
+            help='Таймаут одного запроса в секундах',
+        )
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=42,
+            help='Начальное значение генератора сценариев',
+        )
+
+    def handle(self, *args, **options):
+        if options['shoppers'] <= 0 or options['hot_products'] <= 0:
+            raise CommandError('Число покупателей и популярных товаров должно быть положительным')
+        if not options['journeys'] and not options['duration']:
+            raise CommandError('Укажите --journeys или --duration')
+        base_url = options['url'].rstrip('/')
+
+        self.check_server(base_url, options['timeout'])
+        products, search_terms = self.prepare_products(options)
+        self.prepare_users(options['shoppers'])
+        state = self.snapshot_state(products[:options['hot_products']])
+
+        self.stdout.write(
+            f'Покупателей: {options["shoppers"]}, популярных товаров: {options["hot_products"]}, '
+            f'сервер: {base_url}'
+        )
+        shoppers = [
+            VirtualShopper(index, base_url, options, products, search_terms)
+            for index in range(options['shoppers'])
+        ]
+        deadline = time.monotonic() + options['duration'] if options['duration'] else None
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=len(shoppers)) as executor:
+            list(executor.map(lambda shopper: shopper.run(options['journeys'], deadline), shoppers))
+        elapsed = time.perf_counter() - started
+
+        records = [record for shopper in shoppers for record in shopper.records]
+        outcomes = sum((shopper.outcomes for shopper in shoppers), Counter())
+        self.report(records, outcomes, elapsed)
+        violations = self.check_invariants(state, outcomes)
+        if violations:
+            raise CommandError(f'Нарушений инвариантов: {violations}')
+
+    def check_server(self, base_url, timeout):
+        try:
+            build_opener().open(base_url + '/', timeout=timeout).close()
+        except (URLError, OSError) as error:
+            raise CommandError(
+                f'Сервер {base_url} недоступен ({error}). Запустите его с той же базой данных, '
+                f'например: python manage.py runserver --noreload'
+            )
+
+    def prepare_products(self, options):
+        """Товары для просмотра и популярные товары (первые в списке), детерминированно по seed"""
+        rng = random.Random(f'{options["seed"]}:load_test')
+        available = list(
+            Product.objects.available().filter(stock__gt=0).order_by('id').values_list('id', 'name')
+        )
+        if len(available) < options['hot_products']:
+            raise CommandError('Недостаточно доступных товаров, заполните базу: python manage.py populate_db')
+        sample = rng.sample(available, min(len(available), 200))
+        products = [product_id for product_id, name in sample]
+
+        if options['hot_stock'] is not None:
+            for product in Product.objects.filter(id__in=products[:options['hot_products']]):
+                change = options['hot_stock'] - product.stock
+                if change:
+                    product.change_stock(change, StockMovement.REASON_ADJUSTMENT, note='load_test')
+
+        search_terms = sorted({name.split()[0] for product_id, name in sample})
+        return products, search_terms
+
+    def prepare_users(self, count):
+        """Учетные записи покупателей loadtest_<номер> с общим паролем"""
+        password = make_password(LOAD_TEST_PASSWORD)
+        for index in range(count):
+            user, created = CustomUser.objects.get_or_create(
+                username=f'loadtest_{index}',
+                defaults={'email': f'loadtest_{index}@example.com', 'password': password}
+            )
+            # Корзина с прошлого запуска исказила бы результаты оформления
+            if not created:
+                CartItem.objects.filter(cart__user=user).delete()
+
+    def snapshot_state(self, hot_products):
+        """Состояние базы до теста: остатки популярных товаров и последние идентификаторы"""
+        return {
+            'products': hot_products,
+            'stock': dict(Product.objects.filter(id__in=hot_products).values_list('id', 'stock')),
+            'last_order': Order.objects.aggregate(last=Max('id'))['last'] or 0,
+            'last_movement': StockMovement.objects.aggregate(last=Max('id'))['last'] or 0,
+        }
+
+    def report(self, records, outcomes, elapsed):
+        by_step = defaultdict(list)
+        for step, duration, status, error in records:
+            by_step[step].append((duration, error))
+
+        errors = sum(1 for record in records if record[3])
+        self.stdout.write(
+            f'\nЗапросов: {len(records)} за {elapsed:.1f} с, {len(records) / elapsed:.1f} запросов/с, '
+            f'сценариев: {outcomes["journeys"]} ({outcomes["journeys"] / elapsed:.2f}/с), '
+            f'ошибок: {errors} ({errors / max(len(records), 1):.1%})'
+        )
+        self.stdout.write(
+            f'Заказов оформлено: {outcomes["orders_placed"]}, отклонено: {outcomes["checkout_rejected"]}, '
+            f'отказов при добавлении в корзину: {outcomes["add_rejected"]}, '
+            f'неудачных входов: {outcomes["login_failed"]}'
+        )
+
+        self.stdout.write(f'\n{"шаг":<20} {"запросов":>8} {"ошибок":>7} {"p50":>8} {"p95":>8} {"p99":>8} {"max":>8}')
+        for step, values in by_step.items():
+            durations = sorted(duration * 1000 for duration, error in values)
+            step_errors = sum(1 for duration, error in values if error)
+            self.stdout.write(
+                f'{step:<20} {len(values):>8} {step_errors:>7} {percentile(durations, 50):>8.1f} '
+                f'{percentile(durations, 95):>8.1f} {percentile(durations, 99):>8.1f} {durations[-1]:>8.1f}'
+            )
+
+        self.stdout.write('\nГистограмма задержек, мс:')
+        histogram = Counter()
+        for step, duration, status, error in records:
+            milliseconds = duration * 1000
+            bucket = next((bound for bound in HISTOGRAM_BUCKETS if milliseconds <= bound), None)
+            histogram[bucket] += 1
+        largest = max(histogram.values(), default=1)
+        lower = 0
+        for bound in HISTOGRAM_BUCKETS + (None,):
+            count = histogram.get(bound, 0)
+            label = f'{lower}-{bound}' if bound else f'>{lower}'
+            self.stdout.write(f'{label:>12} {count:>7} {"#" * round(count / largest * HISTOGRAM_WIDTH)}')
+            lower = bound
+
+        error_kinds = Counter(f'{step}: {error}' for step, duration, status, error in records if error)
+        for kind, count in error_kinds.most_common(10):
+            self.stdout.write(self.style.WARNING(f'  {count} x {kind}'))
+
+    def check_invariants(self, state, outcomes):
+        """Проверяет по базе, что параллельные заказы не привели к перепродаже и расхождениям"""
+        self.stdout.write('\nПроверка инвариантов:')
+        violations = 0
+
+        def check(ok, message):
+            nonlocal violations
+            if ok:
+                self.stdout.write(self.style.SUCCESS(f'  OK: {message}'))
+            else:
+                violations += 1
+                self.stdout.write(self.style.ERROR(f'  НАРУШЕНО: {message}'))
+
+        negative = list(Product.objects.filter(stock__lt=0).values_list('id', 'stock'))
+        check(not negative, f'нет товаров с отрицательным остатком {negative or ""}')
+
+        new_orders = Order.objects.filter(id__gt=state['last_order'])
+        new_items = OrderItem.objects.filter(order__in=new_orders)
+        ordered = dict(
+            new_items.filter(product__in=state['products']).values('product')
+            .annotate(total=Sum('quantity')).values_list('product', 'total')
+        )
+        stock_after = dict(Product.objects.filter(id__in=state['products']).values_list('id', 'stock'))
+        oversold = {
+            product_id: (state['stock'][product_id], ordered.get(product_id, 0), stock_after[product_id])
+            for product_id in state['products']
+            if state['stock'][product_id] - ordered.get(product_id, 0) != stock_after[product_id]
+        }
+        check(not oversold, f'остаток до - заказано = остаток после для популярных товаров {oversold or ""}')
+
+        written_off = dict(
+            StockMovement.objects.filter(id__gt=state['last_movement'], reason=StockMovement.REASON_ORDER)
+            .values('product').annotate(total=Sum('change')).values_list('product', 'total')
+        )
+        ordered_all = dict(new_items.values('product').annotate(total=Sum('quantity')).values_list('product', 'total'))
+        unmatched = {
+            product_id: (quantity, -written_off.get(product_id, 0))
+            for product_id, quantity in ordered_all.items()
+            if quantity != -written_off.get(product_id, 0)
+        }
+        check(not unmatched, f'каждая позиция заказа списана со склада {unmatched or ""}')
+
+        drift = list(
+            ledger_stock_queryset(Product.objects.filter(id__in=state['products']))
+            .exclude(stock=F('snapshot_stock') + F('movements_total')).values_list('id', flat=True)
+        )
+        check(not drift, f'остатки популярных товаров совпадают с журналом движения {drift or ""}')
+
+        mismatched_totals = [
+            order.id for order in new_orders.annotate(items_total=Sum('items__subtotal'))
+            if order.items_total is None or order.items_total != order.total_amount
+        ]
+        check(not mismatched_totals, f'сумма заказа равна сумме позиций, пустых заказов нет {mismatched_totals or ""}')
+
+        check(
+            new_orders.count() == outcomes['orders_placed'],
+            f'заказов в базе ({new_orders.count()}) столько же, сколько успешных оформлений '
+            f'({outcomes["orders_placed"]})'
+        )
+        return violations
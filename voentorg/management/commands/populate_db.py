@@ -1,18 +1,46 @@
 import os
 import random
 import shutil
-from django.core.management.base import BaseCommand
-from django.core.files import File
-from django.core.files.images import ImageFile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.core.files.base import ContentFile
+from django.contrib.auth.hashers import make_password
 from django.conf import settings
-from voentorg.models import CustomUser, Category, Product, ProductImage, OrderStatus, Order, OrderItem, Cart, CartItem
+from django.db import transaction
+from django.utils import timezone
+from voentorg.feeds import batched
+from voentorg.models import (
+    CustomUser, Category, Product, ProductImage, OrderStatus, Order, OrderItem, Cart, CartItem, StockMovement,
+    ArchivedOrder, ArchivedOrderItem, GenerationProgress, MediaBlob
+)
+from voentorg.renditions import encode_source_image, save_renditions, manifest_name
 from django.utils.text import slugify
 from PIL import Image
-import io
+
+
+# Варианты исполнения для сгенерированных товаров
+SYNTHETIC_VARIANTS = ['олива', 'койот', 'черный', 'мультикам', 'пиксель', 'флектарн', 'хаки', 'серый']
+
+# Статусы сгенерированных заказов и их относительная частота
+SYNTHETIC_ORDER_STATUSES = {'new': 1, 'processing': 1, 'shipped': 1, 'delivered': 6, 'cancelled': 1}
+
+# Сгенерированные заказы занимают два года до этой даты: от текущего времени данные не зависят,
+# поэтому одинаковый --seed дает одинаковые заказы и при продолжении генерации на следующий день
+SYNTHETIC_ORDERS_UNTIL = date(2026, 1, 1)
+SYNTHETIC_ORDERS_PERIOD = timedelta(days=730)
 
 
 class Command(BaseCommand):
-    help = 'Заполняет базу данных начальными данными для приложения Военторг'
+    help = (
+        'Заполняет базу данных начальными данными для приложения Военторг. '
+        'С --products/--users/--orders дополнительно генерирует воспроизводимый по --seed каталог; '
+        'прерванная генерация продолжается с последнего записанного пакета'
+    )
 
     def add_arguments(self, parser):
         parser.add_argument(
@@ -30,8 +58,67 @@ class Command(BaseCommand):
             action='store_true',
             help='Использовать заглушки даже если есть реальные изображения',
         )
+        parser.add_argument(
+            '--products',
+            type=int,
+            default=0,
+            help='Количество сгенерированных товаров сверх базового набора',
+        )
+        parser.add_argument(
+            '--users',
+            type=int,
+            default=0,
+            help='Количество сгенерированных покупателей',
+        )
+        parser.add_argument(
+            '--orders',
+            type=int,
+            default=0,
+            help='Количество сгенерированных заказов (остатки товаров при этом не списываются)',
+        )
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=0,
+            help='Зерно генератора: одинаковые параметры дают одинаковые данные',
+        )
+        parser.add_argument(
+            '--orders-until',
+            type=date.fromisoformat,
+            default=SYNTHETIC_ORDERS_UNTIL,
+            help=(
+                'Дата (ГГГГ-ММ-ДД), которой заканчиваются сгенерированные заказы '
+                f'(по умолчанию {SYNTHETIC_ORDERS_UNTIL}); при продолжении генерации должна совпадать'
+            ),
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Количество записей в одной транзакции; после каждой сохраняется отметка прогресса',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=os.cpu_count() or 1,
+            help='Количество процессов для кодирования изображений',
+        )
 
     def handle(self, *args, **options):
+        for option in ('products', 'users', 'orders', 'seed'):
+            if options[option] < 0:
+                raise CommandError(f'Значение --{option} не может быть отрицательным')
+        if options['batch_size'] <= 0 or options['workers'] <= 0:
+            raise CommandError('Размер пакета и количество процессов должны быть положительными')
+
+        self.seed = options['seed']
+        self.batch_size = options['batch_size']
+        self.workers = options['workers']
+        # Закодированные исходные изображения: путь -> (JPEG, копии) или None при ошибке
+        self.encoded_images = {}
+        # Имена уже записанных в хранилище исходных изображений: путь -> имя файла
+        self.stored_images = {}
+
         if options['clear']:
             self.stdout.write('Очистка базы данных...')
 
@@ -39,6 +126,8 @@ class Command(BaseCommand):
             self.stdout.write('Удаление заказов...')
             OrderItem.objects.all().delete()
             Order.objects.all().delete()
+            ArchivedOrderItem.objects.all().delete()
+            ArchivedOrder.objects.all().delete()
 
             self.stdout.write('Удаление корзин...')
             CartItem.objects.all().delete()
@@ -59,11 +148,15 @@ class Command(BaseCommand):
             self.stdout.write('Удаление статусов заказов...')
             OrderStatus.objects.all().delete()
 
+            GenerationProgress.objects.all().delete()
+            MediaBlob.objects.all().delete()
+
             # Очищаем папку media/products
             self.clean_media_files()
 
             self.stdout.write(self.style.SUCCESS('База данных очищена'))
 
+        started = time.perf_counter()
         self.create_order_statuses()
         self.create_categories()
 
@@ -76,9 +169,24 @@ class Command(BaseCommand):
             skip_images=options['skip_images'],
             force_placeholders=options['force_placeholders']
         )
+        if options['products']:
+            self.create_synthetic_products(
+                options['products'],
+                source_images=source_images,
+                skip_images=options['skip_images'] or options['force_placeholders']
+            )
+
         self.create_test_users()
+        if options['users']:
+            self.create_synthetic_users(options['users'])
+        if options['orders']:
+            self.create_synthetic_orders(options['orders'], options['orders_until'])
+            call_command('update_popularity', stdout=self.stdout)
+            call_command('build_recommendations', stdout=self.stdout)
 
-        self.stdout.write(self.style.SUCCESS('База данных успешно заполнена!'))
+        self.stdout.write(self.style.SUCCESS(
+            f'База данных успешно заполнена за {time.perf_counter() - started:.1f} с!'
+        ))
 
     def clean_media_files(self):
         """Очищает папку media/products"""
@@ -196,73 +304,106 @@ class Command(BaseCommand):
 
         self.stdout.write('Созданы категории товаров')
 
-    def copy_image_to_product(self, source_path, product, is_main=False, display_order=0):
-        """
-        Копирует изображение в папку product и создает запись в БД
-        Возвращает True в случае успеха
-        """
-        try:
-            # Открываем изображение и проверяем его
-            with Image.open(source_path) as img:
-                # Конвертируем в RGB если нужно
-                if img.mode in ('RGBA', 'P'):
-                    rgb_img = Image.new('RGB', img.size, (255, 255, 255))
-                    rgb_img.paste(img, mask=img.split()[-1] if img.mode == 'RGBA' else None)
-                    img = rgb_img
-
-                # Сохраняем во временный буфер
-                img_io = io.BytesIO()
-                img.save(img_io, format='JPEG', quality=85)
-                img_io.seek(0)
-
-                # Определяем имя файла - с порядковым номером для гарантии порядка
-                filename = f"{slugify(product.name)}_{display_order}.jpg"
-
-                # Создаем Django File объект
-                django_file = File(img_io, name=filename)
-
-                if is_main:
-                    # Сохраняем основное изображение
-                    product.image.save(filename, django_file, save=False)
-                    product.save()
-
-                    # Также создаем запись в ProductImage для основного изображения
-                    # чтобы оно тоже было в product.images.all()
-                    img_obj = ProductImage.objects.create(
-                        product=product,
-                        image=django_file,
-                        is_main=True,
-                        display_order=0  # Основное всегда с порядком 0
-                    )
-                    save_path = str(img_obj.image)
+    def encode_images(self, paths):
+        """Кодирует еще не обработанные исходные изображения параллельно в нескольких процессах"""
+        paths = sorted(path for path in paths if path not in self.encoded_images)
+        if not paths:
+            return
+
+        started = time.perf_counter()
+        workers = min(self.workers, len(paths))
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {path: executor.submit(encode_source_image, path) for path in paths}
+            for path, future in futures.items():
+                try:
+                    self.encoded_images[path] = future.result()
+                except Exception as e:
+                    self.encoded_images[path] = None
                     self.stdout.write(
-                        self.style.SUCCESS(f'  Основное изображение сохранено: {save_path}')
-                    )
-                else:
-                    # Создаем дополнительное изображение
-                    img_obj = ProductImage.objects.create(
-                        product=product,
-                        image=django_file,
-                        is_main=False,
-                        display_order=display_order
+                        self.style.WARNING(f'  Ошибка при обработке {path}: {str(e)}')
                     )
-                    save_path = str(img_obj.image)
-                    self.stdout.write(
-                        self.style.SUCCESS(f'  Доп.изображение {display_order} сохранено: {save_path}')
-                    )
-                return True
 
-        except Exception as e:
-            self.stdout.write(
-                self.style.WARNING(f'  Ошибка при обработке {source_path}: {str(e)}')
-            )
-            return False
+        self.stdout.write(
+            f'Закодировано исходных изображений: {len(paths)} за {time.perf_counter() - started:.1f} с '
+            f'(процессов: {workers})'
+        )
 
-    def create_products(self, source_images=None, skip_images=False, force_placeholders=False):
-        """Создание товаров с реальными изображениями из source_images"""
-        if source_images is None:
-            source_images = {}
+    def store_image(self, field, filename, path):
+        """Сохраняет закодированное исходное изображение и его копии, возвращает имя файла в хранилище"""
+        # Хранилище адресует файлы по содержимому, поэтому каждый исходник достаточно записать один раз
+        if path not in self.stored_images:
+            content, renditions = self.encoded_images[path][:2]
+            storage = field.storage
+            name = storage.save(field.generate_filename(None, filename), ContentFile(content))
+            # Если такой файл уже был в хранилище, копии к нему тоже есть
+            if not storage.exists(manifest_name(name)):
+                save_renditions(storage, name, renditions)
+            self.stored_images[path] = name
+        return self.stored_images[path]
+
+    def insert_products(self, specs):
+        """
+        Записывает пакет товаров: файлы изображений, товары, галереи и начальные остатки.
+        specs - пары (несохраненный товар, пути исходных изображений).
+        Возвращает количество сохраненных изображений каждого товара.
+        """
+        self.encode_images({path for product, paths in specs for path in paths})
+
+        products = []
+        gallery = []
+        for product, paths in specs:
+            paths = [path for path in paths if self.encoded_images.get(path)]
+            prefix = product.slug or 'product'
+            if paths:
+                # Основное изображение хранится и в товаре, и первым в галерее
+                product.image = self.store_image(Product.image.field, f'{prefix}_0.jpg', paths[0])
+            products.append(product)
+            gallery.append([
+                (self.store_image(ProductImage.image.field, f'{prefix}_{display_order}.jpg', path), path)
+                for display_order, path in enumerate(paths)
+            ])
+
+        # bulk_create не отправляет post_save, поэтому копии изображений записаны выше вручную
+        Product.objects.bulk_create(products, batch_size=self.batch_size)
+        ProductImage.objects.bulk_create(
+            [
+                ProductImage(
+                    product=product,
+                    image=name,
+                    is_main=display_order == 0,
+                    display_order=display_order,
+                    placeholder=self.encoded_images[path][2][0],
+                    dominant_color=self.encoded_images[path][2][1],
+                )
+                for product, images in zip(products, gallery)
+                for display_order, (name, path) in enumerate(images)
+            ],
+            batch_size=self.batch_size
+        )
+
+        # bulk_create не отправляет сигналы и для учета ссылок на файлы
+        MediaBlob.change_references(
+            [product.image.name for product in products] + [name for images in gallery for name, path in images]
+        )
 
+        # Начальный остаток фиксируем в журнале движения товара
+        StockMovement.objects.bulk_create(
+            [
+                StockMovement(
+                    product=product,
+                    change=product.stock,
+                    reason=StockMovement.REASON_IMPORT,
+                    note='populate_db'
+                )
+                for product in products
+                if product.stock
+            ],
+            batch_size=self.batch_size
+        )
+        return [len(images) for images in gallery]
+
+    def product_templates(self, source_images):
+        """Базовый набор товаров и исходные изображения для каждой категории (по id)"""
         # Получаем все категории
         categories = {
             'одежда': Category.objects.get(slug='tactical-clothing'),
@@ -421,109 +562,72 @@ class Command(BaseCommand):
             },
         ]
 
-        # Счетчики для распределения изображений
-        image_index = {}
+        images_by_category = {}
         for category_key, folders in category_to_folder.items():
-            for folder in folders:
-                if folder in source_images:
-                    image_index[category_key] = source_images[folder]
-                    break
-            if category_key not in image_index:
-                image_index[category_key] = []
+            images = next((source_images[folder] for folder in folders if folder in source_images), [])
+            images_by_category[categories[category_key].id] = images
 
-        stats = {
-            'total_products': 0,
-            'with_real_images': 0,
-            'with_placeholders': 0,
-            'real_images_count': 0,
-            'placeholder_images_count': 0
-        }
+        return products_data, images_by_category
 
-        # Создаем товары
-        for product_data in products_data:
-            product, created = Product.objects.get_or_create(
+    def create_products(self, source_images=None, skip_images=False, force_placeholders=False):
+        """Создание товаров с реальными изображениями из source_images"""
+        if source_images is None:
+            source_images = {}
+
+        products_data, images_by_category = self.product_templates(source_images)
+
+        existing = set(
+            Product.objects.filter(name__in=[data['name'] for data in products_data]).values_list('name', flat=True)
+        )
+        products_data = [data for data in products_data if data['name'] not in existing]
+        slugs = Product.allocate_slugs([slugify(data['name']) for data in products_data])
+
+        # Каждый товар получает следующие 3 изображения своей категории
+        image_counter = {}
+        specs = []
+        for product_data, slug in zip(products_data, slugs):
+            product = Product(
                 name=product_data['name'],
-                defaults={
-                    'category': product_data['category'],
-                    'price': product_data['price'],
-                    'stock': product_data['stock'],
-                    'description': product_data['description'],
-                    'short_description': product_data['short_description'],
-                    'slug': slugify(product_data['name']),
-                    'is_available': True,
-                }
+                slug=slug,
+                category=product_data['category'],
+                price=Decimal(str(product_data['price'])),
+                stock=product_data['stock'],
+                description=product_data['description'],
+                short_description=product_data['short_description'],
+                is_available=True,
             )
+            images = []
+            if not skip_images and not force_placeholders:
+                category_id = product_data['category'].id
+                start_idx = image_counter.get(category_id, 0)
+                images = images_by_category[category_id][start_idx:start_idx + 3]
+                image_counter[category_id] = start_idx + len(images)
+            specs.append((product, images))
 
-            if created:
-                stats['total_products'] += 1
-
-                if skip_images:
-                    self.stdout.write(self.style.SUCCESS(f'Создан товар: {product.name} (без изображений)'))
-                    continue
-
-                # Определяем категорию товара для поиска изображений
-                category_key = None
-                for key, cat in categories.items():
-                    if cat == product_data['category']:
-                        category_key = key
-                        break
-
-                # Получаем изображения для этой категории
-                category_images = image_index.get(category_key, [])
-
-                # Если есть изображения и не форсируем заглушки
-                if not force_placeholders and category_images:
-                    # Берем изображения для этого товара (по 3 на товар)
-                    if not hasattr(self, '_img_counter'):
-                        self._img_counter = {}
-
-                    counter_key = category_key
-                    start_idx = self._img_counter.get(counter_key, 0)
-
-                    # Берем до 3 изображений для этого товара
-                    images_for_product = category_images[start_idx:start_idx + 3]
-
-                    if images_for_product:
-                        # Основное изображение - первое (display_order = 0)
-                        main_success = self.copy_image_to_product(
-                            images_for_product[0],
-                            product,
-                            is_main=True,
-                            display_order=0
-                        )
-
-                        if main_success:
-                            stats['with_real_images'] += 1
-                            stats['real_images_count'] += 1
-                            images_added = 1
-
-                            # Дополнительные изображения - остальные (display_order = 1, 2, ...)
-                            for j, img_path in enumerate(images_for_product[1:], 1):
-                                add_success = self.copy_image_to_product(
-                                    img_path,
-                                    product,
-                                    is_main=False,
-                                    display_order=j
-                                )
-                                if add_success:
-                                    stats['real_images_count'] += 1
-                                    images_added += 1
-
-                            # Обновляем счетчик
-                            self._img_counter[counter_key] = start_idx + len(images_for_product)
+        with transaction.atomic():
+            image_counts = self.insert_products(specs)
 
-                            self.stdout.write(
-                                self.style.SUCCESS(f'Товар "{product.name}" получил {images_added} изображений')
-                            )
-                        else:
-                            # Если основное изображение не скопировалось, создаем заглушки
-                            self._create_placeholder_images(product, product_data, stats)
-                    else:
-                        # Если изображения кончились, создаем заглушки
-                        self._create_placeholder_images(product, product_data, stats)
-                else:
-                    # Нет изображений для категории или форсируем заглушки
-                    self._create_placeholder_images(product, product_data, stats)
+        stats = {
+            'total_products': len(specs),
+            'with_real_images': 0,
+            'with_placeholders': 0,
+            'real_images_count': 0,
+        }
+        for (product, images), images_added in zip(specs, image_counts):
+            if skip_images:
+                self.stdout.write(self.style.SUCCESS(f'Создан товар: {product.name} (без изображений)'))
+            elif images_added:
+                stats['with_real_images'] += 1
+                stats['real_images_count'] += images_added
+                self.stdout.write(
+                    self.style.SUCCESS(f'Товар "{product.name}" получил {images_added} изображений')
+                )
+            else:
+                # Нет изображений для категории, они кончились или форсируем заглушки
+                stats['with_placeholders'] += 1
+                self.stdout.write(
+                    self.style.WARNING(f'Создание заглушек для: {product.name}')
+                )
 
         # Выводим статистику
         self.stdout.write(self.style.SUCCESS('\n=== СТАТИСТИКА ИЗОБРАЖЕНИЙ ==='))
@@ -531,19 +635,155 @@ class Command(BaseCommand):
         self.stdout.write(f'Товаров с реальными изображениями: {stats["with_real_images"]}')
         self.stdout.write(f'Товаров с заглушками: {stats["with_placeholders"]}')
         self.stdout.write(f'Всего реальных изображений: {stats["real_images_count"]}')
-        self.stdout.write(f'Всего заглушек: {stats["placeholder_images_count"]}')
 
-    def _create_placeholder_images(self, product, product_data, stats):
-        """Создает изображения-заглушки для товара"""
-        stats['with_placeholders'] += 1
+    def progress_value(self, kind):
+        """Сколько записей генератора уже сохранено"""
+        return GenerationProgress.objects.filter(kind=kind, seed=self.seed).values_list(
+            'created_count', flat=True
+        ).first() or 0
 
-        self.stdout.write(
-            self.style.WARNING(f'Создание заглушек для: {product_data["name"]}')
+    def save_progress(self, kind, value):
+        """Сохраняет прогресс генератора (вызывается в транзакции пакета)"""
+        GenerationProgress.objects.update_or_create(kind=kind, seed=self.seed, defaults={'created_count': value})
+
+    def generate_in_batches(self, kind, count, create_batch):
+        """
+        Создает записи с номерами 0..count-1 пакетами. Пакет и отметка прогресса фиксируются
+        в одной транзакции, поэтому после прерывания генерация продолжается с первого
+        незаписанного номера, а данные каждого номера зависят только от --seed.
+        """
+        done = self.progress_value(kind)
+        if done >= count:
+            self.stdout.write(f'Сгенерированные записи ({kind}, seed={self.seed}) уже созданы: {done}')
+            return
+        if done:
+            self.stdout.write(f'Продолжение генерации ({kind}, seed={self.seed}) с записи {done}')
+
+        started = time.perf_counter()
+        for batch in batched(range(done, count), self.batch_size):
+            with transaction.atomic():
+                create_batch(batch)
+                self.save_progress(kind, batch[-1] + 1)
+
+            elapsed = time.perf_counter() - started
+            created = batch[-1] + 1 - done
+            self.stdout.write(
+                f'  {kind}: {batch[-1] + 1}/{count} ({created / elapsed if elapsed else 0:.0f} записей/с)'
+            )
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Сгенерировано ({kind}): {count - done} за {time.perf_counter() - started:.1f} с'
+        ))
+
+    def create_synthetic_products(self, count, source_images, skip_images=False):
+        """Генерирует товары по шаблонам базового набора"""
+        products_data, images_by_category = self.product_templates(source_images)
+
+        def create_batch(batch):
+            specs = []
+            for index in batch:
+                rng = random.Random(f'{self.seed}:product:{index}')
+                template = rng.choice(products_data)
+                variant = rng.choice(SYNTHETIC_VARIANTS)
+                product = Product(
+                    name=f"{template['name']} ({variant}, арт. {self.seed}-{index})",
+                    slug=f'sku-{self.seed}-{index}',
+                    category=template['category'],
+                    price=Decimal(round(template['price'] * rng.uniform(0.6, 1.6), -1)).quantize(Decimal('0.01')),
+                    stock=rng.randint(0, 60),
+                    description=template['description'],
+                    short_description=template['short_description'],
+                    is_available=rng.random() < 0.95,
+                )
+                category_images = [] if skip_images else images_by_category[template['category'].id]
+                specs.append((product, rng.sample(category_images, min(3, len(category_images)))))
+            self.insert_products(specs)
+
+        self.generate_in_batches('products', count, create_batch)
+
+    def insert_users(self, users):
+        """Записывает пользователей пакетом вместе с их корзинами"""
+        CustomUser.objects.bulk_create(users, batch_size=self.batch_size)
+        # bulk_create не отправляет post_save, корзины создаем сами
+        Cart.objects.bulk_create([Cart(user=user) for user in users], batch_size=self.batch_size)
+
+    def create_synthetic_users(self, count):
+        """Генерирует покупателей с общим паролем testpass123"""
+        # Хэширование пароля - самая дорогая часть создания пользователя, поэтому хэш один на всех
+        password = make_password('testpass123')
+
+        def create_batch(batch):
+            users = []
+            for index in batch:
+                rng = random.Random(f'{self.seed}:user:{index}')
+                users.append(CustomUser(
+                    username=f'user_{self.seed}_{index}',
+                    email=f'user_{self.seed}_{index}@example.com',
+                    password=password,
+                    first_name='Покупатель',
+                    last_name=f'№{index}',
+                    phone=f'+7900{rng.randint(0, 9999999):07d}',
+                ))
+            self.insert_users(users)
+
+        self.generate_in_batches('users', count, create_batch)
+
+    def create_synthetic_orders(self, count, until=SYNTHETIC_ORDERS_UNTIL):
+        """
+        Генерирует заказы за два года до даты until по доступным товарам и покупателям.
+        Остатки не списываются: это история продаж для аналитики и нагрузочных тестов.
+        """
+        status_ids = dict(OrderStatus.objects.values_list('code', 'id'))
+        statuses = [status_ids[code] for code in SYNTHETIC_ORDER_STATUSES]
+        weights = list(SYNTHETIC_ORDER_STATUSES.values())
+        products = list(Product.objects.filter(is_available=True).order_by('id').values_list('id', 'price'))
+        user_ids = list(
+            CustomUser.objects.filter(is_staff=False, is_superuser=False).order_by('id').values_list('id', flat=True)
         )
+        if not products:
+            self.stdout.write(self.style.WARNING('Нет доступных товаров, заказы не созданы'))
+            return
+        end = timezone.make_aware(datetime.combine(until, datetime.min.time()))
+        period = int(SYNTHETIC_ORDERS_PERIOD.total_seconds())
+
+        def create_batch(batch):
+            orders = []
+            order_items = []
+            created_at = []
+            for index in batch:
+                rng = random.Random(f'{self.seed}:order:{index}')
+                items = [
+                    OrderItem(product_id=product_id, quantity=quantity, price=price, subtotal=price * quantity)
+                    for (product_id, price), quantity in (
+                        (line, rng.randint(1, 3)) for line in rng.sample(products, min(len(products), rng.randint(1, 4)))
+                    )
+                ]
+                user_id = rng.choice(user_ids) if user_ids and rng.random() < 0.7 else None
+                orders.append(Order(
+                    user_id=user_id,
+                    guest_email='' if user_id else f'guest_{self.seed}_{index}@example.com',
+                    guest_name='' if user_id else 'Гость',
+                    status_id=rng.choices(statuses, weights)[0],
+                    total_amount=sum(item.subtotal for item in items),
+                    shipping_address=f'г. Москва, ул. Тестовая, д. {rng.randint(1, 200)}',
+                ))
+                order_items.append(items)
+                created_at.append(end - timedelta(seconds=rng.randint(0, period)))
+
+            Order.objects.bulk_create(orders, batch_size=self.batch_size)
+            # auto_now_add при вставке подставляет текущее время, даты проставляем отдельным UPDATE
+            for order, order_created_at in zip(orders, created_at):
+                order.created_at = order.updated_at = order_created_at
+            Order.objects.bulk_update(orders, ['created_at', 'updated_at'], batch_size=self.batch_size)
+
+            for order, items in zip(orders, order_items):
+                for item in items:
+                    item.order = order
+            OrderItem.objects.bulk_create(
+                [item for items in order_items for item in items], batch_size=self.batch_size
+            )
 
-        # Здесь можно добавить логику создания заглушек если нужно
-        # Но пока просто сохраняем товар без изображений
-        product.save()
+        self.generate_in_batches('orders', count, create_batch)
 
     def create_test_users(self):
         """Создание тестовых пользователей"""
@@ -566,14 +806,22 @@ class Command(BaseCommand):
             },
         ]
 
-        for user_data in test_users:
-            if not CustomUser.objects.filter(username=user_data['username']).exists():
-                user = CustomUser.objects.create_user(
-                    username=user_data['username'],
-                    email=user_data['email'],
-                    password=user_data['password'],
-                    first_name=user_data['first_name'],
-                    last_name=user_data['last_name'],
-                    phone=user_data['phone'],
-                )
-                self.stdout.write(f'Создан пользователь: {user.username}')
\ No newline at end of file
+        existing = set(
+            CustomUser.objects.filter(username__in=[data['username'] for data in test_users])
+            .values_list('username', flat=True)
+        )
+        users = [
+            CustomUser(
+                username=user_data['username'],
+                email=user_data['email'],
+                password=make_password(user_data['password']),
+                first_name=user_data['first_name'],
+                last_name=user_data['last_name'],
+                phone=user_data['phone'],
+            )
+            for user_data in test_users
+            if user_data['username'] not in existing
+        ]
+        self.insert_users(users)
+        for user in users:
+            self.stdout.write(f'Создан пользователь: {user.username}')
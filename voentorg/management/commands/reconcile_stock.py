@@ -0,0 +1,107 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import OuterRef, Subquery, Max, Value
+from django.db.models.functions import Coalesce
+from voentorg.ledger import ledger_stock_queryset
+from voentorg.models import Product, StockMovement, StockSnapshot
+
+
+class Command(BaseCommand):
+    help = 'Сверяет остатки товаров с журналом движения, исправляет расхождения и делает снимки'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--fix',
+            action='store_true',
+            help='Перезаписать Product.stock значением из журнала для расходящихся товаров',
+        )
+        parser.add_argument(
+            '--snapshot',
+            action='store_true',
+            help='Сохранить снимки остатков, чтобы ограничить объем будущих пересчетов',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Размер пакета для массовых записей',
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        if batch_size <= 0:
+            raise CommandError('Размер пакета должен быть положительным')
+
+        mismatched = []
+        checked = 0
+        rows = ledger_stock_queryset(Product.objects.order_by('id')).values_list(
+            'id', 'stock', 'snapshot_stock', 'movements_total'
+        )
+        for product_id, stock, snapshot_stock, movements_total in rows.iterator(chunk_size=batch_size):
+            checked += 1
+            ledger = snapshot_stock + movements_total
+            if ledger != stock:
+                mismatched.append(product_id)
+                self.stdout.write(self.style.WARNING(
+                    f'Товар #{product_id}: в карточке {stock}, по журналу {ledger}'
+                ))
+
+        self.stdout.write(f'Проверено товаров: {checked}, расхождений: {len(mismatched)}')
+
+        if options['fix'] and mismatched:
+            fixed = 0
+            for start in range(0, len(mismatched), batch_size):
+                fixed += self.fix_batch(mismatched[start:start + batch_size], batch_size)
+            self.stdout.write(self.style.SUCCESS(f'Исправлено остатков: {fixed}'))
+
+        if options['snapshot']:
+            created = self.create_snapshots(batch_size)
+            self.stdout.write(self.style.SUCCESS(f'Создано снимков: {created}'))
+
+    @transaction.atomic
+    def fix_batch(self, product_ids, batch_size):
+        """Пересчитывает проекцию остатка под блокировкой строк товаров"""
+        # Движения пишутся в одной транзакции с обновлением товара, поэтому блокировка
+        # строк товаров гарантирует, что между расчетом и записью журнал не изменится
+        list(Product.objects.select_for_update().filter(id__in=product_ids).values_list('id', flat=True))
+
+        products = []
+        for product in ledger_stock_queryset(Product.objects.filter(id__in=product_ids)):
+            product.stock = product.snapshot_stock + product.movements_total
+            products.append(product)
+        Product.objects.bulk_update(products, ['stock'], batch_size=batch_size)
+        return len(products)
+
+    def create_snapshots(self, batch_size):
+        """Сохраняет снимки остатков по журналу на момент последнего движения"""
+        last_movement = StockMovement.objects.aggregate(last=Max('id'))['last'] or 0
+
+        snapshots = []
+        created = 0
+        product_last_movement = StockMovement.objects.filter(
+            product=OuterRef('pk'), id__lte=last_movement
+        ).order_by('-id').values('id')[:1]
+        rows = ledger_stock_queryset(
+            Product.objects.order_by('id'), up_to_movement=last_movement
+        ).annotate(
+            last_movement=Coalesce(Subquery(product_last_movement), Value(0)),
+        ).values_list('id', 'snapshot_stock', 'snapshot_movement', 'movements_total', 'last_movement')
+
+        for product_id, snapshot_stock, snapshot_movement, movements_total, product_movement in rows.iterator(
+            chunk_size=batch_size
+        ):
+            # Если после последнего снимка движений не было, новый снимок не нужен
+            if product_movement <= snapshot_movement:
+                continue
+            snapshots.append(StockSnapshot(
+                product_id=product_id,
+                stock=snapshot_stock + movements_total,
+                last_movement_id=last_movement,
+            ))
+            if len(snapshots) >= batch_size:
+                StockSnapshot.objects.bulk_create(snapshots)
+                created += len(snapshots)
+                snapshots = []
+
+        StockSnapshot.objects.bulk_create(snapshots)
+        return created + len(snapshots)
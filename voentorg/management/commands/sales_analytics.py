@@ -0,0 +1,184 @@
+import time
+from datetime import date
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from voentorg.models import DailySales, Product, Category
+
+
+def load_sales_arrays(start=None, end=None):
+    """
+    Загружает дневные агрегаты продаж за полуинтервал дней [start, end) (порядковые номера дат) в массивы NumPy.
+    Записи вне интервала отсекает БД, а не Python после чтения всей таблицы
+    """
+    sales = DailySales.objects.order_by()
+    if start is not None:
+        sales = sales.filter(date__gte=date.fromordinal(start))
+    if end is not None:
+        sales = sales.filter(date__lt=date.fromordinal(end))
+    rows = list(sales.values_list('date', 'product_id', 'category_id', 'quantity', 'revenue'))
+    count = len(rows)
+    return {
+        'day': np.fromiter((row[0].toordinal() for row in rows), dtype=np.int64, count=count),
+        'product': np.fromiter((row[1] for row in rows), dtype=np.int64, count=count),
+        'category': np.fromiter((row[2] or 0 for row in rows), dtype=np.int64, count=count),
+        'quantity': np.fromiter((row[3] for row in rows), dtype=np.int64, count=count),
+        'revenue': np.fromiter((float(row[4]) for row in rows), dtype=np.float64, count=count),
+    }
+
+
+def period_totals(keys, days, values, start, end, size):
+    """Суммы значений по ключам за полуинтервал дней [start, end)"""
+    mask = (days >= start) & (days < end)
+    return np.bincount(keys[mask], weights=values[mask], minlength=size)
+
+
+def moving_average(keys, days, values, end, window, size):
+    """Скользящее среднее за последние window дней до end (не включая) по каждому ключу"""
+    return period_totals(keys, days, values, end - window, end, size) / window
+
+
+def daily_series(days, values, start, end):
+    """Дневной ряд суммарных значений на интервале [start, end)"""
+    mask = (days >= start) & (days < end)
+    return np.bincount(days[mask] - start, weights=values[mask], minlength=end - start)
+
+
+def rolling_mean(series, window):
+    """Скользящее среднее ряда через кумулятивную сумму"""
+    cumsum = np.cumsum(np.insert(series, 0, 0.0))
+    result = np.full(len(series), np.nan)
+    result[window - 1:] = (cumsum[window:] - cumsum[:-window]) / window
+    return result
+
+
+def percent_change(current, previous):
+    """Относительное изменение в процентах (NaN, если в прошлом периоде продаж не было)"""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(previous > 0, (current - previous) / previous * 100, np.nan)
+
+
+class Command(BaseCommand):
+    help = 'Аналитика продаж по дневным агрегатам: рейтинги, скользящие средние, сравнение периодов'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=30,
+            help='Длина отчетного периода в днях (сравнивается с предыдущим периодом той же длины)',
+        )
+        parser.add_argument(
+            '--window',
+            type=int,
+            default=7,
+            help='Окно скользящего среднего в днях',
+        )
+        parser.add_argument(
+            '--top',
+            type=int,
+            default=10,
+            help='Количество товаров в рейтинге',
+        )
+        parser.add_argument(
+            '--until',
+            type=date.fromisoformat,
+            default=None,
+            help='Последний день отчетного периода (ГГГГ-ММ-ДД), по умолчанию сегодня',
+        )
+
+    def handle(self, *args, **options):
+        days = options['days']
+        window = options['window']
+        top = options['top']
+        if days <= 0 or window <= 0 or top <= 0:
+            raise CommandError('Параметры --days, --window и --top должны быть положительными')
+
+        until = options['until'] or timezone.localdate()
+        end = until.toordinal() + 1
+        start = end - days
+        previous_start = start - days
+
+        # Читаем только дни, нужные отчету: прошлый период и начало окна скользящего среднего
+        started = time.perf_counter()
+        data = load_sales_arrays(min(previous_start, start - window + 1), end)
+        loaded = time.perf_counter()
+
+        if not len(data['day']):
+            self.stdout.write(self.style.WARNING('Нет агрегатов продаж за период. Запустите update_sales_rollups'))
+            return
+
+        # Переводим идентификаторы в плотные индексы, чтобы считать всё через bincount
+        product_ids, product_index = np.unique(data['product'], return_inverse=True)
+        category_ids, category_index = np.unique(data['category'], return_inverse=True)
+
+        product_revenue = period_totals(product_index, data['day'], data['revenue'], start, end, len(product_ids))
+        product_previous = period_totals(
+            product_index, data['day'], data['revenue'], previous_start, start, len(product_ids)
+        )
+        product_quantity = period_totals(
+            product_index, data['day'], data['quantity'], start, end, len(product_ids)
+        )
+        product_average = moving_average(
+            product_index, data['day'], data['revenue'], end, window, len(product_ids)
+        )
+        product_change = percent_change(product_revenue, product_previous)
+
+        category_revenue = period_totals(
+            category_index, data['day'], data['revenue'], start, end, len(category_ids)
+        )
+        category_previous = period_totals(
+            category_index, data['day'], data['revenue'], previous_start, start, len(category_ids)
+        )
+        category_change = percent_change(category_revenue, category_previous)
+
+        series = daily_series(data['day'], data['revenue'], start - window + 1, end)
+        series_average = rolling_mean(series, window)[window - 1:]
+
+        # Рейтинг: argpartition отбирает top-N без полной сортировки, затем сортируем только их
+        top = min(top, len(product_ids))
+        candidates = np.argpartition(-product_revenue, top - 1)[:top]
+        ranking = candidates[np.argsort(-product_revenue[candidates], kind='stable')]
+
+        computed = time.perf_counter()
+
+        period = f'{date.fromordinal(start)} — {until}'
+        self.stdout.write(self.style.SUCCESS(f'=== ТОП-{top} ТОВАРОВ ЗА ПЕРИОД {period} ==='))
+        names = Product.objects.in_bulk([int(product_ids[index]) for index in ranking])
+        for position, index in enumerate(ranking, 1):
+            product = names.get(int(product_ids[index]))
+            name = product.name if product else f'Товар #{product_ids[index]}'
+            self.stdout.write(
+                f'{position:>3}. {name}: {int(product_quantity[index])} шт., '
+                f'{product_revenue[index]:.2f} руб. ({self.format_change(product_change[index])}), '
+                f'среднее за {window} дн.: {product_average[index]:.2f} руб./день'
+            )
+
+        self.stdout.write(self.style.SUCCESS('\n=== ВЫРУЧКА ПО КАТЕГОРИЯМ ==='))
+        category_names = Category.objects.in_bulk([int(pk) for pk in category_ids if pk])
+        for index in np.argsort(-category_revenue, kind='stable'):
+            category = category_names.get(int(category_ids[index]))
+            name = category.name if category else 'Без категории'
+            self.stdout.write(
+                f'{name}: {category_revenue[index]:.2f} руб. '
+                f'(пред. период {category_previous[index]:.2f} руб., {self.format_change(category_change[index])})'
+            )
+
+        self.stdout.write(self.style.SUCCESS(f'\n=== СКОЛЬЗЯЩЕЕ СРЕДНЕЕ ВЫРУЧКИ ({window} дн.) ==='))
+        for offset in range(max(0, days - window), days):
+            self.stdout.write(
+                f'{date.fromordinal(start + offset)}: {series[offset + window - 1]:.2f} руб., '
+                f'среднее {series_average[offset]:.2f} руб.'
+            )
+
+        self.stdout.write(
+            f'\nЗаписей агрегатов: {len(data["day"])}. '
+            f'Загрузка: {(loaded - started) * 1000:.0f} мс, расчет: {(computed - loaded) * 1000:.1f} мс'
+        )
+
+    def format_change(self, value):
+        """Форматирует изменение к предыдущему периоду"""
+        if np.isnan(value):
+            return 'нет данных за прошлый период'
+        return f'{value:+.1f}%'
@@ -0,0 +1,157 @@
+import os
+import time
+from collections import defaultdict
+from decimal import Decimal, InvalidOperation
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from voentorg.feeds import read_records, batched, parse_bool
+from voentorg.models import Product, StockMovement
+from voentorg.signals import products_changed
+
+
+class Command(BaseCommand):
+    help = (
+        'Синхронизирует цены, остатки и доступность товаров с выгрузкой склада. '
+        'Записываются только изменившиеся товары, пакетными UPDATE в одной транзакции'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path',
+            help='Файл выгрузки склада (.csv, .jsonl или .json) с колонками slug/id, price, stock, is_available',
+        )
+        parser.add_argument(
+            '--key',
+            choices=['slug', 'id'],
+            default='slug',
+            help='Колонка, по которой строки выгрузки сопоставляются с товарами',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Количество товаров в одном UPDATE',
+        )
+        parser.add_argument(
+            '--deactivate-missing',
+            action='store_true',
+            help='Снять с продажи товары, которых нет в выгрузке (для полных выгрузок)',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только показать количество изменений',
+        )
+
+    def handle(self, *args, **options):
+        key = options['key']
+        batch_size = options['batch_size']
+        if batch_size <= 0:
+            raise CommandError('Размер пакета должен быть положительным')
+        if not os.path.exists(options['path']):
+            raise CommandError(f'Файл не найден: {options["path"]}')
+
+        started = time.perf_counter()
+
+        # Текущее состояние каталога держим в памяти: ключ -> (id, цена, остаток, доступность)
+        current = {}
+        rows = Product.objects.order_by().values_list('id', 'slug', 'price', 'stock', 'is_available')
+        for product_id, slug, price, stock, is_available in rows.iterator(chunk_size=5000):
+            current[str(product_id) if key == 'id' else slug] = (product_id, price, stock, is_available)
+
+        changes = {}
+        seen = set()
+        unknown = 0
+        invalid = 0
+        for record in read_records(options['path']):
+            record_key = str(record.get(key) or '').strip()
+            if record_key not in current:
+                unknown += 1
+                continue
+            seen.add(record_key)
+
+            try:
+                values = self.parse_record(record)
+            except (ValueError, TypeError, InvalidOperation) as e:
+                invalid += 1
+                self.stdout.write(self.style.WARNING(f'  Некорректная строка "{record_key}": {e}'))
+                continue
+
+            product_id, price, stock, is_available = current[record_key]
+            old_values = {'price': price, 'stock': stock, 'is_available': is_available}
+            changed = {
+                field: value
+                for field, value in values.items()
+                if old_values[field] != value
+            }
+            if changed:
+                changes[product_id] = changed
+
+        if options['deactivate_missing']:
+            for record_key, (product_id, price, stock, is_available) in current.items():
+                if record_key not in seen and is_available:
+                    changes.setdefault(product_id, {})['is_available'] = False
+
+        diffed = time.perf_counter()
+        self.stdout.write(
+            f'Товаров в каталоге: {len(current)}, строк сопоставлено: {len(seen)}, '
+            f'неизвестных: {unknown}, ошибочных: {invalid}, изменилось: {len(changes)} '
+            f'(сравнение за {(diffed - started) * 1000:.0f} мс)'
+        )
+
+        if options['dry_run'] or not changes:
+            return
+
+        with transaction.atomic():
+            for batch in batched(sorted(changes.items()), batch_size):
+                self.apply_batch(batch)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Синхронизация завершена: обновлено товаров {len(changes)} за {time.perf_counter() - started:.1f} с'
+        ))
+
+    def parse_record(self, record):
+        """Значения синхронизируемых полей из строки выгрузки (отсутствующие колонки не трогаем)"""
+        values = {}
+        if record.get('price') not in (None, ''):
+            values['price'] = Decimal(str(record['price']).replace(',', '.')).quantize(Decimal('0.01'))
+            if values['price'] < 0:
+                raise ValueError('цена не может быть отрицательной')
+        if record.get('stock') not in (None, ''):
+            values['stock'] = int(record['stock'])
+            if values['stock'] < 0:
+                raise ValueError('остаток не может быть отрицательным')
+        if record.get('is_available') not in (None, ''):
+            values['is_available'] = parse_bool(record['is_available'])
+        return values
+
+    def apply_batch(self, batch):
+        """Записывает пакет изменений: по одному UPDATE ... CASE на каждый набор изменившихся полей"""
+        product_ids = [product_id for product_id, changed in batch]
+
+        # Остатки блокируем и перечитываем: между чтением каталога и записью могли пройти заказы
+        stock_ids = [product_id for product_id, changed in batch if 'stock' in changed]
+        fresh_stock = dict(
+            Product.objects.select_for_update().filter(id__in=stock_ids).values_list('id', 'stock')
+        )
+
+        groups = defaultdict(list)
+        movements = []
+        for product_id, changed in batch:
+            product = Product(id=product_id, **changed)
+            groups[tuple(sorted(changed))].append(product)
+            if 'stock' in changed and changed['stock'] != fresh_stock[product_id]:
+                movements.append(StockMovement(
+                    product_id=product_id,
+                    change=changed['stock'] - fresh_stock[product_id],
+                    reason=StockMovement.REASON_IMPORT,
+                    note='sync_warehouse'
+                ))
+
+        for fields, products in groups.items():
+            Product.objects.bulk_update(products, list(fields))
+        StockMovement.objects.bulk_create(movements)
+
+        transaction.on_commit(lambda: products_changed.send(sender=Product, product_ids=product_ids))
+        self.stdout.write(f'  Пакет записан: {len(batch)} товаров')
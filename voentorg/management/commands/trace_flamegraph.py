@@ -0,0 +1,70 @@
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from voentorg.tracing import folded_stacks, read_traces
+
+
+class Command(BaseCommand):
+    help = (
+        'Сводит трассировки запросов (TRACING_FILE) в свернутые стеки для flamegraph.pl или speedscope '
+        'и выводит самые медленные запросы'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--input',
+            default=None,
+            help='Файл трассировок (по умолчанию TRACING_FILE)',
+        )
+        parser.add_argument(
+            '--output',
+            default='traces.folded',
+            help='Файл свернутых стеков',
+        )
+        parser.add_argument(
+            '--view',
+            default=None,
+            help='Учитывать только запросы к этому представлению (например guest_checkout)',
+        )
+        parser.add_argument(
+            '--slowest',
+            type=int,
+            default=10,
+            help='Сколько самых медленных запросов вывести',
+        )
+
+    def handle(self, *args, **options):
+        path = options['input'] or settings.TRACING_FILE
+        stacks = defaultdict(int)
+        traces = []
+        for trace in read_traces(path):
+            if options['view'] and trace.get('view') != options['view']:
+                continue
+            traces.append(trace)
+            for stack, microseconds in folded_stacks(trace).items():
+                stacks[stack] += microseconds
+
+        if not traces:
+            raise CommandError(f'В {path} нет подходящих трассировок')
+
+        with open(options['output'], 'w', encoding='utf-8') as file:
+            for stack, microseconds in sorted(stacks.items()):
+                if microseconds:
+                    file.write(f'{stack} {microseconds}\n')
+        self.stdout.write(self.style.SUCCESS(
+            f'Трассировок: {len(traces)}, свернутые стеки сохранены в {options["output"]}'
+        ))
+
+        self.stdout.write(f'{"мс":>9} {"SQL":>5} {"SQL, мс":>8} {"шаблоны, мс":>12}  запрос')
+        traces.sort(key=lambda trace: trace['duration_ms'] or 0, reverse=True)
+        for trace in traces[:options['slowest']]:
+            totals = defaultdict(float)
+            counts = defaultdict(int)
+            for span in trace['spans']:
+                totals[span['kind']] += span['duration_ms'] or 0
+                counts[span['kind']] += 1
+            self.stdout.write(
+                f'{trace["duration_ms"]:>9.1f} {counts["db"]:>5} {totals["db"]:>8.1f} {totals["template"]:>12.1f}  '
+                f'{trace.get("method")} {trace.get("path")} ({trace.get("view")}, {trace.get("status")})'
+            )
@@ -0,0 +1,102 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Sum
+from django.db.models.functions import TruncDate
+from voentorg.models import Product, RollupCheckpoint
+from voentorg.popularity import HALF_LIFE_DAYS, add_scores, current_epoch, rebase_epoch, sale_weight
+from voentorg.rollups import ITEM_SOURCES, POPULARITY_CHECKPOINT, SAFETY_LAG, next_batch, settled_items
+from voentorg.signals import products_changed
+
+
+class Command(BaseCommand):
+    help = (
+        'Инкрементально обновляет популярность товаров (сортировка «По популярности») '
+        f'по новым позициям заказов (включая архивные); вес продажи половинится каждые {HALF_LIFE_DAYS} дней. '
+        'Отмененные заказы не учитываются, отмена после пересчета снимает продажи заказа сразу'
+    )
+
+    checkpoint_name = POPULARITY_CHECKPOINT
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=10000,
+            help='Количество позиций заказов, обрабатываемых за один проход',
+        )
+        parser.add_argument(
+            '--rebuild',
+            action='store_true',
+            help='Обнулить популярность и пересчитать ее по всем рабочим и архивным заказам',
+        )
+        parser.add_argument(
+            '--lag',
+            type=int,
+            default=int(SAFETY_LAG.total_seconds()),
+            help='Не обрабатывать позиции заказов, созданных за последние N секунд (еще не зафиксированные транзакции)',
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        if batch_size <= 0:
+            raise CommandError('Размер пакета должен быть положительным')
+        if options['lag'] < 0:
+            raise CommandError('Окно --lag не может быть отрицательным')
+        lag = timedelta(seconds=options['lag'])
+
+        if options['rebuild']:
+            with transaction.atomic():
+                Product.objects.exclude(popularity_score=0).update(popularity_score=0)
+                RollupCheckpoint.objects.filter(name=self.checkpoint_name).delete()
+                transaction.on_commit(lambda: products_changed.send(sender=Product, product_ids=None))
+            self.stdout.write('Популярность обнулена, пересчет с нуля')
+
+        if rebase_epoch():
+            products_changed.send(sender=Product, product_ids=None)
+            self.stdout.write(f'Дата отсчета весов перенесена на {current_epoch()}')
+
+        total_items = 0
+        while True:
+            processed = self.process_batch(batch_size, lag)
+            if not processed:
+                break
+            total_items += processed
+            self.stdout.write(f'Обработано позиций: {total_items}')
+
+        self.stdout.write(self.style.SUCCESS(f'Популярность обновлена. Новых позиций: {total_items}'))
+
+    @transaction.atomic
+    def process_batch(self, batch_size, lag):
+        """Добавляет к популярности товаров очередной пакет позиций заказов, возвращает их количество"""
+        checkpoint, created = RollupCheckpoint.objects.select_for_update().get_or_create(
+            name=self.checkpoint_name
+        )
+
+        item_ids = next_batch(checkpoint.last_id, batch_size, lag)
+        if not item_ids:
+            return 0
+        upper_id = item_ids[-1]
+
+        epoch = current_epoch()
+        deltas = {}
+        for model in ITEM_SOURCES:
+            rows = (
+                settled_items(model, checkpoint.last_id, upper_id)
+                .annotate(day=TruncDate('order__created_at'))
+                .order_by()
+                .values('day', 'product_id')
+                .annotate(total_quantity=Sum('quantity'))
+            )
+            for row in rows:
+                weight = row['total_quantity'] * sale_weight(row['day'], epoch)
+                deltas[row['product_id']] = deltas.get(row['product_id'], 0.0) + weight
+        add_scores(deltas)
+
+        checkpoint.last_id = upper_id
+        checkpoint.save()
+        changed_ids = sorted(deltas)
+        transaction.on_commit(lambda: products_changed.send(sender=Product, product_ids=changed_ids))
+
+        return len(item_ids)
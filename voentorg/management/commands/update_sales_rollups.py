@@ -0,0 +1,125 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Sum
+from django.db.models.functions import TruncDate
+from voentorg.models import DailySales, RollupCheckpoint
+from voentorg.rollups import DAILY_SALES_CHECKPOINT, ITEM_SOURCES, SAFETY_LAG, next_batch, settled_items
+
+
+class Command(BaseCommand):
+    help = (
+        'Инкрементально обновляет дневные агрегаты продаж по новым позициям заказов (включая архивные). '
+        'Отмененные заказы не учитываются, отмена после пересчета вычитает продажи заказа сразу'
+    )
+
+    checkpoint_name = DAILY_SALES_CHECKPOINT
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=10000,
+            help='Количество позиций заказов, обрабатываемых за один проход',
+        )
+        parser.add_argument(
+            '--rebuild',
+            action='store_true',
+            help='Удалить агрегаты и пересчитать их с нуля по рабочим и архивным заказам',
+        )
+        parser.add_argument(
+            '--lag',
+            type=int,
+            default=int(SAFETY_LAG.total_seconds()),
+            help='Не обрабатывать позиции заказов, созданных за последние N секунд (еще не зафиксированные транзакции)',
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        if batch_size <= 0:
+            raise CommandError('Размер пакета должен быть положительным')
+        if options['lag'] < 0:
+            raise CommandError('Окно --lag не может быть отрицательным')
+        lag = timedelta(seconds=options['lag'])
+
+        if options['rebuild']:
+            with transaction.atomic():
+                DailySales.objects.all().delete()
+                RollupCheckpoint.objects.filter(name=self.checkpoint_name).delete()
+            self.stdout.write('Агрегаты удалены, пересчет с нуля')
+
+        total_items = 0
+        while True:
+            processed = self.process_batch(batch_size, lag)
+            if not processed:
+                break
+            total_items += processed
+            self.stdout.write(f'Обработано позиций: {total_items}')
+
+        self.stdout.write(self.style.SUCCESS(f'Агрегаты обновлены. Новых позиций: {total_items}'))
+
+    @transaction.atomic
+    def process_batch(self, batch_size, lag):
+        """Добавляет в агрегаты очередной пакет позиций заказов, возвращает их количество"""
+        checkpoint, created = RollupCheckpoint.objects.select_for_update().get_or_create(
+            name=self.checkpoint_name
+        )
+
+        item_ids = next_batch(checkpoint.last_id, batch_size, lag)
+        if not item_ids:
+            return 0
+        upper_id = item_ids[-1]
+
+        # Группируем пакет по дню заказа и товару средствами БД; категория - на момент пересчета
+        rows = []
+        for model in ITEM_SOURCES:
+            rows += (
+                settled_items(model, checkpoint.last_id, upper_id)
+                .annotate(day=TruncDate('order__created_at'))
+                .order_by()
+                .values('day', 'product_id', 'product__category_id')
+                .annotate(total_quantity=Sum('quantity'), total_revenue=Sum('subtotal'))
+            )
+
+        deltas = {}
+        for row in rows:
+            key = (row['day'], row['product_id'])
+            if key in deltas:
+                deltas[key]['total_quantity'] += row['total_quantity']
+                deltas[key]['total_revenue'] += row['total_revenue']
+            else:
+                deltas[key] = row
+
+        existing = {
+            (sales.date, sales.product_id): sales
+            for sales in DailySales.objects.filter(
+                date__in={day for day, product_id in deltas},
+                product_id__in={product_id for day, product_id in deltas},
+            )
+        }
+
+        to_create = []
+        to_update = []
+        for key, row in deltas.items():
+            sales = existing.get(key)
+            if sales is None:
+                to_create.append(DailySales(
+                    date=row['day'],
+                    product_id=row['product_id'],
+                    category_id=row['product__category_id'],
+                    quantity=row['total_quantity'],
+                    revenue=row['total_revenue'],
+                ))
+            else:
+                sales.quantity += row['total_quantity']
+                sales.revenue += row['total_revenue']
+                to_update.append(sales)
+
+        DailySales.objects.bulk_create(to_create)
+        DailySales.objects.bulk_update(to_update, ['quantity', 'revenue'])
+
+        checkpoint.last_id = upper_id
+        checkpoint.save()
+
+        return len(item_ids)
@@ -0,0 +1,139 @@
+import mimetypes
+import os
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse, StreamingHttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date_safe, quote_etag
+from django.views.decorators.http import require_safe
+
+from .storage import is_immutable_name
+
+# Файлы с хэшем содержимого в имени не меняются: кэшируем на год без перепроверки
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+# Остальные файлы могут быть перезаписаны под тем же именем
+DEFAULT_CACHE_CONTROL = 'public, max-age=3600'
+
+RANGE_CHUNK_SIZE = 64 * 1024
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def parse_range(header, size):
+    """
+    Разбирает заголовок Range с одним диапазоном байтов.
+    Возвращает (начало, конец включительно), None - если заголовок нужно проигнорировать
+    (нет, несколько диапазонов, другой формат) и ValueError - если диапазон вне файла.
+    """
+    match = RANGE_RE.match(header.strip()) if header else None
+    if not match or match.group(1) == match.group(2) == '':
+        return None
+
+    start, end = match.groups()
+    if start == '':
+        # bytes=-N - последние N байт
+        length = int(end)
+        # У пустого файла нет ни одного байта, который можно было бы вернуть
+        if length == 0 or size == 0:
+            raise ValueError('пустой диапазон')
+        return max(size - length, 0), size - 1
+
+    start = int(start)
+    end = min(int(end), size - 1) if end else size - 1
+    if start >= size or start > end:
+        raise ValueError('диапазон вне файла')
+    return start, end
+
+
+def iter_file_range(path, start, length):
+    """Читает часть файла блоками"""
+    with open(path, 'rb') as file:
+        file.seek(start)
+        while length > 0:
+            chunk = file.read(min(RANGE_CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+def sendfile_response(path, name, content_type):
+    """
+    Пустой ответ, передачу файла выполняет прокси-сервер.
+    nginx: location с internal, отображающий MEDIA_ACCEL_REDIRECT_PREFIX на MEDIA_ROOT;
+    Apache: mod_xsendfile с XSendFilePath на MEDIA_ROOT. Range прокси обрабатывает сам.
+    """
+    response = HttpResponse(content_type=content_type)
+    if settings.MEDIA_SENDFILE_BACKEND == 'nginx':
+        response['X-Accel-Redirect'] = quote(settings.MEDIA_ACCEL_REDIRECT_PREFIX.rstrip('/') + '/' + name)
+    else:
+        response['X-Sendfile'] = path
+    return response
+
+
+def file_response(path, size, content_type, range_header=None):
+    """Отдача файла силами Django с поддержкой одного диапазона Range"""
+    try:
+        byte_range = parse_range(range_header, size)
+    except ValueError:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+        return response
+
+    if byte_range is None:
+        response = FileResponse(open(path, 'rb'), content_type=content_type)
+    else:
+        start, end = byte_range
+        response = StreamingHttpResponse(
+            iter_file_range(path, start, end - start + 1), status=206, content_type=content_type
+        )
+        response['Content-Length'] = str(end - start + 1)
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    return response
+
+
+@require_safe
+def serve_media(request, path):
+    """
+    Отдает файл из MEDIA_ROOT. В зависимости от MEDIA_SENDFILE_BACKEND передача файла
+    поручается nginx (X-Accel-Redirect), Apache (X-Sendfile) или выполняется Django ('python').
+    """
+    try:
+        full_path = safe_join(settings.MEDIA_ROOT, path)
+    except SuspiciousFileOperation:
+        raise Http404('Файл не найден')
+    try:
+        stat = os.stat(full_path)
+    except OSError:
+        raise Http404('Файл не найден')
+    if not os.path.isfile(full_path):
+        raise Http404('Файл не найден')
+
+    name = path.replace(os.sep, '/')
+    etag = quote_etag(f'{stat.st_mtime_ns:x}-{stat.st_size:x}')
+    last_modified = http_date(stat.st_mtime)
+
+    response = get_conditional_response(request, etag=etag, last_modified=int(stat.st_mtime))
+    if response is None:
+        content_type = mimetypes.guess_type(full_path)[0] or 'application/octet-stream'
+
+        # If-Range: диапазон действует, только если файл не изменился
+        range_header = request.headers.get('Range')
+        if_range = request.headers.get('If-Range')
+        if if_range and if_range != etag and parse_http_date_safe(if_range) != int(stat.st_mtime):
+            range_header = None
+
+        if settings.MEDIA_SENDFILE_BACKEND in ('nginx', 'apache'):
+            response = sendfile_response(full_path, name, content_type)
+        else:
+            response = file_response(full_path, stat.st_size, content_type, range_header)
+            response['Accept-Ranges'] = 'bytes'
+
+    response['ETag'] = etag
+    response['Last-Modified'] = last_modified
+    response['Cache-Control'] = IMMUTABLE_CACHE_CONTROL if is_immutable_name(name) else DEFAULT_CACHE_CONTROL
+    return response
@@ -0,0 +1,355 @@
+import glob
+import json
+import mmap
+import os
+import struct
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
+from django.core.cache.backends.locmem import LocMemCache
+from django.http import HttpResponse
+from django.utils.crypto import constant_time_compare
+
+from .tracing import span
+
+# Границы корзин гистограмм длительности, секунды
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Файл процесса: 8 байт - занятый размер, затем записи
+# [длина ключа uint32][ключ utf-8, выровненный до 8 байт][значение float64]
+INITIAL_FILE_SIZE = 64 * 1024
+HEADER = struct.Struct('<Q')
+KEY_LENGTH = struct.Struct('<I')
+VALUE = struct.Struct('<d')
+
+# Значения завершившихся процессов: мастер gunicorn переносит их сюда и удаляет файл процесса
+ARCHIVE_FILE = 'metrics_archive.db'
+
+
+class MmapStore:
+    """
+    Значения метрик одного процесса в файле, отображенном в память.
+    Каждый процесс (воркер gunicorn) пишет только в свой файл, поэтому блокировки между
+    процессами не нужны; при выдаче метрик файлы всех процессов суммируются
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.positions = {}
+        self.file = open(path, 'a+b')
+        if os.fstat(self.file.fileno()).st_size < INITIAL_FILE_SIZE:
+            self.file.truncate(INITIAL_FILE_SIZE)
+        self.map = mmap.mmap(self.file.fileno(), 0)
+        self.used = HEADER.unpack_from(self.map, 0)[0] or HEADER.size
+        for key, value, position in read_entries(self.map, self.used):
+            self.positions[key] = position
+
+    def add_entry(self, key):
+        encoded = key.encode('utf-8')
+        padded = len(encoded) + (-(KEY_LENGTH.size + len(encoded)) % 8)
+        size = KEY_LENGTH.size + padded + VALUE.size
+        if self.used + size > len(self.map):
+            new_size = max(len(self.map) * 2, self.used + size)
+            self.map.close()
+            self.file.truncate(new_size)
+            self.map = mmap.mmap(self.file.fileno(), 0)
+        KEY_LENGTH.pack_into(self.map, self.used, len(encoded))
+        self.map[self.used + KEY_LENGTH.size:self.used + KEY_LENGTH.size + len(encoded)] = encoded
+        position = self.used + KEY_LENGTH.size + padded
+        VALUE.pack_into(self.map, position, 0.0)
+        self.used += size
+        # Размер обновляется последним: читатель никогда не увидит недописанную запись
+        HEADER.pack_into(self.map, 0, self.used)
+        self.positions[key] = position
+        return position
+
+    def increment(self, key, amount):
+        with self.lock:
+            position = self.positions.get(key)
+            if position is None:
+                position = self.add_entry(key)
+            VALUE.pack_into(self.map, position, VALUE.unpack_from(self.map, position)[0] + amount)
+
+    def close(self):
+        self.map.close()
+        self.file.close()
+
+
+def read_entries(buffer, used):
+    """Записи файла процесса: (ключ, значение, позиция значения)"""
+    position = HEADER.size
+    while position < used:
+        length = KEY_LENGTH.unpack_from(buffer, position)[0]
+        key = bytes(buffer[position + KEY_LENGTH.size:position + KEY_LENGTH.size + length]).decode('utf-8')
+        position += KEY_LENGTH.size + length + (-(KEY_LENGTH.size + length) % 8)
+        yield key, VALUE.unpack_from(buffer, position)[0], position
+        position += VALUE.size
+
+
+def read_file_values(path):
+    """Пары (ключ, значение) файла процесса; пустой список, если файл пуст или уже удален"""
+    try:
+        file = open(path, 'rb')
+    except FileNotFoundError:
+        return []
+    with file:
+        if not os.fstat(file.fileno()).st_size:
+            return []
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+            return [(key, value) for key, value, position in read_entries(buffer, HEADER.unpack_from(buffer, 0)[0])]
+
+
+class MemoryStore:
+    """Хранилище в памяти процесса, если METRICS_DIR не задан (разработка, тесты)"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.values = defaultdict(float)
+
+    def increment(self, key, amount):
+        with self.lock:
+            self.values[key] += amount
+
+
+_store = {'owner': None, 'store': None}
+_store_lock = threading.Lock()
+
+
+def get_store():
+    """Хранилище текущего процесса; после fork (gunicorn --preload) создается заново"""
+    directory = getattr(settings, 'METRICS_DIR', None)
+    owner = (os.getpid(), directory)
+    if _store['owner'] != owner:
+        with _store_lock:
+            if _store['owner'] != owner:
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                    _store['store'] = MmapStore(os.path.join(directory, f'metrics_{owner[0]}.db'))
+                else:
+                    _store['store'] = MemoryStore()
+                _store['owner'] = owner
+    return _store['store']
+
+
+def collect_values():
+    """Сумма значений по всем процессам: ключ -> значение"""
+    store = get_store()
+    if isinstance(store, MemoryStore):
+        with store.lock:
+            return dict(store.values)
+
+    totals = defaultdict(float)
+    for path in glob.glob(os.path.join(settings.METRICS_DIR, 'metrics_*.db')):
+        for key, value in read_file_values(path):
+            totals[key] += value
+    return totals
+
+
+def clear_metrics_dir():
+    """
+    Удаляет файлы всех процессов. Вызывается мастером gunicorn до запуска воркеров (on_starting):
+    счетчики начинаются с нуля, а файлы процессов прошлого запуска не копятся
+    """
+    directory = getattr(settings, 'METRICS_DIR', None)
+    if not directory:
+        return 0
+    paths = glob.glob(os.path.join(directory, 'metrics_*.db'))
+    for path in paths:
+        os.remove(path)
+    return len(paths)
+
+
+def mark_process_dead(pid):
+    """
+    Переносит значения завершившегося процесса в ARCHIVE_FILE и удаляет его файл (child_exit).
+    Суммы счетчиков при перезапуске воркера не уменьшаются, а число файлов не превышает число
+    воркеров плюс один. Вызывается только мастером, поэтому архив пишет один процесс
+    """
+    directory = getattr(settings, 'METRICS_DIR', None)
+    if not directory:
+        return
+    path = os.path.join(directory, f'metrics_{pid}.db')
+    values = read_file_values(path)
+    if values:
+        archive = MmapStore(os.path.join(directory, ARCHIVE_FILE))
+        try:
+            for key, value in values:
+                archive.increment(key, value)
+        finally:
+            archive.close()
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+REGISTRY = []
+
+
+class Metric:
+    type = None
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        REGISTRY.append(self)
+
+    def key(self, sample, labels, extra=()):
+        """Ключ значения в хранилище: имя, имя образца и метки в порядке объявления"""
+        if set(labels) != set(self.labels):
+            raise ValueError(f'Метрика {self.name} ожидает метки {self.labels}, получены {tuple(labels)}')
+        pairs = [[label, str(labels[label])] for label in self.labels] + [list(pair) for pair in extra]
+        return json.dumps([self.name, sample, pairs], ensure_ascii=False)
+
+
+class Counter(Metric):
+    """Счетчик, который только растет"""
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        get_store().increment(self.key(self.name + '_total', labels), amount)
+
+
+class Histogram(Metric):
+    """Распределение значений по корзинам (как histogram в Prometheus)"""
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        store = get_store()
+        bound = next((bound for bound in self.buckets if value <= bound), float('inf'))
+        # В хранилище лежат некумулятивные корзины, накопленные значения считаются при выдаче
+        store.increment(self.key(self.name + '_bucket', labels, extra=[('le', format_value(bound))]), 1)
+        store.increment(self.key(self.name + '_sum', labels), value)
+        store.increment(self.key(self.name + '_count', labels), 1)
+
+
+def format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if value != int(value) else f'{value:.1f}'
+
+
+def escape_label(value):
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def render_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{escape_label(value)}"' for name, value in labels) + '}'
+
+
+def render_metrics():
+    """Все метрики в текстовом формате Prometheus"""
+    samples = defaultdict(list)
+    for key, value in collect_values().items():
+        name, sample, labels = json.loads(key)
+        samples[name].append((sample, labels, value))
+
+    lines = []
+    for metric in REGISTRY:
+        lines.append(f'# HELP {metric.name} {metric.documentation}')
+        lines.append(f'# TYPE {metric.name} {metric.type}')
+        metric_samples = samples.get(metric.name, [])
+        if isinstance(metric, Histogram):
+            lines.extend(render_histogram(metric, metric_samples))
+        else:
+            for sample, labels, value in sorted(metric_samples, key=lambda item: item[1]):
+                lines.append(f'{sample}{render_labels(labels)} {format_value(value)}')
+    return '\n'.join(lines) + '\n'
+
+
+def render_histogram(metric, metric_samples):
+    """Строки гистограммы: накопленные корзины, сумма и количество для каждого набора меток"""
+    series = defaultdict(lambda: {'buckets': defaultdict(float), 'sum': 0.0, 'count': 0.0})
+    for sample, labels, value in metric_samples:
+        if sample.endswith('_bucket'):
+            series_labels = tuple(tuple(label) for label in labels if label[0] != 'le')
+            series[series_labels]['buckets'][dict(labels)['le']] += value
+        else:
+            series[tuple(tuple(label) for label in labels)][sample.rsplit('_', 1)[1]] += value
+
+    lines = []
+    for labels, data in sorted(series.items()):
+        cumulative = 0.0
+        for bound in metric.buckets + (float('inf'),):
+            cumulative += data['buckets'].get(format_value(bound), 0.0)
+            bucket_labels = labels + (('le', format_value(bound)),)
+            lines.append(f'{metric.name}_bucket{render_labels(bucket_labels)} {format_value(cumulative)}')
+        lines.append(f'{metric.name}_sum{render_labels(labels)} {format_value(data["sum"])}')
+        lines.append(f'{metric.name}_count{render_labels(labels)} {format_value(data["count"])}')
+    return lines
+
+
+REQUEST_DURATION = Histogram(
+    'voentorg_http_request_duration_seconds', 'Длительность обработки запроса', ['view', 'method']
+)
+REQUESTS = Counter('voentorg_http_requests', 'Обработанные запросы', ['view', 'method', 'status'])
+REQUEST_DB_DURATION = Histogram(
+    'voentorg_http_request_db_seconds', 'Суммарное время SQL-запросов за один запрос', ['view']
+)
+DB_QUERIES = Counter('voentorg_db_queries', 'Выполненные SQL-запросы', ['view'])
+CACHE_REQUESTS = Counter('voentorg_cache_requests', 'Обращения к кэшу', ['cache', 'result'])
+ORDERS_PLACED = Counter('voentorg_orders_placed', 'Оформленные заказы', ['customer'])
+CART_MUTATIONS = Counter('voentorg_cart_mutations', 'Изменения позиций корзины', ['action', 'storage'])
+STOCK_REJECTIONS = Counter(
+    'voentorg_stock_rejections', 'Отказы из-за недостаточного остатка товара', ['source']
+)
+
+
+def record_cache_lookup(cache, hit):
+    """Учитывает обращение к любому кэшу: cache - имя слоя, hit - найдено ли значение"""
+    CACHE_REQUESTS.inc(cache=cache, result='hit' if hit else 'miss')
+
+
+class CacheMetricsMixin:
+    """
+    Примесь к бэкенду кэша Django, считающая попадания и промахи (чтения попадают в трассировку):
+    class InstrumentedRedisCache(CacheMetricsMixin, RedisCache)
+    """
+    _missing = object()
+
+    def get(self, key, default=None, version=None):
+        with span('cache get', 'cache', key=key):
+            value = super().get(key, self._missing, version)
+        record_cache_lookup(f'django:{self.key_prefix or "default"}', value is not self._missing)
+        return default if value is self._missing else value
+
+    def get_many(self, keys, version=None):
+        keys = list(keys)
+        with span('cache get_many', 'cache', keys=len(keys)):
+            found = super().get_many(keys, version)
+        for key in keys:
+            record_cache_lookup(f'django:{self.key_prefix or "default"}', key in found)
+        return found
+
+
+class InstrumentedLocMemCache(CacheMetricsMixin, LocMemCache):
+    """Локальный кэш процесса с учетом попаданий и промахов"""
+
+
+def metrics_view(request):
+    """
+    Метрики в формате Prometheus. Доступны сотрудникам (is_staff) или по заголовку
+    Authorization: Bearer <METRICS_BEARER_TOKEN>, если токен задан в настройках
+    """
+    token = getattr(settings, 'METRICS_BEARER_TOKEN', None)
+    authorization = request.headers.get('Authorization', '')
+    if token and constant_time_compare(authorization, f'Bearer {token}'):
+        return HttpResponse(render_metrics(), content_type=CONTENT_TYPE)
+    return staff_metrics_view(request)
+
+
+@staff_member_required
+def staff_metrics_view(request):
+    return HttpResponse(render_metrics(), content_type=CONTENT_TYPE)
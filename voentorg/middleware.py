@@ -0,0 +1,240 @@
+import logging
+import re
+import time
+
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+from django.utils.text import compress_string
+
+from . import metrics
+from .queries import QueryRecorder
+from .slow_queries import record_slow_queries
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+# Ответы короче этого размера не сжимаем: заголовки и накладные расходы съедают выигрыш
+MIN_COMPRESS_LENGTH = 200
+# Случайное дополнение gzip-ответа для защиты от атаки BREACH (как в django GZipMiddleware)
+GZIP_RANDOM_BYTES = 100
+# Компромисс между степенью сжатия и временем на каждый запрос
+BROTLI_QUALITY = 5
+
+COMPRESSIBLE_TYPES = (
+    'text/',
+    'application/json',
+    'application/javascript',
+    'application/xml',
+    'application/rss+xml',
+    'image/svg+xml',
+)
+
+# Пороги, после которых сводка по SQL пишется в лог как предупреждение
+QUERY_COUNT_BUDGET = 50
+QUERY_TIME_BUDGET = 0.2
+# Сколько самых частых повторяющихся запросов выводить в лог
+REPORTED_DUPLICATES = 3
+
+# Содержимое этих элементов выводится как есть, пробелы в нем значимы
+PRESERVED_HTML_RE = re.compile(r'(<(pre|textarea|script|style)\b.*?</\2\s*>)', re.S | re.I)
+HTML_COMMENT_RE = re.compile(r'<!--(?!\[if).*?-->', re.S)
+NEWLINE_WHITESPACE_RE = re.compile(r'\s*\n\s*')
+
+
+def minify_html(html):
+    """
+    Удаляет HTML-комментарии и отступы. Пробельная последовательность с переводом строки
+    заменяется одним переводом строки, поэтому разметка отображается так же, как до сжатия
+    """
+    parts = PRESERVED_HTML_RE.split(html)
+    result = []
+    # split с двумя группами: текст, сохраняемый элемент, имя тега, текст, ...
+    for index in range(0, len(parts), 3):
+        text = HTML_COMMENT_RE.sub('', parts[index])
+        result.append(NEWLINE_WHITESPACE_RE.sub('\n', text))
+        if index + 1 < len(parts):
+            result.append(parts[index + 1])
+    return ''.join(result).strip()
+
+
+def accepted_encodings(header):
+    """Кодировки из Accept-Encoding, которые клиент не запретил через q=0"""
+    encodings = set()
+    for item in header.split(','):
+        name, _, params = item.partition(';')
+        name = name.strip().lower()
+        quality = re.search(r'q\s*=\s*([\d.]+)', params)
+        try:
+            if quality and float(quality.group(1)) == 0:
+                continue
+        except ValueError:
+            continue
+        if name:
+            encodings.add(name)
+    return encodings
+
+
+class AssetPreloadMiddleware:
+    """
+    Добавляет к HTML-ответу заголовок Link с rel=preload для стилей, подключенных тегом {% asset %}.
+    Браузер (или прокси с поддержкой 103 Early Hints) начинает загрузку стилей, не дожидаясь разбора <head>
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.preload_assets = []
+        response = self.get_response(request)
+
+        if request.preload_assets and response.get('Content-Type', '').startswith('text/html'):
+            links = [
+                f'<{url}>; rel=preload; as={kind}'
+                for url, kind in dict.fromkeys(request.preload_assets)
+            ]
+            if response.has_header('Link'):
+                links.insert(0, response['Link'])
+            response['Link'] = ', '.join(links)
+        return response
+
+
+class ResponseOptimizationMiddleware:
+    """
+    Уменьшает ответы: удаляет отступы из HTML и сжимает текстовые ответы brotli (если установлен
+    пакет brotli) или gzip в зависимости от Accept-Encoding. Потоковые и уже сжатые ответы
+    пропускаются. Размеры до и после пишутся в отладочный лог (DEBUG) с именем представления.
+    Должен стоять в MIDDLEWARE выше всех, кто меняет содержимое ответа.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if response.streaming or response.has_header('Content-Encoding'):
+            return response
+
+        content_type = response.get('Content-Type', '').lower()
+        if not content_type.startswith(COMPRESSIBLE_TYPES):
+            return response
+
+        original_size = len(response.content)
+        if content_type.startswith('text/html') and response.status_code == 200:
+            charset = response.charset or 'utf-8'
+            try:
+                response.content = minify_html(response.content.decode(charset)).encode(charset)
+            except UnicodeDecodeError:
+                pass
+        minified_size = len(response.content)
+
+        # Ответ зависит от Accept-Encoding, даже если этому клиенту он ушел несжатым
+        patch_vary_headers(response, ('Accept-Encoding',))
+        encoding = None
+        if minified_size >= MIN_COMPRESS_LENGTH:
+            encodings = accepted_encodings(request.headers.get('Accept-Encoding', ''))
+            if brotli is not None and 'br' in encodings:
+                encoding = 'br'
+                compressed = brotli.compress(response.content, quality=BROTLI_QUALITY)
+            elif 'gzip' in encodings:
+                encoding = 'gzip'
+                compressed = compress_string(response.content, max_random_bytes=GZIP_RANDOM_BYTES)
+            # Сжатие не всегда выгодно (например, случайные данные)
+            if encoding and len(compressed) < minified_size:
+                response.content = compressed
+                response['Content-Encoding'] = encoding
+                # Сильный ETag относится к несжатому представлению
+                etag = response.get('ETag')
+                if etag and etag.startswith('"'):
+                    response['ETag'] = 'W/' + etag
+            else:
+                encoding = None
+
+        if response.has_header('Content-Length'):
+            response['Content-Length'] = str(len(response.content))
+
+        match = request.resolver_match
+        logger.debug(
+            'Сжатие ответа %s: %d -> %d (без отступов) -> %d (%s), сэкономлено %d байт',
+            match.view_name if match else request.path,
+            original_size,
+            minified_size,
+            len(response.content),
+            encoding or 'без сжатия',
+            original_size - len(response.content),
+        )
+        return response
+
+
+class QueryBudgetMiddleware:
+    """
+    Считает SQL-запросы запроса: количество, суммарное время и повторяющиеся отпечатки (признак N+1).
+    Сводка пишется в лог с именем представления (DEBUG, при превышении бюджета - WARNING);
+    при DEBUG и для сотрудников - и в заголовок Server-Timing, который показывают инструменты разработчика браузера.
+    SELECT-запросы дольше SLOW_QUERY_THRESHOLD сохраняются с планом выполнения в SlowQuery
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        recorder = QueryRecorder(slow_threshold=getattr(settings, 'SLOW_QUERY_THRESHOLD', None))
+        with recorder.record():
+            response = self.get_response(request)
+        request.query_recorder = recorder
+        match = request.resolver_match
+        if recorder.slow:
+            record_slow_queries(recorder.slow, match.view_name if match else '')
+
+        total_time = recorder.total_time
+        # Число и время запросов раскрывают устройство страниц: заголовок только при DEBUG и для сотрудников
+        user = getattr(request, 'user', None)
+        if settings.DEBUG or (user is not None and user.is_staff):
+            response['Server-Timing'] = f'db;dur={total_time * 1000:.1f};desc="SQL: {recorder.count}"'
+
+        over_budget = recorder.count > QUERY_COUNT_BUDGET or total_time > QUERY_TIME_BUDGET
+        level = logging.WARNING if over_budget else logging.DEBUG
+        # Группировка отпечатков нужна только для записи в лог
+        if logger.isEnabledFor(level):
+            duplicates = recorder.duplicates()
+            logger.log(
+                level,
+                'SQL %s: %d запросов за %.1f мс, повторяющихся отпечатков: %d%s',
+                match.view_name if match else request.path,
+                recorder.count,
+                total_time * 1000,
+                len(duplicates),
+                ''.join(f'\n  {count} x {sql}' for sql, count in duplicates[:REPORTED_DUPLICATES]),
+            )
+        return response
+
+
+class MetricsMiddleware:
+    """
+    Собирает метрики запросов: длительность и число ответов по имени представления,
+    время и количество SQL-запросов (из QueryBudgetMiddleware, который должен стоять ниже)
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        started = time.perf_counter()
+        response = self.get_response(request)
+        duration = time.perf_counter() - started
+
+        # Имя маршрута, а не путь: число рядов метрик не зависит от числа товаров и 404-адресов
+        match = request.resolver_match
+        view = match.view_name if match else 'unresolved'
+        metrics.REQUEST_DURATION.observe(duration, view=view, method=request.method)
+        metrics.REQUESTS.inc(view=view, method=request.method, status=response.status_code)
+
+        recorder = getattr(request, 'query_recorder', None)
+        if recorder is not None:
+            metrics.REQUEST_DB_DURATION.observe(recorder.total_time, view=view)
+            if recorder.count:
+                metrics.DB_QUERIES.inc(recorder.count, view=view)
+        return response
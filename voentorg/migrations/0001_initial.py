@@ -0,0 +1,241 @@
+# Generated by Django 5.2.18 on 2026-10-19 18:41
+
+import django.contrib.auth.models
+import django.core.validators
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderStatus',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('code', models.CharField(choices=[('new', 'Новый заказ'), ('processing', 'В обработке'), ('shipped', 'Отправлен'), ('delivered', 'Доставлен'), ('cancelled', 'Отменён')], max_length=20, unique=True, verbose_name='Код статуса')),
+                ('name', models.CharField(max_length=50, verbose_name='Название статуса')),
+                ('description', models.TextField(blank=True, verbose_name='Описание')),
+                ('is_active', models.BooleanField(default=True, verbose_name='Активен')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')),
+            ],
+            options={
+                'verbose_name': 'Статус заказа',
+                'verbose_name_plural': 'Статусы заказов',
+                'ordering': ['id'],
+            },
+        ),
+        migrations.CreateModel(
+            name='CustomUser',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('password', models.CharField(max_length=128, verbose_name='password')),
+                ('last_login', models.DateTimeField(blank=True, null=True, verbose_name='last login')),
+                ('is_superuser', models.BooleanField(default=False, help_text='Designates that this user has all permissions without explicitly assigning them.', verbose_name='superuser status')),
+                ('username', models.CharField(max_length=30, unique=True, validators=[django.core.validators.RegexValidator(message='Логин должен содержать от 3 до 30 символов (буквы, цифры, подчеркивание)', regex='^[a-zA-Z0-9_]{3,30}$')], verbose_name='Логин')),
+                ('email', models.EmailField(max_length=50, unique=True, verbose_name='Электронная почта')),
+                ('first_name', models.CharField(blank=True, max_length=30, verbose_name='Имя')),
+                ('last_name', models.CharField(blank=True, max_length=30, verbose_name='Фамилия')),
+                ('phone', models.CharField(blank=True, max_length=20, null=True, validators=[django.core.validators.RegexValidator(message='Номер телефона должен содержать от 7 до 30 цифр и символов +()- и пробелов', regex='^[0-9+\\-()\\s]{7,30}$')], verbose_name='Телефон')),
+                ('date_joined', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Дата регистрации')),
+                ('is_staff', models.BooleanField(default=False, verbose_name='Администратор')),
+                ('is_active', models.BooleanField(default=True, verbose_name='Активен')),
+                ('groups', models.ManyToManyField(blank=True, help_text='The groups this user belongs to. A user will get all permissions granted to each of their groups.', related_name='user_set', related_query_name='user', to='auth.group', verbose_name='groups')),
+                ('user_permissions', models.ManyToManyField(blank=True, help_text='Specific permissions for this user.', related_name='user_set', related_query_name='user', to='auth.permission', verbose_name='user permissions')),
+            ],
+            options={
+                'verbose_name': 'Пользователь',
+                'verbose_name_plural': 'Пользователи',
+                'ordering': ['-date_joined'],
+            },
+            managers=[
+                ('objects', django.contrib.auth.models.UserManager()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Cart',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Дата обновления')),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='cart', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Корзина',
+                'verbose_name_plural': 'Корзины',
+                'ordering': ['-updated_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='Category',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True, verbose_name='Название категории')),
+                ('slug', models.SlugField(max_length=100, unique=True, verbose_name='URL-слаг')),
+                ('description', models.TextField(blank=True, verbose_name='Описание')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')),
+                ('parent', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='children', to='voentorg.category', verbose_name='Родительская категория')),
+            ],
+            options={
+                'verbose_name': 'Категория',
+                'verbose_name_plural': 'Категории',
+                'ordering': ['name'],
+            },
+        ),
+        migrations.CreateModel(
+            name='Order',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('guest_email', models.EmailField(blank=True, max_length=100, verbose_name='Email гостя')),
+                ('guest_name', models.CharField(blank=True, max_length=100, verbose_name='Имя гостя')),
+                ('total_amount', models.DecimalField(decimal_places=2, max_digits=10, validators=[django.core.validators.MinValueValidator(0)], verbose_name='Общая сумма')),
+                ('shipping_address', models.TextField(blank=True, verbose_name='Адрес доставки')),
+                ('contact_phone', models.CharField(blank=True, max_length=20, validators=[django.core.validators.RegexValidator(message='Номер телефона должен содержать от 7 до 30 цифр и символов +()- и пробелов', regex='^[0-9+\\-()\\s]{7,30}$')], verbose_name='Контактный телефон')),
+                ('notes', models.TextField(blank=True, verbose_name='Комментарий к заказу')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Дата обновления')),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.RESTRICT, related_name='orders', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+                ('status', models.ForeignKey(on_delete=django.db.models.deletion.RESTRICT, related_name='orders', to='voentorg.orderstatus', verbose_name='Статус')),
+            ],
+            options={
+                'verbose_name': 'Заказ',
+                'verbose_name_plural': 'Заказы',
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='Product',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, verbose_name='Название товара')),
+                ('slug', models.SlugField(max_length=200, unique=True, verbose_name='URL-слаг')),
+                ('description', models.TextField(blank=True, verbose_name='Полное описание')),
+                ('short_description', models.CharField(blank=True, max_length=300, verbose_name='Краткое описание')),
+                ('price', models.DecimalField(decimal_places=2, max_digits=10, validators=[django.core.validators.MinValueValidator(0)], verbose_name='Цена')),
+                ('stock', models.IntegerField(default=0, validators=[django.core.validators.MinValueValidator(0)], verbose_name='Количество на складе')),
+                ('image', models.ImageField(blank=True, null=True, upload_to='products/main/', verbose_name='Основное изображение')),
+                ('is_available', models.BooleanField(default=True, verbose_name='Доступен для заказа')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата добавления')),
+                ('category', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='products', to='voentorg.category', verbose_name='Категория')),
+            ],
+            options={
+                'verbose_name': 'Товар',
+                'verbose_name_plural': 'Товары',
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='OrderItem',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.IntegerField(validators=[django.core.validators.MinValueValidator(1)], verbose_name='Количество')),
+                ('price', models.DecimalField(decimal_places=2, max_digits=10, validators=[django.core.validators.MinValueValidator(0)], verbose_name='Цена на момент покупки')),
+                ('subtotal', models.DecimalField(decimal_places=2, max_digits=10, validators=[django.core.validators.MinValueValidator(0)], verbose_name='Подытог')),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='items', to='voentorg.order', verbose_name='Заказ')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.RESTRICT, to='voentorg.product', verbose_name='Товар')),
+            ],
+            options={
+                'verbose_name': 'Элемент заказа',
+                'verbose_name_plural': 'Элементы заказа',
+                'ordering': ['id'],
+            },
+        ),
+        migrations.CreateModel(
+            name='CartItem',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.IntegerField(default=1, validators=[django.core.validators.MinValueValidator(1)], verbose_name='Количество')),
+                ('added_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата добавления')),
+                ('cart', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='items', to='voentorg.cart', verbose_name='Корзина')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='voentorg.product', verbose_name='Товар')),
+            ],
+            options={
+                'verbose_name': 'Элемент корзины',
+                'verbose_name_plural': 'Элементы корзины',
+                'ordering': ['-added_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='ProductImage',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('image', models.ImageField(upload_to='products/images/', verbose_name='Изображение')),
+                ('is_main', models.BooleanField(default=False, verbose_name='Основное изображение')),
+                ('display_order', models.IntegerField(default=0, validators=[django.core.validators.MinValueValidator(0)], verbose_name='Порядок отображения')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='images', to='voentorg.product', verbose_name='Товар')),
+            ],
+            options={
+                'verbose_name': 'Изображение товара',
+                'verbose_name_plural': 'Изображения товаров',
+                'ordering': ['display_order', 'id'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['user'], name='voentorg_or_user_id_d65989_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['status'], name='voentorg_or_status__af5d78_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['created_at'], name='voentorg_or_created_ed35bf_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['guest_email'], name='voentorg_or_guest_e_edaa7a_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['category'], name='voentorg_pr_categor_cfae3c_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['price'], name='voentorg_pr_price_64a950_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['is_available'], name='voentorg_pr_is_avai_9888d0_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['slug'], name='voentorg_pr_slug_e9baad_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='orderitem',
+            index=models.Index(fields=['order'], name='voentorg_or_order_i_ac7cf4_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='orderitem',
+            index=models.Index(fields=['product'], name='voentorg_or_product_b6b817_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='orderitem',
+            index=models.Index(fields=['order', 'product'], name='voentorg_or_order_i_1d23f9_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='cartitem',
+            index=models.Index(fields=['cart', 'product'], name='voentorg_ca_cart_id_1b2f8e_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='cartitem',
+            unique_together={('cart', 'product')},
+        ),
+        migrations.AddIndex(
+            model_name='productimage',
+            index=models.Index(fields=['product', 'is_main'], name='voentorg_pr_product_80e99d_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='productimage',
+            index=models.Index(fields=['product', 'display_order'], name='voentorg_pr_product_d390bf_idx'),
+        ),
+    ]
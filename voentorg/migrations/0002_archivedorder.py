@@ -0,0 +1,65 @@
+# Generated by Django 5.2.18 on 2026-10-19 18:42
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('voentorg', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedOrder',
+            fields=[
+                ('id', models.IntegerField(primary_key=True, serialize=False, verbose_name='Номер заказа')),
+                ('guest_email', models.EmailField(blank=True, max_length=100, verbose_name='Email гостя')),
+                ('guest_name', models.CharField(blank=True, max_length=100, verbose_name='Имя гостя')),
+                ('total_amount', models.DecimalField(decimal_places=2, max_digits=10, verbose_name='Общая сумма')),
+                ('shipping_address', models.TextField(blank=True, verbose_name='Адрес доставки')),
+                ('contact_phone', models.CharField(blank=True, max_length=20, verbose_name='Контактный телефон')),
+                ('notes', models.TextField(blank=True, verbose_name='Комментарий к заказу')),
+                ('created_at', models.DateTimeField(verbose_name='Дата создания')),
+                ('updated_at', models.DateTimeField(verbose_name='Дата обновления')),
+                ('archived_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата архивации')),
+                ('status', models.ForeignKey(on_delete=django.db.models.deletion.RESTRICT, related_name='archived_orders', to='voentorg.orderstatus', verbose_name='Статус')),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.RESTRICT, related_name='archived_orders', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Архивный заказ',
+                'verbose_name_plural': 'Архивные заказы',
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='ArchivedOrderItem',
+            fields=[
+                ('id', models.IntegerField(primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.IntegerField(verbose_name='Количество')),
+                ('price', models.DecimalField(decimal_places=2, max_digits=10, verbose_name='Цена на момент покупки')),
+                ('subtotal', models.DecimalField(decimal_places=2, max_digits=10, verbose_name='Подытог')),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='items', to='voentorg.archivedorder', verbose_name='Заказ')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.RESTRICT, to='voentorg.product', verbose_name='Товар')),
+            ],
+            options={
+                'verbose_name': 'Элемент архивного заказа',
+                'verbose_name_plural': 'Элементы архивных заказов',
+                'ordering': ['id'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='archivedorder',
+            index=models.Index(fields=['user', 'created_at'], name='voentorg_ar_user_id_c5cb83_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='archivedorder',
+            index=models.Index(fields=['guest_email'], name='voentorg_ar_guest_e_57b315_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='archivedorderitem',
+            index=models.Index(fields=['order'], name='voentorg_ar_order_i_d79555_idx'),
+        ),
+    ]
@@ -0,0 +1,62 @@
+# Generated by Django 5.2.18 on 2026-10-19 18:46
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def create_baseline_snapshots(apps, schema_editor):
+    """Текущие остатки становятся исходными снимками журнала"""
+    Product = apps.get_model('voentorg', 'Product')
+    StockSnapshot = apps.get_model('voentorg', 'StockSnapshot')
+    StockSnapshot.objects.bulk_create(
+        [
+            StockSnapshot(product_id=product_id, stock=stock, last_movement_id=0)
+            for product_id, stock in Product.objects.exclude(stock=0).values_list('id', 'stock').iterator()
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('voentorg', '0003_dailysales'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockMovement',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('change', models.IntegerField(verbose_name='Изменение остатка')),
+                ('reason', models.CharField(choices=[('order', 'Заказ'), ('return', 'Возврат'), ('adjustment', 'Корректировка'), ('import', 'Поступление / импорт')], max_length=20, verbose_name='Причина')),
+                ('note', models.CharField(blank=True, max_length=200, verbose_name='Комментарий')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата')),
+                ('order', models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='voentorg.order', verbose_name='Заказ')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_movements', to='voentorg.product', verbose_name='Товар')),
+            ],
+            options={
+                'verbose_name': 'Движение товара',
+                'verbose_name_plural': 'Движения товаров',
+                'ordering': ['-id'],
+                'indexes': [models.Index(fields=['product', 'id'], name='voentorg_st_product_4e0b75_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='StockSnapshot',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('stock', models.IntegerField(verbose_name='Остаток')),
+                ('last_movement_id', models.BigIntegerField(default=0, verbose_name='Последнее учтенное движение')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата снимка')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_snapshots', to='voentorg.product', verbose_name='Товар')),
+            ],
+            options={
+                'verbose_name': 'Снимок остатка',
+                'verbose_name_plural': 'Снимки остатков',
+                'ordering': ['-last_movement_id'],
+                'indexes': [models.Index(fields=['product', 'last_movement_id'], name='voentorg_st_product_0f6eca_idx')],
+            },
+        ),
+        migrations.RunPython(create_baseline_snapshots, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-19 18:47
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('voentorg', '0004_stock_ledger'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReorderSuggestion',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('stock', models.IntegerField(verbose_name='Остаток на момент расчета')),
+                ('daily_demand', models.FloatField(verbose_name='Прогноз спроса, шт./день')),
+                ('days_of_cover', models.FloatField(blank=True, null=True, verbose_name='Хватит на, дней')),
+                ('suggested_quantity', models.IntegerField(verbose_name='Рекомендуется заказать, шт.')),
+                ('computed_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата расчета')),
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='reorder_suggestion', to='voentorg.product', verbose_name='Товар')),
+            ],
+            options={
+                'verbose_name': 'Рекомендация по дозаказу',
+                'verbose_name_plural': 'Рекомендации по дозаказу',
+                'ordering': ['days_of_cover'],
+                'indexes': [models.Index(fields=['days_of_cover'], name='voentorg_re_days_of_d795b7_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.18 on 2026-10-19 19:01
+
+import voentorg.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('voentorg', '0005_reordersuggestion'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='product',
+            name='image',
+            field=models.ImageField(blank=True, null=True, storage=voentorg.storage.product_image_storage, upload_to='products/main/', verbose_name='Основное изображение'),
+        ),
+        migrations.AlterField(
+            model_name='productimage',
+            name='image',
+            field=models.ImageField(storage=voentorg.storage.product_image_storage, upload_to='products/images/', verbose_name='Изображение'),
+        ),
+        migrations.CreateModel(
+            name='MediaBlob',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True, verbose_name='Имя файла')),
+                ('sha256', models.CharField(max_length=64, verbose_name='SHA-256')),
+                ('size', models.BigIntegerField(default=0, verbose_name='Размер, байт')),
+                ('references', models.IntegerField(default=0, verbose_name='Количество ссылок')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата загрузки')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Дата последней загрузки')),
+            ],
+            options={
+                'verbose_name': 'Файл изображения',
+                'verbose_name_plural': 'Файлы изображений',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['references', 'updated_at'], name='voentorg_me_referen_52864f_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-19 19:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('voentorg', '0006_media_blob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='productimage',
+            name='dominant_color',
+            field=models.CharField(blank=True, editable=False, max_length=7, verbose_name='Основной цвет'),
+        ),
+        migrations.AddField(
+            model_name='productimage',
+            name='placeholder',
+            field=models.TextField(blank=True, editable=False, verbose_name='Заглушка (data URI)'),
+        ),
+    ]
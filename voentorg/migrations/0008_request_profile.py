@@ -0,0 +1,40 @@
+# Generated by Django 5.2.18 on 2026-10-19 19:25
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('voentorg', '0007_image_placeholder'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RequestProfile',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('method', models.CharField(max_length=10, verbose_name='Метод')),
+                ('path', models.CharField(max_length=500, verbose_name='Адрес')),
+                ('view_name', models.CharField(blank=True, max_length=100, verbose_name='Представление')),
+                ('status_code', models.PositiveSmallIntegerField(verbose_name='Код ответа')),
+                ('duration_ms', models.FloatField(verbose_name='Длительность, мс')),
+                ('query_count', models.PositiveIntegerField(default=0, verbose_name='SQL-запросов')),
+                ('query_time_ms', models.FloatField(default=0, verbose_name='Время SQL, мс')),
+                ('peak_memory', models.BigIntegerField(blank=True, null=True, verbose_name='Пик памяти, байт')),
+                ('cpu_summary', models.TextField(verbose_name='Функции по суммарному времени')),
+                ('memory_summary', models.TextField(blank=True, verbose_name='Выделения памяти')),
+                ('profile_data', models.BinaryField(verbose_name='Данные pstats')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата')),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='Сотрудник')),
+            ],
+            options={
+                'verbose_name': 'Профиль запроса',
+                'verbose_name_plural': 'Профили запросов',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['view_name', 'created_at'], name='voentorg_re_view_na_ccc982_idx')],
+            },
+        ),
+    ]
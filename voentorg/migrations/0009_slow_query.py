@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-19 19:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('voentorg', '0008_request_profile'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SlowQuery',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fingerprint_hash', models.CharField(max_length=40, unique=True, verbose_name='Хеш отпечатка')),
+                ('fingerprint', models.TextField(verbose_name='Отпечаток запроса')),
+                ('sample_sql', models.TextField(verbose_name='Пример запроса')),
+                ('sample_params', models.TextField(blank=True, verbose_name='Параметры примера (JSON)')),
+                ('database', models.CharField(default='default', max_length=50, verbose_name='База данных')),
+                ('view_name', models.CharField(blank=True, max_length=100, verbose_name='Представление')),
+                ('calls', models.PositiveIntegerField(default=0, verbose_name='Количество')),
+                ('total_time_ms', models.FloatField(default=0, verbose_name='Суммарное время, мс')),
+                ('max_time_ms', models.FloatField(default=0, verbose_name='Максимальное время, мс')),
+                ('plan', models.TextField(blank=True, verbose_name='План выполнения')),
+                ('first_seen', models.DateTimeField(auto_now_add=True, verbose_name='Впервые')),
+                ('last_seen', models.DateTimeField(auto_now=True, verbose_name='Последний раз')),
+            ],
+            options={
+                'verbose_name': 'Медленный запрос',
+                'verbose_name_plural': 'Медленные запросы',
+                'ordering': ['-total_time_ms'],
+            },
+        ),
+    ]
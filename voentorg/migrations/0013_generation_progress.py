@@ -0,0 +1,41 @@
+# Generated by Django 5.2.18 on 2026-10-19 20:23
+
+from django.db import migrations, models
+
+
+def move_progress_from_checkpoints(apps, schema_editor):
+    """Прогресс populate_db хранился в отметках пересчетов под именами populate_db:<вид>:<seed>"""
+    RollupCheckpoint = apps.get_model('voentorg', 'RollupCheckpoint')
+    GenerationProgress = apps.get_model('voentorg', 'GenerationProgress')
+    checkpoints = RollupCheckpoint.objects.filter(name__startswith='populate_db:')
+    for name, last_id in checkpoints.values_list('name', 'last_id'):
+        prefix, kind, seed = name.split(':')
+        GenerationProgress.objects.create(kind=kind, seed=int(seed), created_count=last_id)
+    checkpoints.delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('voentorg', '0012_product_recommendation'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GenerationProgress',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(max_length=20, verbose_name='Вид записей')),
+                ('seed', models.IntegerField(verbose_name='Seed')),
+                ('created_count', models.IntegerField(default=0, verbose_name='Создано записей')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Дата обновления')),
+            ],
+            options={
+                'verbose_name': 'Прогресс генерации данных',
+                'verbose_name_plural': 'Прогресс генерации данных',
+                'ordering': ['kind', 'seed'],
+                'unique_together': {('kind', 'seed')},
+            },
+        ),
+        migrations.RunPython(move_progress_from_checkpoints, migrations.RunPython.noop),
+    ]
@@ -1,8 +1,12 @@
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import AbstractUser
 from django.core.validators import MinValueValidator, MaxValueValidator, RegexValidator
 from django.utils import timezone
+from django.templatetags.static import static
 from django.utils.text import slugify
+from . import metrics
+from .renditions import NO_IMAGE
+from .storage import product_image_storage
 import uuid
 
 
@@ -189,6 +193,12 @@ class Category(models.Model):
         return ' → '.join(path)
 
 
+class ProductQuerySet(models.QuerySet):
+    def available(self):
+        """Товары витрины; частичные индексы Product построены именно под это условие"""
+        return self.filter(is_available=True)
+
+
 class Product(models.Model):
     """Товары"""
     name = models.CharField(
@@ -229,6 +239,7 @@ class Product(models.Model):
     )
     image = models.ImageField(
         upload_to='products/main/',
+        storage=product_image_storage,
         blank=True,
         null=True,
         verbose_name='Основное изображение'
@@ -241,6 +252,13 @@ class Product(models.Model):
         auto_now_add=True,
         verbose_name='Дата добавления'
     )
+    popularity_score = models.FloatField(
+        default=0,
+        editable=False,
+        verbose_name='Популярность'
+    )
+
+    objects = ProductQuerySet.as_manager()
 
     class Meta:
         verbose_name = 'Товар'
@@ -249,8 +267,25 @@ class Product(models.Model):
         indexes = [
             models.Index(fields=['category']),
             models.Index(fields=['price']),
-            models.Index(fields=['is_available']),
             models.Index(fields=['slug']),
+            # Витрина всегда отбирает is_available=True и сортирует по цене, новизне или популярности,
+            # в том числе внутри категории: индексы отдают строки уже в нужном порядке
+            models.Index(
+                fields=['category', 'price'], name='product_category_price_p_idx',
+                condition=models.Q(is_available=True)
+            ),
+            models.Index(
+                fields=['-created_at'], name='product_created_at_p_idx',
+                condition=models.Q(is_available=True)
+            ),
+            models.Index(
+                fields=['-popularity_score', '-created_at'], name='product_popularity_p_idx',
+                condition=models.Q(is_available=True)
+            ),
+            models.Index(
+                fields=['category', '-popularity_score', '-created_at'], name='product_category_popular_p_idx',
+                condition=models.Q(is_available=True)
+            ),
         ]
 
     def __str__(self):
@@ -267,28 +302,74 @@ class Product(models.Model):
                 counter += 1
         super().save(*args, **kwargs)
 
+    @classmethod
+    def allocate_slugs(cls, base_slugs, reserved=()):
+        """
+        Подбирает уникальные slug вида base, base-1, base-2... для списка базовых значений.
+        Занятые slug читаются одним запросом: slug = base или начинается с "base-" (по индексу slug)
+        """
+        bases = sorted(set(base_slugs))
+        if not bases:
+            return []
+
+        condition = models.Q()
+        for base in bases:
+            condition |= models.Q(slug=base) | models.Q(slug__startswith=f'{base}-')
+        taken = set(cls.objects.filter(condition).values_list('slug', flat=True))
+        taken.update(reserved)
+
+        next_suffix = {}
+        slugs = []
+        for base in base_slugs:
+            slug = base
+            counter = next_suffix.get(base, 1)
+            while slug in taken:
+                slug = f"{base}-{counter}"
+                counter += 1
+            next_suffix[base] = counter
+            taken.add(slug)
+            slugs.append(slug)
+        return slugs
+
     @property
     def in_stock(self):
         """Проверка наличия товара на складе"""
         return self.stock > 0
 
-    def decrease_stock(self, quantity):
+    def decrease_stock(self, quantity, reason='order', order=None, note=''):
         """Уменьшает количество товара на складе"""
         if quantity <= 0:
             raise ValueError("Количество должно быть положительным")
-        if self.stock < quantity:
-            raise ValueError(f"Недостаточно товара на складе. Доступно: {self.stock}")
-
-        self.stock -= quantity
-        self.save()
+        self.change_stock(-quantity, reason, order=order, note=note)
 
-    def increase_stock(self, quantity):
+    def increase_stock(self, quantity, reason='return', order=None, note=''):
         """Увеличивает количество товара на складе"""
         if quantity <= 0:
             raise ValueError("Количество должно быть положительным")
-
-        self.stock += quantity
-        self.save()
+        self.change_stock(quantity, reason, order=order, note=note)
+
+    def change_stock(self, change, reason, order=None, note=''):
+        """
+        Записывает движение в журнал остатков и обновляет кэшированный остаток.
+        Проверка наличия и изменение выполняются одним UPDATE, без чтения строки товара.
+        """
+        with transaction.atomic():
+            products = Product.objects.filter(pk=self.pk)
+            if change < 0:
+                products = products.filter(stock__gte=-change)
+            if not products.update(stock=models.F('stock') + change):
+                self.refresh_from_db(fields=['stock'])
+                metrics.STOCK_REJECTIONS.inc(source='stock')
+                raise ValueError(f"Недостаточно товара на складе. Доступно: {self.stock}")
+
+            StockMovement.objects.create(
+                product=self,
+                change=change,
+                reason=reason,
+                order=order,
+                note=note
+            )
+        self.refresh_from_db(fields=['stock'])
 
     @property
     def main_image(self):
@@ -300,8 +381,8 @@ class Product(models.Model):
         first_img = self.images.first()
         if first_img:
             return first_img.image
-        # Или заглушка
-        return "https://via.placeholder.com/300x200/2d5a2d/ffffff?text=Нет+изображения"
+        # Или локальная заглушка
+        return static(NO_IMAGE)
 
     @property
     def all_images(self):
@@ -324,6 +405,7 @@ class ProductImage(models.Model):
     )
     image = models.ImageField(
         upload_to='products/images/',
+        storage=product_image_storage,
         verbose_name='Изображение'
     )
     is_main = models.BooleanField(
@@ -335,6 +417,18 @@ class ProductImage(models.Model):
         validators=[MinValueValidator(0)],
         verbose_name='Порядок отображения'
     )
+    # Заполняются автоматически при сохранении изображения
+    placeholder = models.TextField(
+        blank=True,
+        editable=False,
+        verbose_name='Заглушка (data URI)'
+    )
+    dominant_color = models.CharField(
+        max_length=7,
+        blank=True,
+        editable=False,
+        verbose_name='Основной цвет'
+    )
 
     class Meta:
         verbose_name = 'Изображение товара'
@@ -433,6 +527,7 @@ class Cart(models.Model):
         """Очищает корзину"""
         self.items.all().delete()
 
+    @transaction.atomic
     def create_order(self, shipping_address='', contact_phone='', notes=''):
         """Создает заказ из корзины"""
         if self.total_items == 0:
@@ -463,7 +558,7 @@ class Cart(models.Model):
                 subtotal=item.total_price
             )
             # Уменьшаем количество на складе
-            item.product.decrease_stock(item.quantity)
+            item.product.decrease_stock(item.quantity, order=order)
 
         # Очищаем корзину
         self.clear()
@@ -572,6 +667,8 @@ class Order(models.Model):
         verbose_name='Дата обновления'
     )
 
+    is_archived = False
+
     class Meta:
         verbose_name = 'Заказ'
         verbose_name_plural = 'Заказы'
@@ -679,4 +776,610 @@ class OrderItem(models.Model):
         """Автоматически рассчитываем подытог при сохранении"""
         if not self.subtotal:
             self.subtotal = self.price * self.quantity
-        super().save(*args, **kwargs)
\ No newline at end of file
+        super().save(*args, **kwargs)
+
+class ArchivedOrder(models.Model):
+    """Архив завершённых заказов (доставленные и отменённые)"""
+    id = models.IntegerField(
+        primary_key=True,
+        verbose_name='Номер заказа'
+    )
+    user = models.ForeignKey(
+        CustomUser,
+        on_delete=models.RESTRICT,
+        related_name='archived_orders',
+        verbose_name='Пользователь',
+        null=True,
+        blank=True
+    )
+    guest_email = models.EmailField(
+        max_length=100,
+        blank=True,
+        verbose_name='Email гостя'
+    )
+    guest_name = models.CharField(
+        max_length=100,
+        blank=True,
+        verbose_name='Имя гостя'
+    )
+    status = models.ForeignKey(
+        OrderStatus,
+        on_delete=models.RESTRICT,
+        related_name='archived_orders',
+        verbose_name='Статус'
+    )
+    total_amount = models.DecimalField(
+        max_digits=10,
+        decimal_places=2,
+        verbose_name='Общая сумма'
+    )
+    shipping_address = models.TextField(
+        blank=True,
+        verbose_name='Адрес доставки'
+    )
+    contact_phone = models.CharField(
+        max_length=20,
+        blank=True,
+        verbose_name='Контактный телефон'
+    )
+    notes = models.TextField(
+        blank=True,
+        verbose_name='Комментарий к заказу'
+    )
+    created_at = models.DateTimeField(
+        verbose_name='Дата создания'
+    )
+    updated_at = models.DateTimeField(
+        verbose_name='Дата обновления'
+    )
+    archived_at = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name='Дата архивации'
+    )
+
+    # Поля, которые переносятся из Order один в один
+    COPIED_FIELDS = [
+        'id', 'user_id', 'guest_email', 'guest_name', 'status_id', 'total_amount',
+        'shipping_address', 'contact_phone', 'notes', 'created_at', 'updated_at',
+    ]
+
+    # Статусы, в которых заказ считается завершённым и может быть перенесён в архив
+    ARCHIVABLE_STATUSES = ['delivered', 'cancelled']
+
+    is_archived = True
+
+    class Meta:
+        verbose_name = 'Архивный заказ'
+        verbose_name_plural = 'Архивные заказы'
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['user', 'created_at']),
+            models.Index(fields=['guest_email']),
+        ]
+
+    def __str__(self):
+        if self.user:
+            return f"Архивный заказ #{self.id} от {self.user.username} ({self.total_amount} руб.)"
+        else:
+            return f"Архивный заказ #{self.id} от гостя {self.guest_email} ({self.total_amount} руб.)"
+
+    @property
+    def customer_name(self):
+        """Имя заказчика"""
+        if self.user:
+            return self.user.get_full_name() or self.user.username
+        else:
+            return self.guest_name or self.guest_email
+
+    @property
+    def customer_email(self):
+        """Email заказчика"""
+        if self.user:
+            return self.user.email
+        else:
+            return self.guest_email
+
+    @property
+    def total_items(self):
+        """Общее количество товаров в заказе"""
+        return sum(item.quantity for item in self.items.all())
+
+
+class ArchivedOrderItem(models.Model):
+    """Элементы архивных заказов"""
+    id = models.IntegerField(
+        primary_key=True,
+        verbose_name='ID'
+    )
+    order = models.ForeignKey(
+        ArchivedOrder,
+        on_delete=models.CASCADE,
+        related_name='items',
+        verbose_name='Заказ'
+    )
+    product = models.ForeignKey(
+        Product,
+        on_delete=models.RESTRICT,
+        verbose_name='Товар'
+    )
+    quantity = models.IntegerField(
+        verbose_name='Количество'
+    )
+    price = models.DecimalField(
+        max_digits=10,
+        decimal_places=2,
+        verbose_name='Цена на момент покупки'
+    )
+    subtotal = models.DecimalField(
+        max_digits=10,
+        decimal_places=2,
+        verbose_name='Подытог'
+    )
+
+    COPIED_FIELDS = ['id', 'order_id', 'product_id', 'quantity', 'price', 'subtotal']
+
+    class Meta:
+        verbose_name = 'Элемент архивного заказа'
+        verbose_name_plural = 'Элементы архивных заказов'
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['order']),
+        ]
+
+    def __str__(self):
+        return f"{self.product.name} x {self.quantity} (в архивном заказе #{self.order_id})"
+
+
+
+class DailySales(models.Model):
+    """Дневные агрегаты продаж: дата × товар (с категорией товара на момент пересчета)"""
+    date = models.DateField(
+        verbose_name='Дата'
+    )
+    product = models.ForeignKey(
+        Product,
+        on_delete=models.CASCADE,
+        related_name='daily_sales',
+        verbose_name='Товар'
+    )
+    category = models.ForeignKey(
+        Category,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='daily_sales',
+        verbose_name='Категория'
+    )
+    quantity = models.IntegerField(
+        default=0,
+        verbose_name='Продано, шт.'
+    )
+    revenue = models.DecimalField(
+        max_digits=14,
+        decimal_places=2,
+        default=0,
+        verbose_name='Выручка'
+    )
+
+    class Meta:
+        verbose_name = 'Продажи за день'
+        verbose_name_plural = 'Продажи по дням'
+        ordering = ['-date', 'product']
+        unique_together = ['date', 'product']
+        indexes = [
+            models.Index(fields=['date', 'category']),
+        ]
+
+    def __str__(self):
+        return f"{self.date}: {self.product_id} x {self.quantity} ({self.revenue} руб.)"
+
+
+class RollupCheckpoint(models.Model):
+    """Отметка последней обработанной записи для инкрементальных пересчётов"""
+    name = models.CharField(
+        max_length=50,
+        unique=True,
+        verbose_name='Название'
+    )
+    last_id = models.BigIntegerField(
+        default=0,
+        verbose_name='Последний обработанный ID'
+    )
+    updated_at = models.DateTimeField(
+        auto_now=True,
+        verbose_name='Дата обновления'
+    )
+
+    class Meta:
+        verbose_name = 'Отметка пересчёта'
+        verbose_name_plural = 'Отметки пересчётов'
+        ordering = ['name']
+
+    def __str__(self):
+        return f"{self.name}: {self.last_id}"
+
+
+class GenerationProgress(models.Model):
+    """Прогресс генерации тестовых данных populate_db: сколько записей вида kind создано для seed"""
+    kind = models.CharField(
+        max_length=20,
+        verbose_name='Вид записей'
+    )
+    seed = models.IntegerField(
+        verbose_name='Seed'
+    )
+    created_count = models.IntegerField(
+        default=0,
+        verbose_name='Создано записей'
+    )
+    updated_at = models.DateTimeField(
+        auto_now=True,
+        verbose_name='Дата обновления'
+    )
+
+    class Meta:
+        verbose_name = 'Прогресс генерации данных'
+        verbose_name_plural = 'Прогресс генерации данных'
+        ordering = ['kind', 'seed']
+        unique_together = ['kind', 'seed']
+
+    def __str__(self):
+        return f"{self.kind} (seed={self.seed}): {self.created_count}"
+
+
+class StockMovement(models.Model):
+    """Журнал движения товара на складе (только добавление записей)"""
+    REASON_ORDER = 'order'
+    REASON_RETURN = 'return'
+    REASON_ADJUSTMENT = 'adjustment'
+    REASON_IMPORT = 'import'
+    REASON_CHOICES = [
+        (REASON_ORDER, 'Заказ'),
+        (REASON_RETURN, 'Возврат'),
+        (REASON_ADJUSTMENT, 'Корректировка'),
+        (REASON_IMPORT, 'Поступление / импорт'),
+    ]
+
+    product = models.ForeignKey(
+        Product,
+        on_delete=models.CASCADE,
+        related_name='stock_movements',
+        verbose_name='Товар'
+    )
+    change = models.IntegerField(
+        verbose_name='Изменение остатка'
+    )
+    reason = models.CharField(
+        max_length=20,
+        choices=REASON_CHOICES,
+        verbose_name='Причина'
+    )
+    # Без ограничения внешнего ключа: заказ может быть перенесен в архив, а запись журнала остается
+    order = models.ForeignKey(
+        Order,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        null=True,
+        blank=True,
+        related_name='+',
+        verbose_name='Заказ'
+    )
+    note = models.CharField(
+        max_length=200,
+        blank=True,
+        verbose_name='Комментарий'
+    )
+    created_at = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name='Дата'
+    )
+
+    class Meta:
+        verbose_name = 'Движение товара'
+        verbose_name_plural = 'Движения товаров'
+        ordering = ['-id']
+        indexes = [
+            models.Index(fields=['product', 'id']),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id}: {self.change:+d} ({self.get_reason_display()})"
+
+
+class StockSnapshot(models.Model):
+    """Снимок остатка товара: остаток = снимок + движения после last_movement_id"""
+    product = models.ForeignKey(
+        Product,
+        on_delete=models.CASCADE,
+        related_name='stock_snapshots',
+        verbose_name='Товар'
+    )
+    stock = models.IntegerField(
+        verbose_name='Остаток'
+    )
+    last_movement_id = models.BigIntegerField(
+        default=0,
+        verbose_name='Последнее учтенное движение'
+    )
+    created_at = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name='Дата снимка'
+    )
+
+    class Meta:
+        verbose_name = 'Снимок остатка'
+        verbose_name_plural = 'Снимки остатков'
+        ordering = ['-last_movement_id']
+        indexes = [
+            models.Index(fields=['product', 'last_movement_id']),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id}: {self.stock} (движение #{self.last_movement_id})"
+
+
+class ReorderSuggestion(models.Model):
+    """Рекомендации по дозаказу товара на основе прогноза спроса"""
+    product = models.OneToOneField(
+        Product,
+        on_delete=models.CASCADE,
+        related_name='reorder_suggestion',
+        verbose_name='Товар'
+    )
+    stock = models.IntegerField(
+        verbose_name='Остаток на момент расчета'
+    )
+    daily_demand = models.FloatField(
+        verbose_name='Прогноз спроса, шт./день'
+    )
+    days_of_cover = models.FloatField(
+        null=True,
+        blank=True,
+        verbose_name='Хватит на, дней'
+    )
+    suggested_quantity = models.IntegerField(
+        verbose_name='Рекомендуется заказать, шт.'
+    )
+    computed_at = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name='Дата расчета'
+    )
+
+    class Meta:
+        verbose_name = 'Рекомендация по дозаказу'
+        verbose_name_plural = 'Рекомендации по дозаказу'
+        ordering = ['days_of_cover']
+        indexes = [
+            models.Index(fields=['days_of_cover']),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id}: заказать {self.suggested_quantity} шт."
+
+
+class MediaBlob(models.Model):
+    """Файл изображения в хранилище по содержимому и количество ссылок на него"""
+    name = models.CharField(
+        max_length=255,
+        unique=True,
+        verbose_name='Имя файла'
+    )
+    sha256 = models.CharField(
+        max_length=64,
+        verbose_name='SHA-256'
+    )
+    size = models.BigIntegerField(
+        default=0,
+        verbose_name='Размер, байт'
+    )
+    references = models.IntegerField(
+        default=0,
+        verbose_name='Количество ссылок'
+    )
+    created_at = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name='Дата загрузки'
+    )
+    updated_at = models.DateTimeField(
+        auto_now=True,
+        verbose_name='Дата последней загрузки'
+    )
+
+    class Meta:
+        verbose_name = 'Файл изображения'
+        verbose_name_plural = 'Файлы изображений'
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['references', 'updated_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.name} ({self.references})"
+
+    @classmethod
+    def change_references(cls, names, delta=1):
+        """Изменяет счетчики ссылок для списка имен (имя может повторяться)"""
+        counts = {}
+        for name in names:
+            if name:
+                counts[name] = counts.get(name, 0) + delta
+        # Один UPDATE на каждое встречающееся значение изменения
+        by_change = {}
+        for name, change in counts.items():
+            by_change.setdefault(change, []).append(name)
+        for change, group in by_change.items():
+            cls.objects.filter(name__in=group).update(references=models.F('references') + change)
+
+
+class RequestProfile(models.Model):
+    """Профиль одного запроса, снятый по запросу сотрудника (cProfile и, по желанию, tracemalloc)"""
+    user = models.ForeignKey(
+        CustomUser,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='+',
+        verbose_name='Сотрудник'
+    )
+    method = models.CharField(
+        max_length=10,
+        verbose_name='Метод'
+    )
+    path = models.CharField(
+        max_length=500,
+        verbose_name='Адрес'
+    )
+    view_name = models.CharField(
+        max_length=100,
+        blank=True,
+        verbose_name='Представление'
+    )
+    status_code = models.PositiveSmallIntegerField(
+        verbose_name='Код ответа'
+    )
+    duration_ms = models.FloatField(
+        verbose_name='Длительность, мс'
+    )
+    query_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name='SQL-запросов'
+    )
+    query_time_ms = models.FloatField(
+        default=0,
+        verbose_name='Время SQL, мс'
+    )
+    peak_memory = models.BigIntegerField(
+        null=True,
+        blank=True,
+        verbose_name='Пик памяти, байт'
+    )
+    cpu_summary = models.TextField(
+        verbose_name='Функции по суммарному времени'
+    )
+    memory_summary = models.TextField(
+        blank=True,
+        verbose_name='Выделения памяти'
+    )
+    profile_data = models.BinaryField(
+        verbose_name='Данные pstats'
+    )
+    created_at = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name='Дата'
+    )
+
+    class Meta:
+        verbose_name = 'Профиль запроса'
+        verbose_name_plural = 'Профили запросов'
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['view_name', 'created_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.method} {self.path} ({self.duration_ms:.0f} мс)"
+
+
+class SlowQuery(models.Model):
+    """Медленный SQL-запрос: статистика по отпечатку и план выполнения (EXPLAIN) для советника индексов"""
+    fingerprint_hash = models.CharField(
+        max_length=40,
+        unique=True,
+        verbose_name='Хеш отпечатка'
+    )
+    fingerprint = models.TextField(
+        verbose_name='Отпечаток запроса'
+    )
+    sample_sql = models.TextField(
+        verbose_name='Пример запроса'
+    )
+    sample_params = models.TextField(
+        blank=True,
+        verbose_name='Параметры примера (JSON)'
+    )
+    database = models.CharField(
+        max_length=50,
+        default='default',
+        verbose_name='База данных'
+    )
+    view_name = models.CharField(
+        max_length=100,
+        blank=True,
+        verbose_name='Представление'
+    )
+    calls = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Количество'
+    )
+    total_time_ms = models.FloatField(
+        default=0,
+        verbose_name='Суммарное время, мс'
+    )
+    max_time_ms = models.FloatField(
+        default=0,
+        verbose_name='Максимальное время, мс'
+    )
+    plan = models.TextField(
+        blank=True,
+        verbose_name='План выполнения'
+    )
+    first_seen = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name='Впервые'
+    )
+    last_seen = models.DateTimeField(
+        auto_now=True,
+        verbose_name='Последний раз'
+    )
+
+    class Meta:
+        verbose_name = 'Медленный запрос'
+        verbose_name_plural = 'Медленные запросы'
+        ordering = ['-total_time_ms']
+
+    def __str__(self):
+        return f"{self.fingerprint[:80]} ({self.calls} x, {self.total_time_ms:.0f} мс)"
+
+
+class ProductRecommendation(models.Model):
+    """Рекомендация к товару: «покупают вместе» по заказам или товар той же категории"""
+    KIND_BOUGHT_TOGETHER = 'together'
+    KIND_CATEGORY = 'category'
+    KIND_CHOICES = [
+        (KIND_BOUGHT_TOGETHER, 'Покупают вместе'),
+        (KIND_CATEGORY, 'Из той же категории'),
+    ]
+
+    product = models.ForeignKey(
+        Product,
+        on_delete=models.CASCADE,
+        related_name='recommendations',
+        verbose_name='Товар'
+    )
+    recommended = models.ForeignKey(
+        Product,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Рекомендуемый товар'
+    )
+    kind = models.CharField(
+        max_length=10,
+        choices=KIND_CHOICES,
+        verbose_name='Источник'
+    )
+    rank = models.PositiveSmallIntegerField(
+        verbose_name='Позиция'
+    )
+    score = models.FloatField(
+        default=0,
+        verbose_name='Оценка'
+    )
+
+    class Meta:
+        verbose_name = 'Рекомендация товара'
+        verbose_name_plural = 'Рекомендации товаров'
+        ordering = ['product', 'rank']
+        unique_together = ['product', 'rank']
+
+    def __str__(self):
+        return f"{self.product_id} -> {self.recommended_id} ({self.get_kind_display()}, #{self.rank})"
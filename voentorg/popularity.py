@@ -0,0 +1,109 @@
+from datetime import date
+
+from django.db import transaction
+from django.db.models import Case, F, FloatField, Sum, Value, When
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from .feeds import batched
+from .models import Product, RollupCheckpoint
+from .rollups import POPULARITY_CHECKPOINT
+
+# Популярность - сумма продаж с экспоненциальным затуханием: продажа половинит вес каждые HALF_LIFE_DAYS.
+# Вес хранится относительно даты отсчета (вес продажи в день d = 2 ** ((d - отсчет) / HALF_LIFE_DAYS)),
+# поэтому порядок по popularity_score совпадает с порядком по затухшей сумме в любой момент
+# и обновлять нужно только товары с новыми продажами, без пересчета всего каталога.
+HALF_LIFE_DAYS = 14
+
+# Вес 2 ** 1024 уже не помещается в float64: при HALF_LIFE_DAYS = 14 это 39 лет от даты отсчета.
+# Поэтому дата отсчета подвижная (номер дня хранится в RollupCheckpoint EPOCH_CHECKPOINT):
+# раз в REBASE_AFTER_HALF_LIVES периодов (~10 лет) update_popularity переносит ее на сегодня
+# и делит все оценки на вес новой даты - порядок товаров при этом не меняется
+EPOCH = date(2024, 1, 1)
+EPOCH_CHECKPOINT = 'popularity_epoch'
+REBASE_AFTER_HALF_LIVES = 256
+
+# Сколько товаров обновлять одним UPDATE ... CASE
+UPDATE_CHUNK_SIZE = 500
+
+
+def sale_weight(day, epoch=EPOCH):
+    """Вес одной проданной единицы товара в день day относительно даты отсчета epoch"""
+    return 2.0 ** ((day - epoch).days / HALF_LIFE_DAYS)
+
+
+def current_epoch():
+    """Текущая дата отсчета весов"""
+    ordinal = RollupCheckpoint.objects.filter(name=EPOCH_CHECKPOINT).values_list('last_id', flat=True).first()
+    return date.fromordinal(ordinal) if ordinal else EPOCH
+
+
+def current_popularity(score, today=None, epoch=None):
+    """Популярность на сегодня в проданных штуках (с учетом затухания)"""
+    return score / sale_weight(today or date.today(), epoch or current_epoch())
+
+
+def add_scores(deltas):
+    """
+    Прибавляет {товар: вес} к popularity_score. Прибавляем через F(), а не записываем прочитанное
+    значение: параллельные изменения не теряются. Отрицательный итог (погрешность вычитания) - 0
+    """
+    for chunk in batched(sorted(deltas.items()), UPDATE_CHUNK_SIZE):
+        Product.objects.filter(pk__in=[product_id for product_id, delta in chunk]).update(
+            popularity_score=Greatest(
+                F('popularity_score') + Case(
+                    *[When(pk=product_id, then=Value(delta)) for product_id, delta in chunk],
+                    default=Value(0.0),
+                    output_field=FloatField(),
+                ),
+                Value(0.0),
+            )
+        )
+
+
+@transaction.atomic
+def rebase_epoch(today=None):
+    """
+    Переносит дату отсчета на today, если с прежней прошло REBASE_AFTER_HALF_LIVES периодов.
+    Возвращает True, если оценки пересчитаны (тогда изменились все товары)
+    """
+    today = today or timezone.localdate()
+    # Блокировка отметки пересчета: перенос не пересекается с обработкой пакета и отменой заказа
+    RollupCheckpoint.objects.select_for_update().get_or_create(name=POPULARITY_CHECKPOINT)
+    checkpoint, created = RollupCheckpoint.objects.select_for_update().get_or_create(
+        name=EPOCH_CHECKPOINT, defaults={'last_id': EPOCH.toordinal()}
+    )
+    epoch = date.fromordinal(checkpoint.last_id)
+    if (today - epoch).days < REBASE_AFTER_HALF_LIVES * HALF_LIFE_DAYS:
+        return False
+
+    Product.objects.exclude(popularity_score=0).update(
+        popularity_score=F('popularity_score') / sale_weight(today, epoch)
+    )
+    checkpoint.last_id = today.toordinal()
+    checkpoint.save()
+    return True
+
+
+@transaction.atomic
+def adjust_for_order(order, sign):
+    """
+    Снимает (sign=-1) или возвращает (sign=1) продажи заказа, уже учтенные update_popularity:
+    отмена заказа после пересчета. Позиции после отметки пересчет сам учтет по текущему статусу.
+    Возвращает id измененных товаров
+    """
+    checkpoint = RollupCheckpoint.objects.select_for_update().filter(name=POPULARITY_CHECKPOINT).first()
+    if checkpoint is None:
+        return []
+    weight = sale_weight(timezone.localdate(order.created_at), current_epoch())
+    deltas = {
+        row['product_id']: sign * row['total_quantity'] * weight
+        for row in (
+            order.items.filter(id__lte=checkpoint.last_id)
+            .order_by()
+            .values('product_id')
+            .annotate(total_quantity=Sum('quantity'))
+        )
+    }
+    add_scores(deltas)
+    return sorted(deltas)
@@ -0,0 +1,133 @@
+import cProfile
+import io
+import logging
+import marshal
+import pstats
+import threading
+import time
+import tracemalloc
+
+from .models import RequestProfile
+from .queries import QueryRecorder
+
+logger = logging.getLogger(__name__)
+
+# Профилирование включается параметром ?_profile=1 (или заголовком X-Profile: 1),
+# значение memory дополнительно снимает выделения памяти через tracemalloc
+PROFILE_PARAMETER = '_profile'
+PROFILE_HEADER = 'X-Profile'
+MEMORY_MODE = 'memory'
+# Сколько функций и мест выделения памяти сохранять в сводках
+TOP_FUNCTIONS = 40
+TOP_ALLOCATIONS = 25
+# Глубина стека для tracemalloc: больше - точнее сводка, но медленнее запрос
+TRACEMALLOC_FRAMES = 10
+
+# Профилировщик в процессе может быть только один: параллельные запросы с флагом выполняются как обычно
+_profile_lock = threading.Lock()
+
+
+def profile_mode(request):
+    """None, 'cpu' или 'memory' по параметру или заголовку запроса; только для сотрудников"""
+    value = request.GET.get(PROFILE_PARAMETER) or request.headers.get(PROFILE_HEADER)
+    if not value or value == '0':
+        return None
+    user = getattr(request, 'user', None)
+    if user is None or not user.is_staff:
+        return None
+    return MEMORY_MODE if value == MEMORY_MODE else 'cpu'
+
+
+def cpu_summary(stats, limit=TOP_FUNCTIONS):
+    """Первые функции по суммарному (cumulative) времени в текстовом виде pstats"""
+    output = io.StringIO()
+    stats.stream = output
+    stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(limit)
+    return output.getvalue().strip()
+
+
+def memory_summary(before, after, limit=TOP_ALLOCATIONS):
+    """Места, где за время запроса выделено больше всего памяти"""
+    # Собственные выделения tracemalloc в сводку не попадают
+    own = [tracemalloc.Filter(False, tracemalloc.__file__)]
+    differences = after.filter_traces(own).compare_to(before.filter_traces(own), 'lineno')
+    lines = [
+        f'{difference.size_diff / 1024:+10.1f} КиБ {difference.count_diff:+7d} блоков  '
+        f'{difference.traceback[0].filename}:{difference.traceback[0].lineno}'
+        for difference in differences[:limit]
+        if difference.size_diff
+    ]
+    return '\n'.join(lines)
+
+
+class ProfilingMiddleware:
+    """
+    Профилирует запрос сотрудника с флагом ?_profile=1 (?_profile=memory - вместе с памятью)
+    и сохраняет результат в RequestProfile; номер профиля возвращается в заголовке X-Profile-Id.
+    Должен стоять после AuthenticationMiddleware
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        mode = profile_mode(request)
+        if mode is None:
+            return self.get_response(request)
+        if not _profile_lock.acquire(blocking=False):
+            logger.warning('Профилирование %s пропущено: уже идет другое', request.path)
+            return self.get_response(request)
+        try:
+            return self.profile(request, mode)
+        finally:
+            _profile_lock.release()
+
+    def profile(self, request, mode):
+        trace_memory = mode == MEMORY_MODE
+        started_tracemalloc = False
+        if trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+            started_tracemalloc = True
+        before = tracemalloc.take_snapshot() if trace_memory else None
+        if trace_memory:
+            tracemalloc.reset_peak()
+
+        recorder = QueryRecorder()
+        profiler = cProfile.Profile()
+        started = time.perf_counter()
+        with recorder.record():
+            profiler.enable()
+            try:
+                response = self.get_response(request)
+            finally:
+                profiler.disable()
+        duration = time.perf_counter() - started
+
+        peak_memory = None
+        allocations = ''
+        if trace_memory:
+            peak_memory = tracemalloc.get_traced_memory()[1]
+            allocations = memory_summary(before, tracemalloc.take_snapshot())
+            if started_tracemalloc:
+                tracemalloc.stop()
+
+        profiler.create_stats()
+        match = request.resolver_match
+        profile = RequestProfile.objects.create(
+            user=request.user,
+            method=request.method,
+            path=request.get_full_path()[:500],
+            view_name=match.view_name if match else '',
+            status_code=response.status_code,
+            duration_ms=duration * 1000,
+            query_count=recorder.count,
+            query_time_ms=recorder.total_time * 1000,
+            peak_memory=peak_memory,
+            cpu_summary=cpu_summary(pstats.Stats(profiler)),
+            memory_summary=allocations,
+            # Тот же формат, что у cProfile -o: файл открывается в snakeviz и pstats
+            profile_data=marshal.dumps(profiler.stats),
+        )
+        response['X-Profile-Id'] = str(profile.pk)
+        logger.info('Профиль #%d: %s %s за %.1f мс', profile.pk, request.method, request.path, duration * 1000)
+        return response
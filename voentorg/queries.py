@@ -0,0 +1,68 @@
+import re
+import time
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+
+from django.db import connections
+
+# Значения в SQL заменяются на ?, чтобы одинаковые по форме запросы получили один отпечаток
+STRING_LITERAL_RE = re.compile(r"'(?:[^']|'')*'")
+NUMBER_LITERAL_RE = re.compile(r'\b\d+(?:\.\d+)?\b')
+PLACEHOLDER_RE = re.compile(r'%s|\?')
+IN_LIST_RE = re.compile(r'\bIN\s*\((?:\s*\?\s*,?)+\)', re.I)
+WHITESPACE_RE = re.compile(r'\s+')
+
+
+def fingerprint(sql):
+    """Нормализованный текст запроса: без значений и с одним ? вместо списка IN (...)"""
+    sql = STRING_LITERAL_RE.sub('?', sql)
+    sql = NUMBER_LITERAL_RE.sub('?', sql)
+    sql = PLACEHOLDER_RE.sub('?', sql)
+    sql = IN_LIST_RE.sub('IN (...)', sql)
+    return WHITESPACE_RE.sub(' ', sql).strip()
+
+
+class QueryRecorder:
+    """
+    Обертка для connection.execute_wrapper: запоминает текст и длительность каждого запроса.
+    В отличие от connection.queries работает и при DEBUG=False.
+    SELECT-запросы дольше slow_threshold секунд сохраняются в slow вместе с параметрами и базой
+    """
+
+    def __init__(self, slow_threshold=None):
+        self.queries = []
+        self.slow_threshold = slow_threshold
+        self.slow = []
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - started
+            self.queries.append((sql, duration))
+            if self.slow_threshold is not None and duration >= self.slow_threshold and not many \
+                    and sql.lstrip().upper().startswith('SELECT'):
+                self.slow.append((sql, params, duration, context['connection'].alias))
+
+    @contextmanager
+    def record(self):
+        """Записывает запросы ко всем базам данных внутри блока with"""
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(self))
+            yield self
+
+    @property
+    def count(self):
+        return len(self.queries)
+
+    @property
+    def total_time(self):
+        """Суммарное время запросов в секундах"""
+        return sum(duration for sql, duration in self.queries)
+
+    def duplicates(self):
+        """Повторяющиеся отпечатки запросов (признак N+1) по убыванию числа повторов"""
+        counter = Counter(fingerprint(sql) for sql, duration in self.queries)
+        return [(sql, count) for sql, count in counter.most_common() if count > 1]
@@ -0,0 +1,134 @@
+import numpy as np
+from django.db import transaction
+
+from .feeds import batched
+from .models import OrderItem, Product, ProductRecommendation
+
+# Сколько рекомендаций хранить для каждого товара
+TOP_K = 8
+# Минимальное число общих заказов, чтобы пара считалась «покупают вместе»
+MIN_SUPPORT = 2
+# Заказы крупнее (оптовые) не учитываются: число пар в заказе растет как квадрат его размера
+MAX_BASKET = 50
+INSERT_BATCH_SIZE = 5000
+
+
+def load_order_items():
+    """Пары (заказ, товар) по всем заказам, кроме отмененных"""
+    rows = (
+        OrderItem.objects.exclude(order__status__code='cancelled')
+        .order_by()
+        .values_list('order_id', 'product_id')
+    )
+    pairs = np.array(list(rows.iterator(chunk_size=10000)), dtype=np.int64).reshape(-1, 2)
+    return pairs[:, 0], pairs[:, 1]
+
+
+def cooccurrence(order_ids, product_ids, max_basket=MAX_BASKET):
+    """
+    Разреженная матрица совместных покупок без циклов по заказам.
+    Возвращает (products, left, right, counts, frequency): products - id товаров, left/right - индексы
+    пары в products, counts - число общих заказов пары, frequency - число заказов с товаром
+    """
+    pairs = np.unique(np.stack([order_ids, product_ids], axis=1), axis=0)
+    orders = pairs[:, 0]
+    products, product_index = np.unique(pairs[:, 1], return_inverse=True)
+    frequency = np.bincount(product_index, minlength=len(products))
+
+    # Позиции отсортированы по заказу: у каждой позиции есть начало и размер ее заказа
+    _, starts, sizes = np.unique(orders, return_index=True, return_counts=True)
+    item_starts = np.repeat(starts, sizes)
+    item_sizes = np.repeat(sizes, sizes)
+    items = np.flatnonzero((item_sizes >= 2) & (item_sizes <= max_basket))
+
+    # Каждая позиция в паре со всеми позициями своего заказа (включая себя, они отбрасываются ниже)
+    repeats = item_sizes[items]
+    left = np.repeat(product_index[items], repeats)
+    offsets = np.arange(repeats.sum()) - np.repeat(np.cumsum(repeats) - repeats, repeats)
+    right = product_index[np.repeat(item_starts[items], repeats) + offsets]
+    distinct = left != right
+
+    keys, counts = np.unique(left[distinct] * len(products) + right[distinct], return_counts=True)
+    return products, keys // len(products), keys % len(products), counts, frequency
+
+
+def top_neighbours(left, right, counts, frequency, eligible, top_k=TOP_K, min_support=MIN_SUPPORT):
+    """
+    Первые top_k соседей каждого товара по косинусной мере (общие заказы / sqrt(произведения частот)):
+    она не дает бестселлерам попасть в рекомендации ко всему каталогу. eligible - маска допустимых соседей
+    """
+    keep = (counts >= min_support) & eligible[right]
+    left, right, counts = left[keep], right[keep], counts[keep]
+    score = counts / np.sqrt(frequency[left].astype(np.float64) * frequency[right])
+
+    order = np.lexsort((-counts, -score, left))
+    left, right, score = left[order], right[order], score[order]
+    positions = np.arange(len(left))
+    group_start = np.maximum.accumulate(np.where(np.r_[True, left[1:] != left[:-1]], positions, 0)) \
+        if len(left) else positions
+    keep = positions - group_start < top_k
+    return left[keep], right[keep], score[keep]
+
+
+def build_recommendations(top_k=TOP_K, min_support=MIN_SUPPORT, max_basket=MAX_BASKET):
+    """
+    Пересобирает таблицу ProductRecommendation: сначала «покупают вместе», недостающие позиции -
+    самые популярные доступные товары той же категории. Возвращает (товаров с покупками вместе, строк)
+    """
+    catalog = list(Product.objects.order_by().values_list('id', 'category_id'))
+    available = list(
+        Product.objects.available().order_by('-popularity_score', '-created_at').values_list('id', 'category_id')
+    )
+    available_ids = np.array([product_id for product_id, category_id in available], dtype=np.int64)
+
+    together = {}
+    order_ids, product_ids = load_order_items()
+    if len(order_ids):
+        products, left, right, counts, frequency = cooccurrence(order_ids, product_ids, max_basket)
+        left, right, score = top_neighbours(
+            left, right, counts, frequency, np.isin(products, available_ids), top_k, min_support
+        )
+        for product_id, recommended_id, value in zip(products[left].tolist(), products[right].tolist(), score.tolist()):
+            together.setdefault(product_id, []).append((recommended_id, value))
+
+    # Запас на случай, если среди лучших в категории сам товар или уже выбранные соседи
+    by_category = {}
+    for product_id, category_id in available:
+        if category_id is not None and len(by_category.setdefault(category_id, [])) < 2 * top_k + 1:
+            by_category[category_id].append(product_id)
+
+    def rows():
+        for product_id, category_id in catalog:
+            chosen = together.get(product_id, [])
+            taken = {product_id} | {recommended_id for recommended_id, value in chosen}
+            fallback = [
+                candidate for candidate in by_category.get(category_id, []) if candidate not in taken
+            ][:top_k - len(chosen)]
+            for rank, (recommended_id, value) in enumerate(chosen):
+                yield ProductRecommendation(
+                    product_id=product_id, recommended_id=recommended_id, rank=rank, score=value,
+                    kind=ProductRecommendation.KIND_BOUGHT_TOGETHER,
+                )
+            for rank, recommended_id in enumerate(fallback, len(chosen)):
+                yield ProductRecommendation(
+                    product_id=product_id, recommended_id=recommended_id, rank=rank,
+                    kind=ProductRecommendation.KIND_CATEGORY,
+                )
+
+    created = 0
+    with transaction.atomic():
+        ProductRecommendation.objects.all().delete()
+        for batch in batched(rows(), INSERT_BATCH_SIZE):
+            ProductRecommendation.objects.bulk_create(batch)
+            created += len(batch)
+    return len(together), created
+
+
+def recommendations_for(product, limit=TOP_K):
+    """Рекомендации для страницы товара одним запросом по индексу (product, rank)"""
+    return [
+        recommendation.recommended
+        for recommendation in ProductRecommendation.objects.filter(
+            product=product, recommended__is_available=True
+        ).select_related('recommended')[:limit]
+    ]
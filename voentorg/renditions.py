@@ -0,0 +1,262 @@
+import base64
+import hashlib
+import io
+import json
+import logging
+import os
+
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+
+# Размеры уменьшенных копий под места вывода в шаблонах.
+# crop=True - обрезка под точный размер (карточки, миниатюры), иначе вписывание с сохранением пропорций
+RENDITION_PRESETS = {
+    'card': {'size': (300, 200), 'crop': True, 'sizes': '(max-width: 768px) 100vw, 300px'},
+    'thumb': {'size': (100, 80), 'crop': True, 'sizes': '100px'},
+    'detail': {'size': (500, 400), 'crop': False, 'sizes': '(max-width: 768px) 100vw, 500px'},
+}
+
+# Плотности пикселей: 1x для обычных экранов и 2x для HiDPI
+RENDITION_SCALES = (1, 2)
+
+RENDITION_FORMATS = {
+    'jpeg': {'extension': 'jpg', 'options': {'quality': 80, 'optimize': True, 'progressive': True}},
+    'webp': {'extension': 'webp', 'options': {'quality': 75, 'method': 4}},
+}
+
+# Заглушка на время загрузки: JPEG не больше 16 px по большей стороне, встраивается в страницу как data URI
+PLACEHOLDER_SIZE = 16
+PLACEHOLDER_QUALITY = 40
+
+# Локальная картинка для товаров без изображений
+NO_IMAGE = 'voentorg/img/no-image.svg'
+
+# Сведения о созданных копиях файла кэшируются: имена файлов адресуют содержимое и не меняются,
+# а отсутствие копий перепроверяется через минуту (их может создать другой процесс)
+MANIFEST_CACHE_KEY = 'renditions:{}'
+MISSING_MANIFEST_TIMEOUT = 60
+
+
+def rendition_name(name, preset, scale, image_format):
+    """Имя файла копии рядом с оригиналом: products/images/foo.jpg -> products/images/foo_card_2x.webp"""
+    root, extension = os.path.splitext(name)
+    return f"{root}_{preset}_{scale}x.{RENDITION_FORMATS[image_format]['extension']}"
+
+
+def manifest_name(name):
+    """Файл со сведениями о копиях: products/images/foo.jpg -> products/images/foo_renditions.json"""
+    root, extension = os.path.splitext(name)
+    return f"{root}_renditions.json"
+
+
+def rendition_size(preset, scale):
+    """Размер копии в пикселях с учетом плотности"""
+    width, height = RENDITION_PRESETS[preset]['size']
+    return width * scale, height * scale
+
+
+def resize_for_preset(image, preset, scale):
+    """
+    Уменьшает изображение под пресет: обрезка под размер или вписывание.
+    Маленькие оригиналы не увеличиваются: обрезка идет под уменьшенный размер с теми же пропорциями
+    """
+    width, height = rendition_size(preset, scale)
+    if RENDITION_PRESETS[preset]['crop']:
+        factor = min(1, image.width / width, image.height / height)
+        return ImageOps.fit(image, (round(width * factor), round(height * factor)), Image.LANCZOS)
+    if image.width <= width and image.height <= height:
+        return image.copy()
+    return ImageOps.contain(image, (width, height), Image.LANCZOS)
+
+
+def encode_image(image, image_format):
+    """Кодирует изображение в JPEG или WebP и возвращает байты"""
+    buffer = io.BytesIO()
+    image.save(buffer, format=image_format.upper(), **RENDITION_FORMATS[image_format]['options'])
+    return buffer.getvalue()
+
+
+def rendition_keys():
+    """Все сочетания (пресет, плотность, формат), для которых создаются копии"""
+    return [
+        (preset, scale, image_format)
+        for preset in RENDITION_PRESETS
+        for scale in RENDITION_SCALES
+        for image_format in RENDITION_FORMATS
+    ]
+
+
+def render_renditions(image):
+    """
+    Кодирует копии RGB-изображения в памяти: {(пресет, плотность, формат): (байты, (ширина, высота))}.
+    Плотность, которая дала бы копию того же размера, что и меньшая (оригинал мал), пропускается
+    """
+    renditions = {}
+    for preset in RENDITION_PRESETS:
+        previous_size = None
+        for scale in RENDITION_SCALES:
+            resized = resize_for_preset(image, preset, scale)
+            if resized.size == previous_size:
+                break
+            previous_size = resized.size
+            for image_format in RENDITION_FORMATS:
+                renditions[(preset, scale, image_format)] = (encode_image(resized, image_format), resized.size)
+    return renditions
+
+
+def save_renditions(storage, name, renditions):
+    """Записывает закодированные копии рядом с оригиналом name и сведения о них"""
+    # Хранилище по содержимому записало бы копию под хэшем, а не под именем от оригинала
+    save = getattr(storage, 'save_derived', storage.save)
+    manifest = {}
+    for (preset, scale, image_format), (content, size) in renditions.items():
+        rendition = rendition_name(name, preset, scale, image_format)
+        # Storage.save не перезаписывает файл, а подбирает новое имя - удаляем старую копию
+        if storage.exists(rendition):
+            storage.delete(rendition)
+        save(rendition, ContentFile(content))
+        manifest.setdefault(preset, {})[str(scale)] = list(size)
+
+    # Сведения записываются последними: по ним шаблоны считают копии готовыми
+    if storage.exists(manifest_name(name)):
+        storage.delete(manifest_name(name))
+    save(manifest_name(name), ContentFile(json.dumps(manifest).encode('utf-8')))
+    cache.set(manifest_cache_key(name), manifest, None)
+
+
+def render_placeholder(image):
+    """Крошечная JPEG-заглушка (data URI) и средний цвет RGB-изображения"""
+    small = image.copy()
+    small.thumbnail((PLACEHOLDER_SIZE, PLACEHOLDER_SIZE), Image.BILINEAR)
+    red, green, blue = small.resize((1, 1), Image.BOX).getpixel((0, 0))
+
+    buffer = io.BytesIO()
+    small.save(buffer, format='JPEG', quality=PLACEHOLDER_QUALITY, optimize=True)
+    data_uri = 'data:image/jpeg;base64,' + base64.b64encode(buffer.getvalue()).decode('ascii')
+    return data_uri, f'#{red:02x}{green:02x}{blue:02x}'
+
+
+def encode_source_image(path, quality=85):
+    """
+    Готовит файл для загрузки: JPEG-оригинал, все его копии и заглушку.
+    Не обращается к Django, поэтому подходит для выполнения в отдельных процессах.
+    """
+    with Image.open(path) as image:
+        image = ImageOps.exif_transpose(image)
+        # Прозрачный фон заменяем белым
+        if image.mode in ('RGBA', 'LA', 'P'):
+            image = image.convert('RGBA')
+            background = Image.new('RGB', image.size, (255, 255, 255))
+            background.paste(image, mask=image.split()[-1])
+            image = background
+        elif image.mode != 'RGB':
+            image = image.convert('RGB')
+
+        buffer = io.BytesIO()
+        image.save(buffer, format='JPEG', quality=quality)
+        return buffer.getvalue(), render_renditions(image), render_placeholder(image)
+
+
+def generate_renditions(field_file, force=False):
+    """
+    Создает все копии (пресеты × плотности × форматы) для файла ImageField.
+    Возвращает количество записанных файлов.
+    """
+    if not field_file:
+        return 0
+
+    storage = field_file.storage
+    if not force and storage.exists(manifest_name(field_file.name)):
+        return 0
+
+    with storage.open(field_file.name, 'rb') as source:
+        with Image.open(source) as original:
+            original = ImageOps.exif_transpose(original)
+            if original.mode != 'RGB':
+                original = original.convert('RGB')
+            renditions = render_renditions(original)
+            save_renditions(storage, field_file.name, renditions)
+
+    return len(renditions)
+
+
+def generate_placeholder(field_file):
+    """Заглушка и средний цвет для файла ImageField"""
+    with field_file.storage.open(field_file.name, 'rb') as source:
+        with Image.open(source) as original:
+            original = ImageOps.exif_transpose(original)
+            if original.mode != 'RGB':
+                original = original.convert('RGB')
+            return render_placeholder(original)
+
+
+def generate_renditions_safely(field_file):
+    """Создание копий при сохранении модели: ошибка обработки не должна ломать сохранение"""
+    try:
+        return generate_renditions(field_file)
+    except Exception:
+        logger.exception('Не удалось создать уменьшенные копии для %s', field_file.name)
+        return 0
+
+
+def generate_placeholder_safely(field_file):
+    """Заглушка при сохранении модели: None, если файл не удалось обработать"""
+    try:
+        return generate_placeholder(field_file)
+    except Exception:
+        logger.exception('Не удалось создать заглушку для %s', field_file.name)
+        return None
+
+
+def manifest_cache_key(name):
+    return MANIFEST_CACHE_KEY.format(hashlib.sha1(name.encode('utf-8')).hexdigest())
+
+
+def rendition_manifest(field_file):
+    """
+    Размеры созданных копий файла: {пресет: {плотность: [ширина, высота]}}; пустой словарь, если
+    копий нет. Файл сведений читается из хранилища только при промахе кэша
+    """
+    if not field_file:
+        return {}
+    key = manifest_cache_key(field_file.name)
+    manifest = cache.get(key)
+    if manifest is not None:
+        return manifest
+    try:
+        with field_file.storage.open(manifest_name(field_file.name), 'rb') as file:
+            manifest = json.loads(file.read())
+    except (OSError, ValueError):
+        cache.set(key, {}, MISSING_MANIFEST_TIMEOUT)
+        return {}
+    cache.set(key, manifest, None)
+    return manifest
+
+
+def has_renditions(field_file):
+    """Проверяет, что копии для файла уже созданы"""
+    return bool(rendition_manifest(field_file))
+
+
+def rendition_dimensions(field_file, preset, scale=1):
+    """Фактический размер копии (меньше пресета, если оригинал мал)"""
+    size = rendition_manifest(field_file).get(preset, {}).get(str(scale))
+    return tuple(size) if size else rendition_size(preset, scale)
+
+
+def rendition_url(field_file, preset, scale=1, image_format='jpeg'):
+    """URL копии изображения"""
+    return field_file.storage.url(rendition_name(field_file.name, preset, scale, image_format))
+
+
+def rendition_srcset(field_file, preset, image_format):
+    """Значение атрибута srcset с фактической шириной каждой созданной копии"""
+    scales = rendition_manifest(field_file).get(preset, {})
+    return ', '.join(
+        f"{rendition_url(field_file, preset, int(scale), image_format)} {size[0]}w"
+        for scale, size in sorted(scales.items(), key=lambda item: int(item[0]))
+    )
@@ -0,0 +1,82 @@
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import F, Min, Sum
+from django.utils import timezone
+
+from .models import ArchivedOrderItem, DailySales, OrderItem, RollupCheckpoint
+
+# Позиции переносятся в архив со своими id, поэтому у рабочих и архивных позиций общая нумерация
+ITEM_SOURCES = (OrderItem, ArchivedOrderItem)
+
+# Отметка - наибольший обработанный id позиции. В PostgreSQL транзакция с меньшим id может
+# зафиксироваться позже большего; позиции заказов моложе этого окна еще не считаются устоявшимися
+SAFETY_LAG = timedelta(minutes=5)
+
+# Пересчеты, читающие позиции заказов по отметке (архивировать можно только обработанное ими)
+DAILY_SALES_CHECKPOINT = 'daily_sales'
+POPULARITY_CHECKPOINT = 'popularity'
+
+
+def next_batch(last_id, batch_size, lag=SAFETY_LAG):
+    """
+    id очередного пакета позиций (рабочих и архивных) после last_id по возрастанию.
+    Пакет не заходит за первую позицию заказа, созданного позже now - lag
+    """
+    frontier = None
+    if lag is not None:
+        frontier = OrderItem.objects.filter(
+            id__gt=last_id, order__created_at__gt=timezone.now() - lag
+        ).aggregate(first=Min('id'))['first']
+
+    candidates = []
+    for model in ITEM_SOURCES:
+        items = model.objects.filter(id__gt=last_id)
+        if frontier is not None:
+            items = items.filter(id__lt=frontier)
+        candidates += items.order_by('id').values_list('id', flat=True)[:batch_size]
+    return sorted(candidates)[:batch_size]
+
+
+def settled_items(model, last_id, upper_id):
+    """Позиции пакета (last_id, upper_id] без отмененных заказов"""
+    return model.objects.filter(id__gt=last_id, id__lte=upper_id).exclude(order__status__code='cancelled')
+
+
+def processed_up_to(names):
+    """Наименьшая отметка из перечисленных пересчетов (0, если какой-то еще не запускался)"""
+    values = dict(RollupCheckpoint.objects.filter(name__in=names).values_list('name', 'last_id'))
+    return min(values.get(name, 0) for name in names)
+
+
+@transaction.atomic
+def adjust_daily_sales_for_order(order, sign):
+    """
+    Вычитает (sign=-1) или возвращает (sign=1) в дневных агрегатах позиции заказа, уже учтенные
+    update_sales_rollups: отмена заказа после пересчета. Отметка блокируется, поэтому правка
+    не пересекается с обработкой пакета; позиции после отметки пересчет учтет по текущему статусу
+    """
+    checkpoint = RollupCheckpoint.objects.select_for_update().filter(name=DAILY_SALES_CHECKPOINT).first()
+    if checkpoint is None:
+        return
+    day = timezone.localdate(order.created_at)
+    rows = (
+        order.items.filter(id__lte=checkpoint.last_id)
+        .order_by()
+        .values('product_id', 'product__category_id')
+        .annotate(total_quantity=Sum('quantity'), total_revenue=Sum('subtotal'))
+    )
+    for row in rows:
+        quantity = sign * row['total_quantity']
+        revenue = sign * row['total_revenue']
+        updated = DailySales.objects.filter(date=day, product_id=row['product_id']).update(
+            quantity=F('quantity') + quantity, revenue=F('revenue') + revenue
+        )
+        if not updated:
+            DailySales.objects.create(
+                date=day,
+                product_id=row['product_id'],
+                category_id=row['product__category_id'],
+                quantity=quantity,
+                revenue=revenue,
+            )
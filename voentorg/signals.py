@@ -1,22 +1,142 @@
-from django.db.models.signals import post_save
-from django.dispatch import receiver
-from .models import CustomUser, Cart
+from django.db import transaction
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver, Signal
+from . import catalog_engine, metrics, popularity, rollups, tracing
+from .models import CustomUser, Cart, CartItem, Order, Product, ProductImage, MediaBlob
+from .renditions import generate_renditions_safely, generate_placeholder_safely
+
+
+# Пакетное изменение товаров (синхронизация, импорт): отправляется один раз на пакет
+# после фиксации транзакции, аргумент product_ids - список измененных товаров (None - изменены все)
+products_changed = Signal()
 
 
 @receiver(post_save, sender=CustomUser)
 def create_user_cart(sender, instance, created, **kwargs):
     """Автоматически создает корзину при создании пользователя"""
     if created:
-        Cart.objects.create(user=instance)
+        Cart.objects.get_or_create(user=instance)
+
+
+@receiver(post_save, sender=ProductImage)
+def create_product_image_renditions(sender, instance, update_fields=None, **kwargs):
+    """Создает уменьшенные копии (JPEG и WebP) и заглушку загруженного изображения товара"""
+    if not instance.image or (update_fields is not None and 'image' not in update_fields):
+        return
+    with tracing.span('renditions', 'image', file=instance.image.name):
+        generate_renditions_safely(instance.image)
+
+    # Заглушку пересчитываем только для нового файла (прежний запоминает remember_previous_image)
+    if instance.placeholder and getattr(instance, '_previous_image', None) == instance.image.name:
+        return
+    with tracing.span('placeholder', 'image', file=instance.image.name):
+        placeholder = generate_placeholder_safely(instance.image)
+    if placeholder:
+        instance.placeholder, instance.dominant_color = placeholder
+        ProductImage.objects.filter(pk=instance.pk).update(
+            placeholder=instance.placeholder, dominant_color=instance.dominant_color
+        )
+
+
+@receiver(post_save, sender=Product)
+def create_product_main_image_renditions(sender, instance, update_fields=None, **kwargs):
+    """Создает уменьшенные копии основного изображения товара"""
+    if instance.image and (update_fields is None or 'image' in update_fields):
+        with tracing.span('renditions', 'image', file=instance.image.name):
+            generate_renditions_safely(instance.image)
+
+
+@receiver(pre_save, sender=Product)
+@receiver(pre_save, sender=ProductImage)
+def remember_previous_image(sender, instance, update_fields=None, **kwargs):
+    """Запоминает прежний файл изображения, чтобы после сохранения пересчитать ссылки"""
+    instance._previous_image = None
+    if instance.pk and (update_fields is None or 'image' in update_fields):
+        instance._previous_image = sender.objects.filter(pk=instance.pk).values_list('image', flat=True).first()
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_save, sender=ProductImage)
+def update_image_references(sender, instance, created, update_fields=None, **kwargs):
+    """Учитывает ссылку на новый файл и снимает ссылку со старого"""
+    if not created and update_fields is not None and 'image' not in update_fields:
+        return
+    previous = getattr(instance, '_previous_image', None) or ''
+    current = instance.image.name or ''
+    if previous != current:
+        MediaBlob.change_references([current], 1)
+        MediaBlob.change_references([previous], -1)
+
 
+@receiver(post_delete, sender=Product)
+@receiver(post_delete, sender=ProductImage)
+def release_image_reference(sender, instance, **kwargs):
+    """Снимает ссылку с файла удаленной записи; сам файл удаляет collect_media"""
+    if instance.image:
+        MediaBlob.change_references([instance.image.name], -1)
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def bump_catalog_version(sender, instance, **kwargs):
+    """Сообщает снимкам каталога в памяти процессов об изменении товара"""
+    if not catalog_engine.enabled():
+        return
+    product_id = instance.pk
+    transaction.on_commit(lambda: catalog_engine.bump_version([product_id]))
+
+
+@receiver(products_changed)
+def bump_catalog_version_for_batch(sender, product_ids, **kwargs):
+    """То же для пакетных изменений (сигнал уже отправлен после фиксации транзакции)"""
+    if catalog_engine.enabled():
+        catalog_engine.bump_version(product_ids)
+
+
+@receiver(pre_save, sender=Order)
+def remember_previous_status(sender, instance, update_fields=None, **kwargs):
+    """Запоминает прежний статус заказа, чтобы после сохранения учесть отмену в популярности"""
+    instance._previous_status = None
+    if instance.pk and (update_fields is None or 'status' in update_fields):
+        instance._previous_status = sender.objects.filter(pk=instance.pk).values_list('status__code', flat=True).first()
+
+
+@receiver(post_save, sender=Order)
+def update_popularity_on_cancel(sender, instance, created, **kwargs):
+    """
+    Отмена уже учтенного заказа снимает его продажи с популярности и дневных агрегатов, снятие отмены - возвращает.
+    Смена статуса через QuerySet.update сигналов не отправляет: тогда помогут пересчеты с --rebuild
+    """
+    previous = getattr(instance, '_previous_status', None)
+    if created or previous is None:
+        return
+    cancelled = instance.status.code == 'cancelled'
+    if cancelled == (previous == 'cancelled'):
+        return
+    sign = -1 if cancelled else 1
+    # Обе отметки блокируются в одной транзакции и всегда в одном порядке: сначала агрегаты, затем популярность
+    with transaction.atomic():
+        rollups.adjust_daily_sales_for_order(instance, sign)
+        product_ids = popularity.adjust_for_order(instance, sign)
+    if product_ids:
+        transaction.on_commit(lambda: products_changed.send(sender=Product, product_ids=product_ids))
+
+
+@receiver(post_save, sender=Order)
+def count_placed_order(sender, instance, created, **kwargs):
+    """Учитывает оформленный заказ в метриках после фиксации транзакции"""
+    if created:
+        customer = 'user' if instance.user_id else 'guest'
+        transaction.on_commit(lambda: metrics.ORDERS_PLACED.inc(customer=customer))
 
-# В apps.py
-from django.apps import AppConfig
 
+@receiver(post_save, sender=CartItem)
+def count_cart_item_change(sender, instance, created, **kwargs):
+    """Учитывает изменение позиции корзины авторизованного пользователя"""
+    metrics.CART_MUTATIONS.inc(action='add' if created else 'update', storage='db')
 
-class VoentorgConfig(AppConfig):
-    default_auto_field = 'django.db.models.BigAutoField'
-    name = 'voentorg'
 
-    def ready(self):
-        import voentorg.signals
\ No newline at end of file
+@receiver(post_delete, sender=CartItem)
+def count_cart_item_removal(sender, instance, **kwargs):
+    """Учитывает удаление позиции корзины авторизованного пользователя"""
+    metrics.CART_MUTATIONS.inc(action='remove', storage='db')
@@ -0,0 +1,269 @@
+import hashlib
+import json
+import logging
+import re
+import statistics
+import time
+
+from django.apps import apps
+from django.db import DatabaseError, NotSupportedError, connections, models, transaction
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from .models import SlowQuery
+from .queries import fingerprint
+
+logger = logging.getLogger(__name__)
+
+# Условие на столбец: NOT "таблица"."столбец" или "таблица"."столбец" <оператор>
+CONDITION_RE = re.compile(
+    r'(?P<negated>\bNOT\s+)?"(?P<table>\w+)"\."(?P<column>\w+)"\s*'
+    r'(?P<operator><=|>=|<>|!=|=|<|>|\bIN\b|\bIS NOT NULL\b|\bIS NULL\b|\bLIKE\b|\bBETWEEN\b)?',
+    re.I,
+)
+ORDER_COLUMN_RE = re.compile(r'"(?P<table>\w+)"\."(?P<column>\w+)"\s*(?P<direction>ASC|DESC)?', re.I)
+FROM_RE = re.compile(r'\bFROM\s+"(\w+)"', re.I)
+BOOLEAN_END_RE = re.compile(r'\s*(?:AND\b|OR\b|\)|$)', re.I)
+
+EQUALITY_OPERATORS = {'=', 'IN', 'IS NULL'}
+RANGE_OPERATORS = {'<', '>', '<=', '>=', 'BETWEEN'}
+
+# Признаки плана: полный просмотр таблицы и сортировка без индекса (SQLite, PostgreSQL, MySQL)
+FULL_SCAN_RE = re.compile(r'^\s*SCAN (?:TABLE )?\w+\b(?! USING (?:COVERING )?INDEX)|Seq Scan on|\| ALL \|', re.M)
+TEMP_SORT_MARKERS = ('USE TEMP B-TREE FOR ORDER BY', 'Sort Method', 'Using filesort')
+
+
+def explain(alias, sql, params):
+    """План выполнения запроса (EXPLAIN QUERY PLAN в SQLite, EXPLAIN в остальных базах)"""
+    connection = connections[alias]
+    prefix = connection.ops.explain_query_prefix()
+    with connection.cursor() as cursor:
+        cursor.execute(f'{prefix} {sql}', params)
+        rows = cursor.fetchall()
+    if connection.vendor in ('sqlite', 'postgresql'):
+        return '\n'.join(str(row[-1]) for row in rows)
+    return '\n'.join(' | '.join(str(value) for value in row) for row in rows)
+
+
+def record_slow_queries(slow, view_name=''):
+    """
+    Сохраняет медленные запросы из QueryRecorder.slow: счетчики по отпечатку, а план выполнения -
+    для первого и для самого медленного вызова. Ошибки записи не должны ломать ответ
+    """
+    for sql, params, duration, alias in slow:
+        text = fingerprint(sql)
+        duration_ms = duration * 1000
+        try:
+            entry, created = SlowQuery.objects.get_or_create(
+                fingerprint_hash=hashlib.sha1(text.encode('utf-8')).hexdigest(),
+                defaults={'fingerprint': text, 'database': alias, 'view_name': view_name or ''},
+            )
+            changes = {
+                'calls': models.F('calls') + 1,
+                'total_time_ms': models.F('total_time_ms') + duration_ms,
+                'max_time_ms': Greatest(models.F('max_time_ms'), duration_ms),
+                'last_seen': timezone.now(),
+            }
+            if created or duration_ms > entry.max_time_ms:
+                changes.update(
+                    sample_sql=sql,
+                    sample_params=json.dumps(list(params or ()), ensure_ascii=False, default=str),
+                    plan=explain(alias, sql, params),
+                    view_name=view_name or entry.view_name,
+                )
+            SlowQuery.objects.filter(pk=entry.pk).update(**changes)
+        except (DatabaseError, NotSupportedError):
+            logger.exception('Не удалось сохранить медленный запрос %s', text[:200])
+
+
+def clause(sql, keyword, stops):
+    """Часть запроса после keyword до первого из stops"""
+    match = re.search(rf'\b{keyword}\b', sql, re.I)
+    if not match:
+        return ''
+    rest = sql[match.end():]
+    ends = [found.start() for stop in stops for found in [re.search(rf'\b{stop}\b', rest, re.I)] if found]
+    return rest[:min(ends)] if ends else rest
+
+
+def query_shape(sql):
+    """
+    Форма SELECT-запроса по основной таблице: столбцы сравнений на равенство, диапазонов,
+    логические условия (столбец -> True/False) и сортировка. None, если это не SELECT
+    """
+    if not sql.lstrip().upper().startswith('SELECT'):
+        return None
+    table_match = FROM_RE.search(sql)
+    if not table_match:
+        return None
+    table = table_match.group(1)
+    where = clause(sql, 'WHERE', ('GROUP BY', 'ORDER BY', 'LIMIT', 'HAVING'))
+    order = clause(sql, 'ORDER BY', ('LIMIT', 'OFFSET'))
+
+    shape = {'table': table, 'equality': [], 'ranges': [], 'booleans': {}, 'order': []}
+    for match in CONDITION_RE.finditer(where):
+        if match.group('table') != table:
+            continue
+        operator = (match.group('operator') or '').upper()
+        column = match.group('column')
+        if not operator:
+            # Столбец справа от сравнения (соединение) - не условие на этот столбец
+            if where[:match.start()].rstrip()[-1:] in ('=', '<', '>'):
+                continue
+            if BOOLEAN_END_RE.match(where, match.end()):
+                shape['booleans'][column] = not match.group('negated')
+        elif operator in EQUALITY_OPERATORS and column not in shape['equality']:
+            shape['equality'].append(column)
+        elif operator in RANGE_OPERATORS and column not in shape['ranges']:
+            shape['ranges'].append(column)
+
+    for match in ORDER_COLUMN_RE.finditer(order):
+        if match.group('table') != table:
+            # Сортировка по столбцу другой таблицы: индекс по этой таблице ее не заменит
+            shape['order'] = []
+            break
+        shape['order'].append((match.group('column'), (match.group('direction') or '').upper() == 'DESC'))
+    return shape
+
+
+def model_for_table(table):
+    for model in apps.get_models():
+        if model._meta.db_table == table:
+            return model
+    return None
+
+
+def index_name(model, fields, condition):
+    """Имя индекса не длиннее 30 символов (ограничение Django)"""
+    base = f'{model._meta.model_name}_' + '_'.join(field.lstrip('-') for field in fields)
+    if condition:
+        base += '_p'
+    if len(base) > 26:
+        digest = hashlib.sha1(f'{base}{sorted(condition.items())}'.encode('utf-8')).hexdigest()[:4]
+        base = f'{base[:21]}_{digest}'
+    return f'{base}_idx'
+
+
+def propose_index(shape):
+    """
+    Индекс для формы запроса: сначала столбцы равенства, затем сортировка (или первый диапазон);
+    логические условия становятся условием частичного индекса
+    """
+    model = model_for_table(shape['table'])
+    if model is None:
+        return None
+    fields_by_column = {field.column: field for field in model._meta.concrete_fields}
+    columns = [(column, False) for column in shape['equality'] if column not in shape['booleans']]
+    if shape['order']:
+        order = list(shape['order'])
+        # Первичный ключ в конце сортировки - лишь порядок для равных строк, индекс он не меняет
+        if len(order) > 1 and order[-1][0] == model._meta.pk.column:
+            order.pop()
+        columns += [item for item in order if item[0] not in dict(columns)]
+    elif shape['ranges']:
+        columns.append((shape['ranges'][0], False))
+    if not columns or any(column not in fields_by_column for column, descending in columns):
+        return None
+
+    condition = {}
+    for column, value in shape['booleans'].items():
+        field = fields_by_column.get(column)
+        if isinstance(field, models.BooleanField):
+            condition[field.name] = value
+    fields = [('-' if descending else '') + fields_by_column[column].name for column, descending in columns]
+    return {
+        'model': model,
+        'table': shape['table'],
+        'columns': [column for column, descending in columns],
+        'fields': fields,
+        'condition': condition,
+        'name': index_name(model, fields, condition),
+    }
+
+
+def existing_indexes(table, alias='default'):
+    """Списки столбцов индексов таблицы (включая первичный ключ и уникальные ограничения)"""
+    connection = connections[alias]
+    with connection.cursor() as cursor:
+        constraints = connection.introspection.get_constraints(cursor, table)
+    return [
+        constraint['columns']
+        for constraint in constraints.values()
+        if constraint['columns'] and (constraint['index'] or constraint['unique'] or constraint['primary_key'])
+    ]
+
+
+def is_covered(proposal, indexes):
+    """Существующий индекс начинается с тех же столбцов"""
+    columns = proposal['columns']
+    return any(index[:len(columns)] == columns for index in indexes)
+
+
+def advise_indexes(entries):
+    """
+    Сводит медленные запросы в предложения индексов, которых еще нет в базе.
+    Предложения отсортированы по суммарному времени запросов - верхней границе выигрыша
+    """
+    proposals = {}
+    coverage = {}
+    for entry in entries:
+        shape = query_shape(entry.sample_sql or entry.fingerprint)
+        proposal = shape and propose_index(shape)
+        if not proposal:
+            continue
+        key = (entry.database, proposal['table'])
+        if key not in coverage:
+            coverage[key] = existing_indexes(proposal['table'], entry.database)
+        if is_covered(proposal, coverage[key]):
+            continue
+        proposal = proposals.setdefault(proposal['name'], {
+            **proposal, 'queries': [], 'calls': 0, 'total_time_ms': 0.0, 'full_scan': False, 'temp_sort': False,
+        })
+        proposal['queries'].append(entry)
+        proposal['calls'] += entry.calls
+        proposal['total_time_ms'] += entry.total_time_ms
+        proposal['full_scan'] |= bool(FULL_SCAN_RE.search(entry.plan))
+        proposal['temp_sort'] |= any(marker in entry.plan for marker in TEMP_SORT_MARKERS)
+    return sorted(proposals.values(), key=lambda proposal: proposal['total_time_ms'], reverse=True)
+
+
+def index_definition(proposal):
+    """Строка для Meta.indexes модели"""
+    definition = f"models.Index(fields={proposal['fields']!r}, name='{proposal['name']}'"
+    if proposal['condition']:
+        condition = ', '.join(f'{name}={value!r}' for name, value in proposal['condition'].items())
+        definition += f', condition=models.Q({condition})'
+    return definition + ')'
+
+
+def measure_index(proposal, runs=5):
+    """
+    Замеряет самый медленный запрос предложения до и после создания индекса.
+    Индекс создается в транзакции, которая откатывается; возвращает (до, после, план после)
+    """
+    sample = max(proposal['queries'], key=lambda entry: entry.max_time_ms)
+    connection = connections[sample.database]
+    if not connection.features.can_rollback_ddl:
+        raise NotSupportedError(f'{connection.vendor}: создание индекса нельзя откатить')
+    params = json.loads(sample.sample_params or '[]')
+
+    def timed():
+        durations = []
+        with connection.cursor() as cursor:
+            for _ in range(runs):
+                started = time.perf_counter()
+                cursor.execute(sample.sample_sql, params)
+                cursor.fetchall()
+                durations.append((time.perf_counter() - started) * 1000)
+        return statistics.median(durations)
+
+    condition = models.Q(**proposal['condition']) if proposal['condition'] else None
+    index = models.Index(fields=proposal['fields'], name=proposal['name'], condition=condition)
+    with transaction.atomic(using=sample.database):
+        before = timed()
+        with connection.cursor() as cursor:
+            cursor.execute(str(index.create_sql(proposal['model'], connection.schema_editor())))
+        after = timed()
+        plan = explain(sample.database, sample.sample_sql, params)
+        transaction.set_rollback(True, using=sample.database)
+    return before, after, plan
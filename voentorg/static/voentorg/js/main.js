@@ -148,6 +148,8 @@ function initializeFilters() {
                 } else {
                     url.searchParams.set('category', activeFilters.category);
                 }
+                // Новая выборка открывается с первой страницы
+                url.searchParams.delete('page');
                 window.location.href = url.toString();
             }
         });
@@ -162,6 +164,7 @@ function initializeFilters() {
             // Перезагружаем страницу с новым параметром сортировки
             const url = new URL(window.location);
             url.searchParams.set('sort', activeFilters.sort);
+            url.searchParams.delete('page');
             window.location.href = url.toString();
         });
     }
@@ -268,6 +271,7 @@ function resetFilters(activeFilters) {
     url.searchParams.delete('sort');
     url.searchParams.delete('min_price');
     url.searchParams.delete('max_price');
+    url.searchParams.delete('page');
 
     window.location.href = url.toString();
 }
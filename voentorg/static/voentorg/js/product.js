@@ -22,10 +22,24 @@ function initializeProductGallery() {
             // Добавляем активный класс текущему
             this.classList.add('active');
 
-            // Меняем главное изображение
+            // Меняем главное изображение (вместе с наборами уменьшенных копий)
             const imageUrl = this.getAttribute('data-image');
+            const picture = mainImage.closest('picture');
+            if (picture) {
+                const webpSource = picture.querySelector('source[type="image/webp"]');
+                if (webpSource) {
+                    webpSource.srcset = this.getAttribute('data-webp-srcset') || '';
+                }
+            }
+            mainImage.srcset = this.getAttribute('data-srcset') || '';
             mainImage.src = imageUrl;
 
+            // Заглушка миниатюры видна, пока загружается новое изображение
+            const thumbnailImage = this.querySelector('img');
+            if (thumbnailImage) {
+                mainImage.style.background = thumbnailImage.style.background;
+            }
+
             // Добавляем плавную смену изображения
             mainImage.style.opacity = '0.7';
             setTimeout(() => {
@@ -0,0 +1,77 @@
+import hashlib
+import os
+import posixpath
+import re
+
+from django.core.files.storage import FileSystemStorage
+
+# Каталог файлов с адресацией по содержимому: products/sha256/ab/cd/<sha256>.<расширение>
+CONTENT_ROOT = 'products/sha256'
+
+CONTENT_NAME_RE = re.compile(r'^{}/[0-9a-f]{{2}}/[0-9a-f]{{2}}/[0-9a-f]{{64}}\.\w+$'.format(re.escape(CONTENT_ROOT)))
+
+
+def is_content_name(name):
+    """Проверяет, что имя файла - оригинал в хранилище по содержимому (а не копия или старый файл)"""
+    return bool(name) and bool(CONTENT_NAME_RE.match(name))
+
+
+def is_immutable_name(name):
+    """
+    Проверяет, что содержимое файла однозначно определяется именем. Это только оригиналы: уменьшенные
+    копии и сведения о них перезаписываются под тем же именем при пересоздании (generate_renditions --force)
+    """
+    return is_content_name(name)
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    Файловое хранилище с адресацией по содержимому.
+    Загружаемый файл сохраняется под именем из SHA-256 его содержимого в подкаталогах по первым
+    символам хэша, поэтому одинаковые загрузки занимают место один раз, а каталоги не разрастаются.
+    Каждый оригинал регистрируется в MediaBlob для подсчета ссылок и сборки мусора.
+    Файлы, имя которых уже лежит внутри CONTENT_ROOT, и производные файлы (save_derived) сохраняются как есть.
+    """
+    root = CONTENT_ROOT
+
+    def content_name(self, name, content):
+        """Имя файла по хэшу содержимого с расширением исходного имени"""
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        digest = digest.hexdigest()
+        extension = os.path.splitext(name)[1].lower()
+        return posixpath.join(self.root, digest[:2], digest[2:4], digest + extension), digest
+
+    def _save(self, name, content):
+        if name.startswith(self.root + '/'):
+            return super()._save(name, content)
+
+        from .models import MediaBlob
+
+        content_name, digest = self.content_name(name, content)
+        if not self.exists(content_name):
+            content_name = super()._save(content_name, content)
+
+        # update_or_create обновляет и updated_at: недавно загруженный файл не попадет под сборку мусора,
+        # даже если запись, которая на него ссылается, еще не сохранена
+        MediaBlob.objects.update_or_create(
+            name=content_name,
+            defaults={'sha256': digest, 'size': content.size}
+        )
+        return content_name
+
+    def save_derived(self, name, content):
+        """
+        Сохраняет производный файл (уменьшенную копию, сведения о копиях) под именем name без хэширования
+        и без MediaBlob: имя выводится из имени оригинала, в том числе из старого пути вне CONTENT_ROOT
+        """
+        return super()._save(self.get_available_name(name), content)
+
+
+_product_image_storage = ContentAddressedStorage()
+
+
+def product_image_storage():
+    """Хранилище изображений товаров (вызываемый объект, чтобы в миграции попадала ссылка, а не настройки)"""
+    return _product_image_storage
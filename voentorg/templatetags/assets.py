@@ -0,0 +1,22 @@
+from django import template
+from django.utils.html import format_html, format_html_join
+
+from voentorg.assets import bundle_urls
+
+register = template.Library()
+
+
+@register.simple_tag(takes_context=True)
+def asset(context, name):
+    """
+    Подключает бандл из voentorg.assets.ASSET_BUNDLES: {% asset 'cart.css' %}.
+    Стили блокируют отрисовку, поэтому их URL передаются AssetPreloadMiddleware для заголовка Link
+    """
+    urls = bundle_urls(name)
+    if name.endswith('.css'):
+        request = context.get('request')
+        preload = getattr(request, 'preload_assets', None)
+        if preload is not None:
+            preload.extend((url, 'style') for url in urls)
+        return format_html_join('\n', '<link rel="stylesheet" href="{}">', ((url,) for url in urls))
+    return format_html_join('\n', '<script src="{}"></script>', ((url,) for url in urls))
@@ -0,0 +1,87 @@
+from django import template
+from django.templatetags.static import static
+from django.utils.html import format_html
+
+from voentorg.renditions import (
+    NO_IMAGE, RENDITION_PRESETS, has_renditions, rendition_dimensions, rendition_size, rendition_url,
+    rendition_srcset
+)
+
+register = template.Library()
+
+
+def placeholder_style(field_file):
+    """
+    Атрибут style с заглушкой изображения (ProductImage.placeholder) в качестве фона:
+    заглушка видна сразу, а загруженное изображение рисуется поверх нее
+    """
+    instance = getattr(field_file, 'instance', None)
+    placeholder = getattr(instance, 'placeholder', '')
+    color = getattr(instance, 'dominant_color', '')
+    if placeholder:
+        return format_html(' style="background: {} url({}) center / cover no-repeat"', color or 'transparent', placeholder)
+    if color:
+        return format_html(' style="background-color: {}"', color)
+    return ''
+
+
+@register.simple_tag
+def responsive_image(field_file, preset, alt='', element_id='', loading='lazy'):
+    """
+    Выводит <picture> с WebP и JPEG копиями изображения (srcset/sizes) и встроенной заглушкой.
+    Если копии еще не созданы, выводит оригинал.
+    """
+    if not has_renditions(field_file):
+        width, height = rendition_size(preset, 1)
+        return format_html(
+            '<img src="{}" alt="{}"{} width="{}" height="{}" loading="{}"{}>',
+            field_file.url, alt, format_html(' id="{}"', element_id) if element_id else '', width, height, loading,
+            placeholder_style(field_file)
+        )
+
+    width, height = rendition_dimensions(field_file, preset)
+    sizes = RENDITION_PRESETS[preset]['sizes']
+    return format_html(
+        '<picture>'
+        '<source type="image/webp" srcset="{}" sizes="{}">'
+        '<img src="{}" srcset="{}" sizes="{}" alt="{}"{} width="{}" height="{}" loading="{}" decoding="async"{}>'
+        '</picture>',
+        rendition_srcset(field_file, preset, 'webp'), sizes,
+        rendition_url(field_file, preset), rendition_srcset(field_file, preset, 'jpeg'), sizes,
+        alt, format_html(' id="{}"', element_id) if element_id else '', width, height, loading,
+        placeholder_style(field_file)
+    )
+
+
+@register.simple_tag
+def no_image(preset, alt='', element_id=''):
+    """Локальная картинка «Нет изображения» в размерах пресета"""
+    width, height = rendition_size(preset, 1)
+    return format_html(
+        '<img src="{}" alt="{}"{} width="{}" height="{}">',
+        static(NO_IMAGE), alt, format_html(' id="{}"', element_id) if element_id else '', width, height
+    )
+
+
+@register.filter
+def rendition(field_file, preset):
+    """URL JPEG-копии изображения нужного пресета: {{ image.image|rendition:"detail" }}"""
+    if not has_renditions(field_file):
+        return field_file.url
+    return rendition_url(field_file, preset)
+
+
+@register.filter
+def webp_srcset(field_file, preset):
+    """srcset WebP-копий изображения (пустая строка, если копий нет)"""
+    if not has_renditions(field_file):
+        return ''
+    return rendition_srcset(field_file, preset, 'webp')
+
+
+@register.filter
+def jpeg_srcset(field_file, preset):
+    """srcset JPEG-копий изображения (пустая строка, если копий нет)"""
+    if not has_renditions(field_file):
+        return ''
+    return rendition_srcset(field_file, preset, 'jpeg')
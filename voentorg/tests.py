@@ -1,3 +1,1278 @@
-from django.test import TestCase
+import base64
+import gzip
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import tempfile
+from contextlib import contextmanager
+from datetime import timedelta
+from decimal import Decimal
+from io import BytesIO, StringIO
+from pathlib import Path
+from types import SimpleNamespace
+from unittest import addModuleCleanup
+from unittest.mock import patch
 
-# Create your tests here.
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.core.management import call_command
+from django.core.servers.basehttp import WSGIServer
+from django.db import models
+from django.db.models.fields.files import FieldFile
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.template import Context, Template
+from django.test import LiveServerTestCase, RequestFactory, TestCase, override_settings
+from django.test.testcases import LiveServerThread, QuietWSGIRequestHandler
+from django.urls import resolve
+from django.utils import timezone
+from PIL import Image
+
+from . import catalog_engine, metrics, tracing
+from .assets import ASSET_BUNDLES, MANIFEST_NAME, minify_css, minify_js
+from .benchmarks import StorefrontBenchmark, compare_results, percentile, seed_dataset
+from .models import (
+    ArchivedOrder, Cart, CartItem, Category, CustomUser, DailySales, GenerationProgress, MediaBlob, Order, OrderItem,
+    OrderStatus, Product, ProductImage, ProductRecommendation, ReorderSuggestion, RequestProfile, RollupCheckpoint,
+    SlowQuery, StockMovement, StockSnapshot
+)
+from .feeds import batched, parse_bool
+from .management.commands import build_assets
+from .management.commands.sales_analytics import load_sales_arrays
+from .media import DEFAULT_CACHE_CONTROL, IMMUTABLE_CACHE_CONTROL, parse_range
+from .middleware import ResponseOptimizationMiddleware, minify_html
+from .popularity import HALF_LIFE_DAYS, REBASE_AFTER_HALF_LIVES, current_epoch, current_popularity, rebase_epoch
+from .queries import QueryRecorder, fingerprint
+from .renditions import (
+    has_renditions, manifest_name, render_placeholder, render_renditions, rendition_name, rendition_srcset,
+    rendition_url, save_renditions
+)
+from .rollups import DAILY_SALES_CHECKPOINT
+from .signals import products_changed
+from .slow_queries import advise_indexes, index_definition, propose_index, query_shape
+from .views import SORT_ORDERS, get_order_history, product_listing
+
+
+def create_order(*products, quantity=1, status='new', days_ago=0, user=None):
+    """Заказ (без user - гостевой) по одной позиции на товар, созданный days_ago дней назад"""
+    order_status, created = OrderStatus.objects.get_or_create(code=status, defaults={'name': status})
+    order = Order.objects.create(
+        user=user, guest_email='' if user else 'guest@example.com', shipping_address='г. Иркутск',
+        total_amount=sum(product.price * quantity for product in products), status=order_status,
+    )
+    if days_ago:
+        Order.objects.filter(pk=order.pk).update(created_at=timezone.now() - timedelta(days=days_ago))
+    for product in products:
+        OrderItem.objects.create(
+            order=order, product=product, quantity=quantity, price=product.price, subtotal=product.price * quantity
+        )
+    return order
+
+
+def render_template(source, **context):
+    """Отрисовывает шаблон из строки с переданным контекстом"""
+    return Template(source).render(Context(context))
+
+
+def run_rollups():
+    """Пересчеты по отметкам без окна --lag: после них заказы можно архивировать"""
+    for command in ('update_sales_rollups', 'update_popularity'):
+        call_command(command, '--lag', '0', stdout=StringIO())
+
+
+def use_temporary_metrics_dir(add_cleanup):
+    """
+    Метрики пишутся во временный каталог, а не в METRICS_DIR проекта; возвращает его путь.
+    add_cleanup - addCleanup теста или addModuleCleanup модуля
+    """
+    directory = tempfile.TemporaryDirectory()
+    add_cleanup(directory.cleanup)
+    settings_override = override_settings(METRICS_DIR=directory.name)
+    settings_override.enable()
+    add_cleanup(settings_override.disable)
+    return directory.name
+
+
+def setUpModule():
+    # Запросы, кэш и заказы в тестах (в том числе в setUpTestData) увеличивают метрики
+    use_temporary_metrics_dir(addModuleCleanup)
+
+
+class QueryBudgetMixin:
+    """Проверки количества SQL-запросов: падение теста показывает запросы и повторы (N+1)"""
+
+    @contextmanager
+    def assertMaxQueries(self, budget, label='блок'):
+        recorder = QueryRecorder()
+        with recorder.record():
+            yield recorder
+        if recorder.count > budget:
+            duplicates = ''.join(f'\n  {count} x {sql}' for sql, count in recorder.duplicates())
+            queries = ''.join(f'\n  {sql}' for sql, duration in recorder.queries)
+            self.fail(
+                f'{label}: {recorder.count} SQL-запросов при бюджете {budget}'
+                f'\nПовторяющиеся запросы:{duplicates or " нет"}\nВсе запросы:{queries}'
+            )
+
+    def assertViewQueryBudget(self, url, budget, method='get', data=None, status_code=200):
+        """Запрашивает url и проверяет, что представление уложилось в бюджет запросов"""
+        view_name = resolve(url.split('?')[0]).view_name
+        with self.assertMaxQueries(budget, label=f'{view_name} ({url})'):
+            response = getattr(self.client, method)(url, data)
+        self.assertEqual(response.status_code, status_code)
+        return response
+
+
+class FingerprintTests(TestCase):
+    def test_values_are_normalized(self):
+        self.assertEqual(
+            fingerprint("SELECT * FROM t WHERE id = 5 AND name = 'x''y' AND a IN (%s, %s, %s)"),
+            'SELECT * FROM t WHERE id = ? AND name = ? AND a IN (...)',
+        )
+
+    def test_same_shape_queries_share_fingerprint(self):
+        self.assertEqual(
+            fingerprint('SELECT * FROM t WHERE id IN (%s)'),
+            fingerprint('SELECT *  FROM t\nWHERE id IN (%s, %s)'),
+        )
+
+
+class ViewQueryBudgetTests(QueryBudgetMixin, TestCase):
+    """
+    Бюджеты SQL-запросов основных страниц. Если тест упал после изменения, проверьте,
+    не появился ли запрос в цикле; бюджет повышайте, только если новые запросы действительно нужны
+    """
+    PRODUCT_COUNT = 5
+    # Слагаемые с PRODUCT_COUNT - известные запросы в цикле по товарам (категория, изображения,
+    # товар позиции корзины); после их устранения бюджет нужно уменьшить
+    ANONYMOUS_BUDGETS = {
+        '/': 4 + 2 * PRODUCT_COUNT,
+        '/catalog/': 0,
+        '/product/{product_id}/': 5,
+        '/cart/': 0,
+        '/cart/get_count/': 0,
+        '/search/?q=товар': 0,
+        '/about/': 0,
+        '/contacts/': 0,
+    }
+    # Сессия и пользователь - еще два запроса на каждую страницу
+    AUTHENTICATED_BUDGETS = {
+        '/': 8 + 3 * PRODUCT_COUNT,
+        '/catalog/': 2,
+        '/product/{product_id}/': 7,
+        '/cart/': 4 + 2 * PRODUCT_COUNT,
+        '/cart/get_count/': 4 + PRODUCT_COUNT,
+        '/search/?q=товар': 2,
+        '/profile/': 4,
+        '/orders/': 4,
+        '/order/create/': 4 + 6 * PRODUCT_COUNT,
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Category.objects.create(name='Снаряжение', slug='gear')
+        cls.products = [
+            Product.objects.create(
+                name=f'Товар {i}',
+                slug=f'item-{i}',
+                price=100 + i,
+                stock=10,
+                category=cls.category,
+            )
+            for i in range(cls.PRODUCT_COUNT)
+        ]
+        cls.user = CustomUser.objects.create_user(
+            email='buyer@example.com', username='buyer', password='secret-password-1'
+        )
+        # Корзину пользователю создает сигнал
+        cart = Cart.objects.get(user=cls.user)
+        for product in cls.products:
+            CartItem.objects.create(cart=cart, product=product, quantity=1)
+
+    def check_budgets(self, budgets):
+        for url, budget in budgets.items():
+            with self.subTest(url=url):
+                self.assertViewQueryBudget(url.format(product_id=self.products[0].id), budget)
+
+    def test_anonymous_budgets(self):
+        self.check_budgets(self.ANONYMOUS_BUDGETS)
+
+    def test_authenticated_budgets(self):
+        self.client.force_login(self.user)
+        self.check_budgets(self.AUTHENTICATED_BUDGETS)
+
+    def test_budget_failure_lists_duplicates(self):
+        with self.assertRaisesMessage(AssertionError, f'{self.PRODUCT_COUNT} x SELECT'):
+            with self.assertMaxQueries(1):
+                for product in Product.objects.all():
+                    product.category.name
+
+    def test_server_timing_is_shown_only_to_staff(self):
+        self.assertNotIn('Server-Timing', self.client.get('/about/'))
+        self.client.force_login(self.user)
+        self.assertNotIn('Server-Timing', self.client.get('/about/'))
+
+        self.user.is_staff = True
+        self.user.save()
+        self.assertRegex(self.client.get('/about/')['Server-Timing'], r'^db;dur=[\d.]+;desc="SQL: \d+"$')
+        with override_settings(DEBUG=True):
+            self.client.logout()
+            self.assertIn('Server-Timing', self.client.get('/about/'))
+
+    def test_only_overruns_are_logged_above_debug(self):
+        with self.assertNoLogs('voentorg.middleware', logging.INFO):
+            self.client.get('/about/')
+        with patch('voentorg.middleware.QUERY_COUNT_BUDGET', 0):
+            with self.assertLogs('voentorg.middleware', logging.WARNING) as logs:
+                self.client.get(f'/product/{self.products[0].id}/')
+        self.assertIn('SQL product_detail', logs.output[0])
+
+
+class ResponseOptimizationTests(TestCase):
+    HTML = (
+        '<!DOCTYPE html>\n<html>\n  <body>\n    <!-- навигация -->\n'
+        + '    <p>Товар</p>\n' * 40
+        + '    <pre>  отступ\n    сохранен</pre>\n  </body>\n</html>\n'
+    )
+
+    def optimize(self, response, accept_encoding='gzip, deflate, br'):
+        request = RequestFactory().get('/', HTTP_ACCEPT_ENCODING=accept_encoding)
+        # Без пакета brotli поведение одинаково на любой машине
+        with patch('voentorg.middleware.brotli', None):
+            return ResponseOptimizationMiddleware(lambda request: response)(request)
+
+    def test_html_is_minified_and_compressed(self):
+        response = HttpResponse(self.HTML)
+        response['ETag'] = '"abc"'
+        response['Content-Length'] = len(response.content)
+        response = self.optimize(response)
+
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+        self.assertEqual(response['ETag'], 'W/"abc"')
+        self.assertEqual(response['Content-Length'], str(len(response.content)))
+        html = gzip.decompress(response.content).decode()
+        self.assertEqual(html, minify_html(self.HTML))
+        self.assertNotIn('навигация', html)
+        self.assertIn('<pre>  отступ\n    сохранен</pre>', html)
+
+    def test_uncompressed_for_clients_without_gzip(self):
+        for accept_encoding in ('', 'gzip;q=0, identity'):
+            with self.subTest(accept_encoding=accept_encoding):
+                response = self.optimize(HttpResponse(self.HTML), accept_encoding)
+                self.assertFalse(response.has_header('Content-Encoding'))
+                self.assertEqual(response['Vary'], 'Accept-Encoding')
+                self.assertEqual(response.content.decode(), minify_html(self.HTML))
+
+    def test_small_bodies_are_left_alone(self):
+        response = self.optimize(JsonResponse({'success': True}))
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+        self.assertEqual(response.content, b'{"success": true}')
+
+    def test_streaming_and_encoded_responses_are_skipped(self):
+        streaming = self.optimize(StreamingHttpResponse(iter([self.HTML])))
+        self.assertFalse(streaming.has_header('Content-Encoding'))
+        self.assertFalse(streaming.has_header('Vary'))
+        self.assertEqual(b''.join(streaming.streaming_content).decode(), self.HTML)
+
+        encoded = HttpResponse(gzip.compress(self.HTML.encode()))
+        encoded['Content-Encoding'] = 'gzip'
+        content = encoded.content
+        response = self.optimize(encoded)
+        self.assertEqual(response.content, content)
+        self.assertFalse(response.has_header('Vary'))
+
+
+class BenchmarkTests(TestCase):
+    def test_percentile_interpolates(self):
+        values = [10, 20, 30, 40]
+        self.assertEqual(percentile(values, 0), 10)
+        self.assertEqual(percentile(values, 50), 25)
+        self.assertEqual(percentile(values, 100), 40)
+        self.assertIsNone(percentile([], 50))
+
+    def test_compare_reports_slower_and_chattier_views(self):
+        reference = {'p50_ms': 10.0, 'queries': 5, 'errors': 0}
+        baseline = {'1000': {'home': reference, 'catalog': reference}}
+        results = {'1000': {
+            'home': {'p50_ms': 11.0, 'queries': 5, 'errors': 0},
+            'catalog': {'p50_ms': 20.0, 'queries': 7, 'errors': 0},
+            'search': {'p50_ms': 99.0, 'queries': 99, 'errors': 0},
+        }}
+        self.assertEqual(compare_results(results, baseline, tolerance=0.25), [
+            ('1000', 'catalog', 'p50_ms', 10.0, 20.0),
+            ('1000', 'catalog', 'queries', 5, 7),
+        ])
+
+    def test_small_run_covers_all_scenarios_without_errors(self):
+        logger = logging.getLogger('voentorg.middleware')
+        level = logger.level
+        # На главной заведомо больше запросов, чем в бюджете middleware
+        logger.setLevel(logging.ERROR)
+        self.addCleanup(logger.setLevel, level)
+
+        seed_dataset(20, seed=1)
+        stock_before = dict(Product.objects.values_list('id', 'stock'))
+        results = StorefrontBenchmark(seed=1, iterations=1, warmup=0, cart_sizes=(1, 3)).run()
+
+        self.assertIn('home', results)
+        self.assertIn('process_user_order[cart=3]', results)
+        for key, summary in results.items():
+            with self.subTest(key=key):
+                self.assertEqual(summary['errors'], 0)
+                self.assertEqual(summary['samples'], 1)
+        # Заказы внутри замеров откатываются
+        self.assertEqual(dict(Product.objects.values_list('id', 'stock')), stock_before)
+
+
+def increment_in_child(directory):
+    with override_settings(METRICS_DIR=directory):
+        metrics.ORDERS_PLACED.inc(2, customer='guest')
+
+
+class MetricsTests(TestCase):
+    def setUp(self):
+        self.directory = use_temporary_metrics_dir(self.addCleanup)
+
+    def test_values_are_summed_across_processes(self):
+        metrics.ORDERS_PLACED.inc(customer='guest')
+        process = multiprocessing.get_context('fork').Process(target=increment_in_child, args=(self.directory,))
+        process.start()
+        process.join()
+        self.assertIn('voentorg_orders_placed_total{customer="guest"} 3.0', metrics.render_metrics())
+
+    def test_dead_process_values_move_to_archive(self):
+        metrics.ORDERS_PLACED.inc(customer='guest')
+        process = multiprocessing.get_context('fork').Process(target=increment_in_child, args=(self.directory,))
+        process.start()
+        process.join()
+        child_file = os.path.join(self.directory, f'metrics_{process.pid}.db')
+        self.assertTrue(os.path.exists(child_file))
+
+        metrics.mark_process_dead(process.pid)
+        self.assertFalse(os.path.exists(child_file))
+        self.assertIn('voentorg_orders_placed_total{customer="guest"} 3.0', metrics.render_metrics())
+
+        # Перезапуск сервиса: файлы прошлого запуска удаляются до старта воркеров
+        self.assertEqual(metrics.clear_metrics_dir(), 2)
+        self.assertEqual(os.listdir(self.directory), [])
+
+    def test_histogram_buckets_are_cumulative(self):
+        metrics.REQUEST_DURATION.observe(0.003, view='home', method='GET')
+        metrics.REQUEST_DURATION.observe(0.2, view='home', method='GET')
+        text = metrics.render_metrics()
+        self.assertIn('voentorg_http_request_duration_seconds_bucket{view="home",method="GET",le="0.005"} 1.0', text)
+        self.assertIn('voentorg_http_request_duration_seconds_bucket{view="home",method="GET",le="0.25"} 2.0', text)
+        self.assertIn('voentorg_http_request_duration_seconds_count{view="home",method="GET"} 2.0', text)
+
+    def test_store_grows_beyond_initial_size(self):
+        for index in range(2000):
+            metrics.CACHE_REQUESTS.inc(cache=f'layer-{index}', result='hit')
+        self.assertIn('voentorg_cache_requests_total{cache="layer-1999",result="hit"} 1.0', metrics.render_metrics())
+
+    def test_endpoint_is_staff_only(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 302)
+        staff = CustomUser.objects.create_user(
+            email='staff@example.com', username='staff', password='secret-password-1', is_staff=True
+        )
+        self.client.force_login(staff)
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'# TYPE voentorg_http_request_duration_seconds histogram', response.content)
+
+
+class TracingTests(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.path = f'{self.directory.name}/traces.jsonl'
+
+    def test_sampled_request_has_view_sql_template_and_session_spans(self):
+        product = Product.objects.create(name='Фляга', price=500, stock=5)
+        templates = [{**settings.TEMPLATES[0], 'BACKEND': 'voentorg.tracing.TracedDjangoTemplates'}]
+        with override_settings(TRACING_SAMPLE_RATE=1.0, TRACING_FILE=self.path,
+                               TEMPLATES=templates, SESSION_ENGINE='voentorg.tracing'):
+            self.client.post(f'/cart/ajax_add/{product.id}/')
+            self.client.get('/cart/')
+        add, cart = list(tracing.read_traces(self.path))
+        self.assertEqual(add['view'], 'ajax_add_to_cart')
+        self.assertIn(('session save', 'session'), {(span['name'], span['kind']) for span in add['spans']})
+        kinds = {span['kind'] for span in cart['spans']}
+        self.assertTrue({'http', 'view', 'db', 'template'} <= kinds)
+        spans = {span['id']: span for span in cart['spans']}
+        view = next(span for span in cart['spans'] if span['kind'] == 'view')
+        template = next(span for span in cart['spans'] if span['kind'] == 'template')
+        self.assertEqual(spans[template['parent']], view)
+        self.assertTrue(any(stack.startswith('GET cart;view;') for stack in tracing.folded_stacks(cart)))
+
+    def test_standard_backends_without_tracing(self):
+        self.assertEqual(settings.TEMPLATES[0]['BACKEND'], 'django.template.backends.django.DjangoTemplates')
+        self.assertEqual(settings.SESSION_ENGINE, 'django.contrib.sessions.backends.db')
+
+    def test_unsampled_requests_are_not_written(self):
+        with override_settings(TRACING_SAMPLE_RATE=0.0, TRACING_FILE=self.path):
+            self.client.get('/cart/')
+        self.assertEqual(list(tracing.read_traces(self.path)), [])
+
+
+class ProfilingTests(TestCase):
+    def setUp(self):
+        logger = logging.getLogger('voentorg')
+        level = logger.level
+        logger.setLevel(logging.WARNING)
+        self.addCleanup(logger.setLevel, level)
+        self.staff = CustomUser.objects.create_user(
+            email='staff@example.com', username='staff', password='secret-password-1', is_staff=True
+        )
+
+    def test_staff_request_is_profiled_with_memory(self):
+        self.client.force_login(self.staff)
+        response = self.client.get('/catalog/', {'_profile': 'memory'})
+        profile = RequestProfile.objects.get(pk=response['X-Profile-Id'])
+        self.assertEqual(profile.view_name, 'catalog')
+        self.assertIn('cumulative', profile.cpu_summary)
+        self.assertIsNotNone(profile.peak_memory)
+
+        # Скачивание требует права просмотра профилей в админке
+        self.staff.is_superuser = True
+        self.staff.save()
+        download = self.client.get(f'/admin/voentorg/requestprofile/{profile.pk}/download/')
+        self.assertEqual(download.status_code, 200)
+        self.assertEqual(bytes(download.content), bytes(profile.profile_data))
+
+    def test_flag_is_ignored_for_customers(self):
+        customer = CustomUser.objects.create_user(
+            email='customer@example.com', username='customer', password='secret-password-1'
+        )
+        self.client.force_login(customer)
+        response = self.client.get('/catalog/', HTTP_X_PROFILE='1')
+        self.assertNotIn('X-Profile-Id', response)
+        self.assertFalse(RequestProfile.objects.exists())
+
+
+class SlowQueryTests(TestCase):
+    def test_shape_of_filtered_and_sorted_query(self):
+        sql = str(Product.objects.filter(is_available=True, category_id=1, price__gte=10).order_by('price').query)
+        shape = query_shape(sql)
+        self.assertEqual(shape['equality'], ['category_id'])
+        self.assertEqual(shape['ranges'], ['price'])
+        self.assertEqual(shape['booleans'], {'is_available': True})
+        self.assertEqual(shape['order'], [('price', False)])
+        self.assertEqual(
+            index_definition(propose_index(shape)),
+            "models.Index(fields=['category', 'price'], name='product_category_price_p_idx', "
+            "condition=models.Q(is_available=True))",
+        )
+
+    def test_slow_queries_are_recorded_and_advised(self):
+        Product.objects.create(name='Фляга', price=500, stock=5)
+        logger = logging.getLogger('voentorg')
+        level = logger.level
+        logger.setLevel(logging.WARNING)
+        self.addCleanup(logger.setLevel, level)
+        with override_settings(SLOW_QUERY_THRESHOLD=0):
+            self.client.get('/')
+            self.client.get('/')
+
+        entry = SlowQuery.objects.get(fingerprint__contains='ORDER BY "voentorg_product"."popularity_score" DESC')
+        self.assertEqual(entry.calls, 2)
+        self.assertEqual(entry.view_name, 'home')
+        self.assertIn('voentorg_product', entry.plan)
+        # Индекс под эту сортировку уже есть, советник его не предлагает
+        names = [proposal['name'] for proposal in advise_indexes(SlowQuery.objects.all())]
+        self.assertNotIn('product_popularity_p_idx', names)
+
+
+class PopularityTests(TestCase):
+    def sell(self, product, quantity, days_ago=0):
+        create_order(product, quantity=quantity, days_ago=days_ago)
+
+    def test_recent_sales_outrank_old_ones_and_updates_are_incremental(self):
+        old_hit = Product.objects.create(name='Старый хит', price=100, stock=50)
+        new_hit = Product.objects.create(name='Новинка', price=100, stock=1)
+        unsold = Product.objects.create(name='Без продаж', price=100, stock=500)
+        self.sell(old_hit, 8, days_ago=4 * HALF_LIFE_DAYS)
+        self.sell(new_hit, 2)
+        call_command('update_popularity', '--lag', '0', stdout=StringIO())
+
+        ranking = list(Product.objects.available().order_by('-popularity_score', '-created_at'))
+        self.assertEqual(ranking, [new_hit, old_hit, unsold])
+        old_hit.refresh_from_db()
+        self.assertAlmostEqual(current_popularity(old_hit.popularity_score), 0.5, delta=0.05)
+
+        # Повторный запуск учитывает только новые позиции
+        self.sell(old_hit, 8)
+        call_command('update_popularity', '--lag', '0', stdout=StringIO())
+        new_hit.refresh_from_db()
+        self.assertAlmostEqual(current_popularity(new_hit.popularity_score), 2, delta=0.1)
+        self.assertEqual(Product.objects.available().order_by('-popularity_score').first(), old_hit)
+
+    def test_cancellation_after_processing_is_subtracted(self):
+        product = Product.objects.create(name='Фляга', price=100, stock=50)
+        order = create_order(product, quantity=3, status='delivered')
+        self.sell(product, 1)
+        call_command('update_popularity', '--lag', '0', stdout=StringIO())
+
+        order.status = OrderStatus.objects.get_or_create(code='cancelled', defaults={'name': 'Отменён'})[0]
+        order.save()
+        product.refresh_from_db()
+        self.assertAlmostEqual(current_popularity(product.popularity_score), 1, delta=0.01)
+
+        # Снятие отмены возвращает продажи, а повторный пересчет их не удваивает
+        order.status = OrderStatus.objects.get(code='delivered')
+        order.save()
+        call_command('update_popularity', '--lag', '0', stdout=StringIO())
+        product.refresh_from_db()
+        self.assertAlmostEqual(current_popularity(product.popularity_score), 4, delta=0.01)
+
+    def test_epoch_rebase_keeps_order_and_current_popularity(self):
+        hit = Product.objects.create(name='Хит', price=100, stock=50)
+        rare = Product.objects.create(name='Редкий', price=100, stock=50)
+        self.sell(hit, 5)
+        self.sell(rare, 1, days_ago=HALF_LIFE_DAYS)
+        call_command('update_popularity', '--lag', '0', stdout=StringIO())
+        epoch = current_epoch()
+        later = epoch + timedelta(days=REBASE_AFTER_HALF_LIVES * HALF_LIFE_DAYS)
+        before = {
+            product.pk: current_popularity(product.popularity_score, today=later, epoch=epoch)
+            for product in Product.objects.all()
+        }
+
+        self.assertTrue(rebase_epoch(later))
+        self.assertEqual(current_epoch(), later)
+        self.assertFalse(rebase_epoch(later))
+        # Оценки уменьшились на вес новой даты, а популярность на любой день осталась прежней
+        for product in Product.objects.all():
+            self.assertAlmostEqual(current_popularity(product.popularity_score, today=later) / before[product.pk], 1)
+        self.assertEqual(Product.objects.order_by('-popularity_score').first(), hit)
+
+
+class RecommendationTests(TestCase):
+    def order(self, *products):
+        create_order(*products)
+
+    def test_bought_together_then_category_fallback(self):
+        category = Category.objects.create(name='Снаряжение', slug='gear')
+        tent, mat, lamp, flask, sold_out = [
+            Product.objects.create(name=name, price=100, stock=10, category=category)
+            for name in ('Палатка', 'Коврик', 'Фонарь', 'Фляга', 'Снятый товар')
+        ]
+        Product.objects.filter(pk=sold_out.pk).update(is_available=False)
+        Product.objects.filter(pk=flask.pk).update(popularity_score=5)
+        for _ in range(2):
+            self.order(tent, mat)
+            self.order(tent, sold_out)
+        # Одна совместная покупка - ниже порога min_support
+        self.order(tent, lamp)
+        call_command('build_recommendations', '--top-k', '3', '--min-support', '2', stdout=StringIO())
+
+        rows = list(ProductRecommendation.objects.filter(product=tent).values_list('recommended', 'kind'))
+        self.assertEqual(rows, [
+            (mat.pk, ProductRecommendation.KIND_BOUGHT_TOGETHER),
+            (flask.pk, ProductRecommendation.KIND_CATEGORY),
+            (lamp.pk, ProductRecommendation.KIND_CATEGORY),
+        ])
+        self.assertEqual(
+            ProductRecommendation.objects.get(product=mat, rank=0).recommended, tent
+        )
+
+        response = self.client.get(f'/product/{tent.pk}/')
+        self.assertEqual(response.context['recommendations'], [mat, flask, lamp])
+        self.assertContains(response, 'Коврик')
+
+
+@override_settings(CATALOG_ENGINE=True, CATALOG_ENGINE_MAX_AGE=None, CATALOG_PAGE_SIZE=3)
+class CatalogEngineTests(TestCase):
+    def setUp(self):
+        catalog_engine.invalidate()
+        self.addCleanup(catalog_engine.invalidate)
+        gear, food = Category.objects.bulk_create([
+            Category(name='Снаряжение', slug='gear'), Category(name='Сухпайки', slug='food'),
+        ])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.products = [
+                Product.objects.create(
+                    name=f'Товар {i}', slug=f'item-{i}', price=price, stock=5,
+                    category=gear if i % 2 else food, popularity_score=score,
+                )
+                for i, (price, score) in enumerate([(300, 1), (100, 0), (250.5, 4), (100, 2), (900, 0)])
+            ]
+            hidden = self.products[4]
+            hidden.is_available = False
+            hidden.save()
+        self.gear = gear
+
+    def database_order(self, category_id, sort):
+        products = Product.objects.available()
+        if category_id is not None:
+            products = products.filter(category_id=category_id)
+        return list(products.order_by(*SORT_ORDERS[sort]).values_list('id', flat=True))
+
+    def test_selection_matches_database_ordering(self):
+        snapshot = catalog_engine.get_snapshot()
+        for category_id in (None, self.gear.id):
+            for sort in SORT_ORDERS:
+                with self.subTest(category=category_id, sort=sort):
+                    positions = snapshot.select(category_id, sort)
+                    self.assertEqual(snapshot.ids(positions).tolist(), self.database_order(category_id, sort))
+        self.assertEqual(snapshot.price_range(snapshot.select()), (Decimal('100.00'), Decimal('300.00')))
+
+    def test_listing_fetches_only_visible_page(self):
+        catalog_engine.get_snapshot()
+        with self.assertNumQueries(0):
+            page, price_range = product_listing(None, 'price_desc', '2', with_price_range=True)
+        with self.assertNumQueries(1):
+            products = list(page.object_list)
+        self.assertEqual([product.id for product in products], self.database_order(None, 'price_desc')[3:])
+        prices = Product.objects.available().aggregate(models.Min('price'), models.Max('price'))
+        self.assertEqual(price_range, (prices['price__min'], prices['price__max']))
+
+    def test_disabled_engine_does_not_touch_cache(self):
+        cache.delete(catalog_engine.VERSION_KEY)
+        with override_settings(CATALOG_ENGINE=False), self.captureOnCommitCallbacks(execute=True):
+            self.products[0].save()
+            products_changed.send(sender=Product, product_ids=None)
+        self.assertIsNone(cache.get(catalog_engine.VERSION_KEY))
+
+    def test_saved_products_are_patched_into_snapshot(self):
+        first = catalog_engine.get_snapshot()
+        cheapest = self.products[0]
+        with self.captureOnCommitCallbacks(execute=True):
+            cheapest.price = 10
+            cheapest.save()
+            self.products[1].delete()
+
+        # Перечитываются только измененные товары
+        with self.assertNumQueries(1):
+            snapshot = catalog_engine.get_snapshot()
+        self.assertGreater(snapshot.version, first.version)
+        self.assertEqual(snapshot.ids(snapshot.select(sort='price_asc')).tolist(), self.database_order(None, 'price_asc'))
+        self.assertIs(catalog_engine.get_snapshot(), snapshot)
+
+
+class SalesRollupTests(TestCase):
+    def setUp(self):
+        self.category = Category.objects.create(name='Снаряжение', slug='gear')
+        self.tent = Product.objects.create(name='Палатка', price=1000, stock=50, category=self.category)
+        self.mat = Product.objects.create(name='Коврик', price=300, stock=50, category=self.category)
+
+    def rollup(self, *args):
+        call_command('update_sales_rollups', '--lag', '0', *args, stdout=StringIO())
+
+    def totals(self):
+        return {
+            (sales.product_id, sales.quantity, sales.revenue)
+            for sales in DailySales.objects.all()
+        }
+
+    def test_incremental_rollup_skips_cancelled_and_survives_archiving(self):
+        create_order(self.tent, self.mat, status='delivered', days_ago=400)
+        create_order(self.tent, quantity=5, status='cancelled', days_ago=400)
+        self.rollup()
+        self.assertEqual(self.totals(), {(self.tent.pk, 1, Decimal('1000')), (self.mat.pk, 1, Decimal('300'))})
+
+        # Новые позиции добавляются к агрегатам, уже учтенные не считаются повторно
+        create_order(self.tent, quantity=2, status='delivered', days_ago=400)
+        self.rollup()
+        self.assertEqual(self.totals(), {(self.tent.pk, 3, Decimal('3000')), (self.mat.pk, 1, Decimal('300'))})
+
+        call_command('update_popularity', '--lag', '0', stdout=StringIO())
+        call_command('archive_orders', '--days', '180', stdout=StringIO())
+        self.assertFalse(Order.objects.exists())
+        self.rollup('--rebuild')
+        self.assertEqual(self.totals(), {(self.tent.pk, 3, Decimal('3000')), (self.mat.pk, 1, Decimal('300'))})
+
+    def test_unsettled_items_wait_for_rollup_and_archiving(self):
+        create_order(self.tent, status='delivered', days_ago=400)
+        recent = create_order(self.mat)
+        call_command('update_sales_rollups', stdout=StringIO())
+        call_command('update_popularity', stdout=StringIO())
+        # Позиция свежего заказа внутри окна --lag еще не учтена
+        self.assertEqual(self.totals(), {(self.tent.pk, 1, Decimal('1000'))})
+        self.assertEqual(RollupCheckpoint.objects.get(name=DAILY_SALES_CHECKPOINT).last_id, recent.items.get().pk - 1)
+
+        late = create_order(self.mat, status='delivered', days_ago=400)
+        output = StringIO()
+        call_command('archive_orders', '--days', '180', stdout=output)
+        self.assertIn('еще не учтенными в агрегатах: 1', output.getvalue())
+        self.assertTrue(Order.objects.filter(pk=late.pk).exists())
+
+    def test_cancellation_after_rollup_is_subtracted(self):
+        create_order(self.tent, status='delivered', days_ago=3)
+        order = Order.objects.get(pk=create_order(self.tent, self.mat, quantity=2, status='delivered', days_ago=3).pk)
+        self.rollup()
+
+        order.status = OrderStatus.objects.get_or_create(code='cancelled', defaults={'name': 'Отменён'})[0]
+        order.save()
+        self.assertEqual(self.totals(), {(self.tent.pk, 1, Decimal('1000')), (self.mat.pk, 0, Decimal('0'))})
+
+        # Снятие отмены возвращает продажи, а повторный пересчет их не удваивает
+        order.status = OrderStatus.objects.get(code='delivered')
+        order.save()
+        self.rollup()
+        self.assertEqual(self.totals(), {(self.tent.pk, 3, Decimal('3000')), (self.mat.pk, 2, Decimal('600'))})
+
+    def test_analytics_loads_only_report_days(self):
+        today = timezone.localdate()
+        for days_ago in (0, 5, 40, 400):
+            DailySales.objects.create(
+                date=today - timedelta(days=days_ago), product=self.tent, category=self.category,
+                quantity=1, revenue=1000,
+            )
+        start = (today - timedelta(days=40)).toordinal()
+
+        data = load_sales_arrays(start, today.toordinal())
+        self.assertEqual(sorted(data['day']), [start, (today - timedelta(days=5)).toordinal()])
+
+
+class ReorderForecastTests(TestCase):
+    def test_known_demand_gives_suggested_quantity(self):
+        steady = Product.objects.create(name='Фляга', price=500, stock=10)
+        stocked = Product.objects.create(name='Кружка', price=200, stock=1000)
+        idle = Product.objects.create(name='Палатка', price=9000, stock=0)
+        today = timezone.localdate()
+        for days_ago in range(10):
+            for product in (steady, stocked):
+                DailySales.objects.create(
+                    date=today - timedelta(days=days_ago), product=product, quantity=3, revenue=product.price * 3
+                )
+
+        call_command(
+            'forecast_reorders', '--skip-rollups', '--alpha', '0.5', '--lead-time', '14', '--cover-days', '30',
+            stdout=StringIO(),
+        )
+
+        # Постоянный спрос 3 шт./день сглаживается в 3: остатка хватит на 10 / 3 дня,
+        # заказать нужно 3 * (14 + 30) - 10. Запаса 1000 хватает, без продаж спроса нет
+        suggestion = ReorderSuggestion.objects.get()
+        self.assertEqual(suggestion.product, steady)
+        self.assertAlmostEqual(suggestion.daily_demand, 3, places=3)
+        self.assertAlmostEqual(suggestion.days_of_cover, 3.3)
+        self.assertEqual(suggestion.suggested_quantity, 122)
+        self.assertFalse(ReorderSuggestion.objects.filter(product__in=[stocked, idle]).exists())
+
+
+class PopulateDbTests(TestCase):
+    def populate(self, orders):
+        output = StringIO()
+        call_command(
+            'populate_db', '--skip-images', '--users', '2', '--products', '5', '--orders', str(orders), stdout=output
+        )
+        return output.getvalue()
+
+    def test_generation_resumes_from_saved_progress(self):
+        self.populate(3)
+        self.assertEqual(
+            dict(GenerationProgress.objects.filter(seed=0).values_list('kind', 'created_count')),
+            {'products': 5, 'users': 2, 'orders': 3},
+        )
+        # Прогресс генератора не смешивается с отметками пересчетов (их ведут update_popularity и другие)
+        self.assertFalse(RollupCheckpoint.objects.filter(name__startswith='populate_db').exists())
+        orders = Order.objects.count()
+
+        output = self.populate(4)
+        self.assertIn('Продолжение генерации (orders, seed=0) с записи 3', output)
+        self.assertEqual(Order.objects.count(), orders + 1)
+
+
+class OrderArchiveTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(
+            email='buyer@example.com', username='buyer', password='secret-password-1'
+        )
+        self.product = Product.objects.create(name='Палатка', price=1000, stock=50)
+
+    def test_archive_round_trip(self):
+        order = create_order(self.product, quantity=2, status='delivered', days_ago=200, user=self.user)
+        item = order.items.get()
+        created_at = Order.objects.get(pk=order.pk).created_at
+        fresh = create_order(self.product, status='delivered', days_ago=10, user=self.user)
+        run_rollups()
+        call_command('archive_orders', '--days', '180', stdout=StringIO())
+
+        self.assertEqual(list(Order.objects.values_list('pk', flat=True)), [fresh.pk])
+        archived = ArchivedOrder.objects.get(pk=order.pk)
+        self.assertEqual(
+            (archived.user, archived.status.code, archived.total_amount, archived.created_at),
+            (self.user, 'delivered', order.total_amount, created_at),
+        )
+        archived_item = archived.items.get()
+        self.assertEqual(
+            (archived_item.pk, archived_item.product, archived_item.quantity, archived_item.subtotal),
+            (item.pk, self.product, 2, item.subtotal),
+        )
+        self.assertEqual(archived.total_items, 2)
+
+    def test_export_includes_archived_orders_on_request(self):
+        archived = create_order(self.product, status='delivered', days_ago=200, user=self.user)
+        live = create_order(self.product, user=self.user)
+        run_rollups()
+        call_command('archive_orders', '--days', '180', stdout=StringIO())
+
+        def exported(*args):
+            output = StringIO()
+            call_command('export_orders', *args, stdout=output)
+            return [int(line.split(',')[0]) for line in output.getvalue().splitlines()[1:]]
+
+        self.assertEqual(exported(), [live.pk])
+        self.assertEqual(exported('--include-archived'), [archived.pk, live.pk])
+
+    def test_order_history_merges_live_and_archived_pages(self):
+        ages = [1, 300, 5, 250, 40]
+        for days_ago in ages:
+            create_order(self.product, status='delivered', days_ago=days_ago, user=self.user)
+        create_order(self.product, status='delivered', days_ago=3)
+        run_rollups()
+        call_command('archive_orders', '--days', '180', stdout=StringIO())
+
+        self.client.force_login(self.user)
+        with patch('voentorg.views.ORDERS_PER_PAGE', 2):
+            pages = [get_order_history(self.user, number) for number in (1, 2, 3)]
+            response = self.client.get('/orders/?page=3')
+        self.assertEqual(response.context['page_obj'].number, 3)
+        self.assertEqual(pages[0].paginator.count, len(ages))
+        dates = [order.created_at for page in pages for order in page]
+        self.assertEqual(dates, sorted(dates, reverse=True))
+        self.assertEqual(
+            [order.is_archived for page in pages for order in page],
+            [False, False, False, True, True],
+        )
+
+
+class StockLedgerTests(TestCase):
+    def test_change_stock_refuses_to_go_negative(self):
+        product = Product.objects.create(name='Фляга', price=500, stock=0)
+        product.increase_stock(10, reason=StockMovement.REASON_IMPORT)
+        product.decrease_stock(3)
+        with self.assertRaisesMessage(ValueError, 'Доступно: 7'):
+            product.decrease_stock(20)
+
+        self.assertEqual(product.stock, 7)
+        self.assertEqual(list(product.stock_movements.order_by('id').values_list('change', flat=True)), [10, -3])
+
+    def test_reconcile_fixes_drift_and_snapshots(self):
+        product = Product.objects.create(name='Фляга', price=500, stock=0)
+        product.increase_stock(10, reason=StockMovement.REASON_IMPORT)
+        Product.objects.filter(pk=product.pk).update(stock=99)
+
+        output = StringIO()
+        call_command('reconcile_stock', '--fix', '--snapshot', stdout=output)
+        self.assertIn('в карточке 99, по журналу 10', output.getvalue())
+        product.refresh_from_db()
+        self.assertEqual(product.stock, 10)
+        self.assertEqual(StockSnapshot.objects.get(product=product).stock, 10)
+
+        # После снимка остаток считается от него плюс новые движения
+        product.decrease_stock(4)
+        output = StringIO()
+        call_command('reconcile_stock', stdout=output)
+        self.assertIn('расхождений: 0', output.getvalue())
+
+
+class WarehouseSyncTests(TestCase):
+    def setUp(self):
+        self.flask = Product.objects.create(name='Фляга', slug='flask', price=500, stock=0)
+        self.flask.increase_stock(10, reason=StockMovement.REASON_IMPORT)
+        self.mug = Product.objects.create(name='Кружка', slug='mug', price=200, stock=0)
+        self.mug.increase_stock(4, reason=StockMovement.REASON_IMPORT)
+
+    def sync(self, content, suffix='.csv'):
+        with tempfile.NamedTemporaryFile('w', suffix=suffix, encoding='utf-8', delete=False) as file:
+            file.write(content)
+        self.addCleanup(os.remove, file.name)
+        output = StringIO()
+        call_command('sync_warehouse', file.name, stdout=output)
+        return output.getvalue()
+
+    def test_only_changed_rows_are_written(self):
+        changed = []
+
+        def receiver(sender, product_ids, **kwargs):
+            changed.append(product_ids)
+        products_changed.connect(receiver)
+        self.addCleanup(products_changed.disconnect, receiver)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            output = self.sync('slug,price,stock,is_available\nflask,500.00,10,1\nmug,250,6,да\nknife,900,3,1\n')
+        self.assertIn('неизвестных: 1, ошибочных: 0, изменилось: 1', output)
+        self.assertEqual(changed, [[self.mug.pk]])
+
+        self.mug.refresh_from_db()
+        self.assertEqual((self.mug.price, self.mug.stock), (Decimal('250'), 6))
+        # Остаток меняется движением на разницу, неизменный товар журнал не трогает
+        movement = self.mug.stock_movements.latest('id')
+        self.assertEqual((movement.change, movement.note), (2, 'sync_warehouse'))
+        self.assertEqual(self.flask.stock_movements.count(), 1)
+        self.assertFalse(Product.objects.filter(slug='knife').exists())
+
+        # Повторная синхронизация той же выгрузки ничего не записывает
+        with self.assertNumQueries(1):
+            output = self.sync('slug,price,stock,is_available\nflask,500.00,10,1\nmug,250,6,да\n')
+        self.assertIn('изменилось: 0', output)
+
+    def test_jsonl_feed_and_missing_products(self):
+        output = self.sync('{"slug": "flask", "price": "450,50", "is_available": false}\n\n', suffix='.jsonl')
+        self.assertIn('изменилось: 1', output)
+        self.flask.refresh_from_db()
+        self.assertEqual((self.flask.price, self.flask.stock, self.flask.is_available), (Decimal('450.50'), 10, False))
+
+        self.assertEqual(list(batched(range(5), 2)), [[0, 1], [2, 3], [4]])
+        self.assertEqual([parse_bool(value) for value in ('Да', '0', True, 'no')], [True, False, True, False])
+
+
+class SingleThreadedLiveServerThread(LiveServerThread):
+    """Запросы обслуживаются по одному: тестовая база SQLite в памяти общая для всех потоков сервера"""
+
+    def _create_server(self, connections_override=None):
+        return WSGIServer((self.host, self.port), QuietWSGIRequestHandler, allow_reuse_address=False)
+
+
+class LoadTestSmokeTests(LiveServerTestCase):
+    server_thread_class = SingleThreadedLiveServerThread
+
+    def test_shoppers_keep_stock_and_ledger_consistent(self):
+        for index in range(4):
+            product = Product.objects.create(name=f'Фляга {index}', price=500, stock=0)
+            product.increase_stock(10, reason=StockMovement.REASON_IMPORT)
+
+        output = StringIO()
+        call_command(
+            'load_test', '--url', self.live_server_url, '--shoppers', '3', '--journeys', '2',
+            '--hot-products', '2', '--hot-stock', '3', stdout=output,
+        )
+        self.assertNotIn('НАРУШЕНО', output.getvalue())
+        self.assertGreater(Order.objects.count(), 0)
+
+        output = StringIO()
+        call_command('reconcile_stock', stdout=output)
+        self.assertIn('расхождений: 0', output.getvalue())
+
+
+class ProductImportTests(TestCase):
+    def import_file(self, content):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', encoding='utf-8', delete=False) as file:
+            file.write(content)
+        self.addCleanup(os.remove, file.name)
+        call_command('import_products', file.name, stdout=StringIO())
+
+    def test_generated_slugs_avoid_batch_and_database_collisions(self):
+        for name, slug in [('Tent', 'tent'), ('Tent', 'tent-1'), ('Tent pole', 'tent-pole'), ('Tents', 'tents')]:
+            Product.objects.create(name=name, slug=slug, price=100)
+        self.import_file('name,price,slug\nTent,100,\nTent,110,\nTent,120,tent-2\n')
+
+        self.assertEqual(
+            dict(Product.objects.filter(slug__startswith='tent-').values_list('slug', 'price')),
+            {'tent-1': 100, 'tent-2': 120, 'tent-3': 100, 'tent-4': 110, 'tent-pole': 100},
+        )
+        # Одиночное сохранение подбирает slug так же
+        self.assertEqual(Product.objects.create(name='Tent', price=100).slug, 'tent-5')
+
+    def test_stock_change_is_recorded_as_delta(self):
+        product = Product.objects.create(name='Flask', slug='flask', price=500, stock=0)
+        product.increase_stock(10, reason=StockMovement.REASON_IMPORT)
+        self.import_file('name,price,slug,stock\nFlask,500,flask,15\nMug,200,,4\n')
+
+        product.refresh_from_db()
+        self.assertEqual(product.stock, 15)
+        self.assertEqual(list(product.stock_movements.order_by('id').values_list('change', flat=True)), [10, 5])
+        self.assertEqual(Product.objects.get(slug='mug').stock_movements.get().change, 4)
+
+    def test_cyrillic_names_get_unique_fallback_slugs(self):
+        self.import_file('name,price\nФляга,500\nТактический жилет,4000\nТактический рюкзак,3000\n')
+
+        slugs = list(Product.objects.values_list('slug', flat=True))
+        self.assertEqual(len(set(slugs)), 3)
+        for slug in slugs:
+            self.assertRegex(slug, r'^product-[0-9a-f]{8}$')
+
+
+class RenditionTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.storage = FileSystemStorage(location=directory.name)
+
+    def test_small_original_is_not_upscaled(self):
+        renditions = render_renditions(Image.new('RGB', (200, 150), 'olive'))
+
+        # 2x совпал бы с 1x - его нет; обрезка сохраняет пропорции пресета, вписывание - размер оригинала
+        self.assertEqual(
+            {key: size for key, (content, size) in renditions.items() if key[2] == 'jpeg'},
+            {('card', 1, 'jpeg'): (200, 133), ('thumb', 1, 'jpeg'): (100, 80),
+             ('thumb', 2, 'jpeg'): (188, 150), ('detail', 1, 'jpeg'): (200, 150)},
+        )
+
+    def test_placeholder_is_tiny_jpeg_with_average_color(self):
+        data_uri, color = render_placeholder(Image.new('RGB', (800, 400), (120, 130, 40)))
+
+        self.assertEqual(color, '#788228')
+        prefix = 'data:image/jpeg;base64,'
+        self.assertTrue(data_uri.startswith(prefix))
+        with Image.open(BytesIO(base64.b64decode(data_uri.removeprefix(prefix)))) as placeholder:
+            self.assertEqual(placeholder.size, (16, 8))
+
+    def test_missing_image_falls_back_to_local_picture(self):
+        self.assertHTMLEqual(
+            render_template('{% load product_images %}{% no_image "card" "Фляга" element_id="main" %}'),
+            '<img src="/static/voentorg/img/no-image.svg" alt="Фляга" id="main" width="300" height="200">',
+        )
+        product = Product.objects.create(name='Фляга', price=500, stock=5)
+        self.assertContains(
+            self.client.get(f'/product/{product.id}/'),
+            '<img src="/static/voentorg/img/no-image.svg" alt="Фляга" id="main-product-image" width="500" height="400">',
+            html=True,
+        )
+
+    def test_srcset_uses_cached_manifest(self):
+        name = self.storage.save('photo.jpg', ContentFile(b''))
+        field_file = FieldFile(None, SimpleNamespace(storage=self.storage), name)
+        save_renditions(self.storage, name, render_renditions(Image.new('RGB', (800, 300), 'olive')))
+        cache.clear()
+
+        with patch.object(self.storage, 'exists', wraps=self.storage.exists) as exists, \
+                patch.object(self.storage, 'open', wraps=self.storage.open) as opened:
+            for _ in range(3):
+                self.assertTrue(has_renditions(field_file))
+                srcset = rendition_srcset(field_file, 'detail', 'webp')
+        self.assertEqual(srcset, '/media/photo_detail_1x.webp 500w, /media/photo_detail_2x.webp 800w')
+        self.assertEqual(exists.call_count, 0)
+        self.assertEqual(opened.call_count, 1)
+
+        # Файлы без копий не ломают вывод
+        self.assertFalse(has_renditions(FieldFile(None, SimpleNamespace(storage=self.storage), 'other.jpg')))
+
+
+class MediaReferenceTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.media_root = directory.name
+        settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def upload(self, color):
+        buffer = BytesIO()
+        Image.new('RGB', (40, 30), color).save(buffer, format='JPEG')
+        return ContentFile(buffer.getvalue(), name=f'{color}.jpg')
+
+    def references(self):
+        return dict(MediaBlob.objects.values_list('sha256', 'references'))
+
+    def stored_files(self):
+        return [name for root, directories, files in os.walk(self.media_root) for name in files]
+
+    def test_references_follow_replace_and_delete(self):
+        product = Product.objects.create(name='Flask', slug='flask', price=500, image=self.upload('red'))
+        # Одинаковое содержимое - один файл с двумя ссылками
+        image = ProductImage.objects.create(product=product, image=self.upload('red'))
+        ProductImage.objects.create(product=product, image=self.upload('blue'), display_order=1)
+        red = MediaBlob.objects.get(name=product.image.name)
+        self.assertEqual(red.references, 2)
+        self.assertEqual(sorted(self.references().values()), [1, 2])
+
+        image.image = self.upload('green')
+        image.save()
+        red.refresh_from_db()
+        self.assertEqual(red.references, 1)
+        self.assertEqual(sorted(self.references().values()), [1, 1, 1])
+
+        # Повторное сохранение без замены файла ссылки не меняет
+        image.save()
+        self.assertEqual(sorted(self.references().values()), [1, 1, 1])
+
+        product.delete()
+        self.assertEqual(sorted(self.references().values()), [0, 0, 0])
+        # Оригиналы, копии и сведения о копиях остаются до сборки мусора
+        files = self.stored_files()
+        self.assertEqual(len([name for name in files if name.endswith('_renditions.json')]), 3)
+        self.assertEqual(len([name for name in files if '_' not in name]), 3)
+
+        call_command('collect_media', grace_hours=0, stdout=StringIO())
+        self.assertFalse(MediaBlob.objects.exists())
+        self.assertEqual(self.stored_files(), [])
+
+    def test_legacy_path_gets_renditions_next_to_original(self):
+        os.makedirs(os.path.join(self.media_root, 'products/images'))
+        with open(os.path.join(self.media_root, 'products/images/old_card.jpg'), 'wb') as file:
+            file.write(self.upload('red').read())
+        product = Product.objects.create(name='Flask', slug='flask', price=500, image='products/images/old_card.jpg')
+
+        self.assertTrue(has_renditions(product.image))
+        urls = [
+            candidate.split()[0] for candidate in rendition_srcset(product.image, 'card', 'webp').split(', ')
+        ] + [rendition_url(product.image, 'detail')]
+        for url in urls:
+            self.assertTrue(url.startswith('/media/products/images/old_card_'), url)
+            self.assertTrue(product.image.storage.exists(url.removeprefix('/media/')), url)
+        # Производные файлы не регистрируются как оригиналы и не попадают под сборку мусора
+        self.assertFalse(MediaBlob.objects.exists())
+
+    def test_placeholder_is_computed_only_for_new_file(self):
+        product = Product.objects.create(name='Flask', slug='flask', price=500)
+        image = ProductImage.objects.create(product=product, image=self.upload('red'))
+        self.assertTrue(image.placeholder.startswith('data:image/jpeg;base64,'))
+        red = image.dominant_color
+        self.assertRegex(red, r'^#f[0-9a-f]0[0-9a-f]0[0-9a-f]$')
+
+        with patch('voentorg.signals.generate_placeholder_safely') as generate:
+            image.display_order = 1
+            image.save()
+        generate.assert_not_called()
+
+        image.image = self.upload('blue')
+        image.save()
+        image.refresh_from_db()
+        self.assertNotEqual(image.dominant_color, red)
+        self.assertIn(f'background: {image.dominant_color} url(data:image/jpeg;base64,', render_template(
+            '{% load product_images %}{% responsive_image image.image "card" %}', image=image
+        ))
+
+    def test_recount_restores_references(self):
+        product = Product.objects.create(name='Flask', slug='flask', price=500, image=self.upload('red'))
+        MediaBlob.objects.update(references=0)
+
+        call_command('collect_media', recount=True, grace_hours=0, stdout=StringIO())
+        self.assertEqual(MediaBlob.objects.get(name=product.image.name).references, 1)
+        self.assertTrue(product.image.storage.exists(product.image.name))
+
+
+class AssetBuildTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.build_root = Path(directory.name)
+        for target in ('voentorg.assets.BUILD_ROOT', 'voentorg.management.commands.build_assets.BUILD_ROOT'):
+            patcher = patch(target, self.build_root)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        patcher = patch.dict('voentorg.assets._manifest', {'mtime': None, 'bundles': {}})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def build(self):
+        call_command('build_assets', stdout=StringIO())
+        with open(self.build_root / MANIFEST_NAME, encoding='utf-8') as file:
+            return json.load(file)['bundles']
+
+    def render_asset(self, name):
+        request = RequestFactory().get('/')
+        request.preload_assets = []
+        html = render_template('{% load assets %}{% asset name %}', name=name, request=request)
+        return html, request.preload_assets
+
+    def test_minifiers_keep_strings_and_regular_expressions(self):
+        self.assertEqual(
+            minify_css('/* шапка */\n.cart > li ,  a:hover {\n    color: red;\n    margin: 0 auto;\n}\n'),
+            '.cart>li,a:hover{color:red;margin:0 auto}',
+        )
+        self.assertEqual(
+            minify_js(
+                '// комментарий\nvar url = "http://x"; /* блок */\nvar re = /a\\/b/g;\n'
+                'function f(a, b) {\n    return a / b;\n}\nconst t = `${a}//${b}`\n'
+            ),
+            'var url = "http://x";var re = /a\\/b/g;function f(a,b){return a / b;}\nconst t = `${a}//${b}`',
+        )
+
+    def test_bundles_are_hashed_and_precompressed(self):
+        bundles = self.build()
+        self.assertEqual(set(bundles), set(ASSET_BUNDLES))
+        suffixes = ['.gz', '.br'] if build_assets.brotli is not None else ['.gz']
+        for name, built_name in bundles.items():
+            with self.subTest(bundle=name):
+                content = (self.build_root / built_name).read_bytes()
+                stem, extension = os.path.splitext(name)
+                digest = hashlib.sha256(content).hexdigest()[:12]
+                self.assertEqual(built_name, f'voentorg/dist/{stem}.{digest}{extension}')
+                self.assertEqual(gzip.decompress((self.build_root / f'{built_name}.gz').read_bytes()), content)
+                self.assertEqual(
+                    sorted(path.name for path in (self.build_root / 'voentorg/dist').glob(f'{stem}.{digest}*')),
+                    sorted(f'{stem}.{digest}{extension}{suffix}' for suffix in [''] + suffixes),
+                )
+
+        # Повторная сборка без изменений дает те же имена и побайтно те же архивы
+        gz = (self.build_root / f'{bundles["main.js"]}.gz').read_bytes()
+        self.assertEqual(self.build(), bundles)
+        self.assertEqual((self.build_root / f'{bundles["main.js"]}.gz').read_bytes(), gz)
+
+    def test_asset_tag_uses_manifest(self):
+        html, preload = self.render_asset('cart.css')
+        # Без сборки подключаются исходные файлы, и все они попадают в заголовок Link
+        self.assertEqual(preload, [
+            ('/static/voentorg/css/main.css', 'style'), ('/static/voentorg/css/cart.css', 'style'),
+        ])
+        self.assertEqual(html.count('<link rel="stylesheet"'), 2)
+
+        bundles = self.build()
+        html, preload = self.render_asset('cart.css')
+        self.assertHTMLEqual(html, f'<link rel="stylesheet" href="/static/{bundles["cart.css"]}">')
+        self.assertEqual(preload, [(f'/static/{bundles["cart.css"]}', 'style')])
+        html, preload = self.render_asset('cart.js')
+        self.assertHTMLEqual(html, f'<script src="/static/{bundles["cart.js"]}"></script>')
+        self.assertEqual(preload, [])
+
+
+class MediaRangeTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.original = f"products/sha256/ab/cd/{'ab' * 32}.jpg"
+        names = [
+            'digits.txt', 'empty.txt', self.original,
+            rendition_name(self.original, 'card', 1, 'jpeg'), manifest_name(self.original),
+        ]
+        os.makedirs(os.path.join(directory.name, 'products/sha256/ab/cd'))
+        for name, content in zip(names, [b'0123456789', b'', b'jpeg', b'jpeg', b'{}']):
+            with open(os.path.join(directory.name, name), 'wb') as file:
+                file.write(content)
+        settings_override = override_settings(MEDIA_ROOT=directory.name, MEDIA_SENDFILE_BACKEND='python')
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def test_only_originals_are_cached_as_immutable(self):
+        self.assertEqual(self.client.get(f'/media/{self.original}')['Cache-Control'], IMMUTABLE_CACHE_CONTROL)
+        # Копии и сведения о них перезаписываются при пересоздании
+        for name in [rendition_name(self.original, 'card', 1, 'jpeg'), manifest_name(self.original), 'digits.txt']:
+            with self.subTest(name=name):
+                self.assertEqual(self.client.get(f'/media/{name}')['Cache-Control'], DEFAULT_CACHE_CONTROL)
+
+    def test_parse_range(self):
+        cases = [
+            (None, 10, None), ('bytes=0-', 10, (0, 9)), ('bytes=2-4', 10, (2, 4)), ('bytes=5-100', 10, (5, 9)),
+            ('bytes=-3', 10, (7, 9)), ('bytes=-20', 10, (0, 9)),
+            # Несколько диапазонов и чужие единицы игнорируются - отдается весь файл
+            ('bytes=0-1,3-4', 10, None), ('items=0-1', 10, None), ('bytes=-', 10, None),
+        ]
+        for header, size, expected in cases:
+            with self.subTest(header=header, size=size):
+                self.assertEqual(parse_range(header, size), expected)
+
+        for header, size in [('bytes=10-', 10), ('bytes=5-2', 10), ('bytes=-0', 10), ('bytes=-5', 0), ('bytes=0-', 0)]:
+            with self.subTest(header=header, size=size):
+                with self.assertRaises(ValueError):
+                    parse_range(header, size)
+
+    def test_range_responses(self):
+        response = self.client.get('/media/digits.txt', HTTP_RANGE='bytes=2-4')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], 'bytes 2-4/10')
+        self.assertEqual(b''.join(response.streaming_content), b'234')
+
+        response = self.client.get('/media/digits.txt', HTTP_RANGE='bytes=-3')
+        self.assertEqual(b''.join(response.streaming_content), b'789')
+
+        for name, header, size in [('digits.txt', 'bytes=20-', 10), ('empty.txt', 'bytes=-1', 0)]:
+            with self.subTest(name=name, header=header):
+                response = self.client.get(f'/media/{name}', HTTP_RANGE=header)
+                self.assertEqual(response.status_code, 416)
+                self.assertEqual(response['Content-Range'], f'bytes */{size}')
+
+        # If-Range с устаревшим ETag - диапазон не действует, отдается весь файл
+        response = self.client.get('/media/digits.txt', HTTP_RANGE='bytes=2-4', HTTP_IF_RANGE='"stale"')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), b'0123456789')
@@ -0,0 +1,216 @@
+import json
+import os
+import random
+import threading
+import time
+import uuid
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.contrib.sessions.backends import db
+from django.db import connections
+from django.template import TemplateDoesNotExist
+from django.template.backends.django import DjangoTemplates, Template, reraise
+from django.utils import timezone
+
+from .queries import fingerprint
+
+# Трассировка текущего запроса (None - запрос не попал в выборку)
+_current_trace = ContextVar('voentorg_trace', default=None)
+_write_lock = threading.Lock()
+
+# Длинные запросы обрезаются, чтобы строка трассировки оставалась компактной
+MAX_SQL_LENGTH = 500
+
+
+class Trace:
+    """Трассировка одного запроса: дерево интервалов (span) с временем от начала запроса"""
+
+    def __init__(self):
+        self.trace_id = uuid.uuid4().hex
+        self.started_at = timezone.now()
+        self.origin = time.perf_counter()
+        self.spans = []
+        self.stack = []
+
+    def start_span(self, name, kind, attributes):
+        span = {
+            'id': len(self.spans) + 1,
+            'parent': self.stack[-1]['id'] if self.stack else None,
+            'name': name,
+            'kind': kind,
+            'start_ms': round((time.perf_counter() - self.origin) * 1000, 3),
+            'duration_ms': None,
+            'attributes': attributes,
+        }
+        self.spans.append(span)
+        self.stack.append(span)
+        return span
+
+    def finish_span(self, span):
+        span['duration_ms'] = round((time.perf_counter() - self.origin) * 1000 - span['start_ms'], 3)
+        self.stack.remove(span)
+
+    def as_dict(self):
+        root = self.spans[0] if self.spans else {}
+        return {
+            'trace_id': self.trace_id,
+            'started_at': self.started_at.isoformat(),
+            'duration_ms': root.get('duration_ms'),
+            **root.get('attributes', {}),
+            'spans': self.spans,
+        }
+
+
+@contextmanager
+def span(name, kind='internal', **attributes):
+    """Интервал внутри трассировки текущего запроса; вне выборки ничего не делает"""
+    trace = _current_trace.get()
+    if trace is None:
+        yield None
+        return
+    current = trace.start_span(name, kind, attributes)
+    try:
+        yield current
+    finally:
+        trace.finish_span(current)
+
+
+def trace_sql(execute, sql, params, many, context):
+    """Обертка connection.execute_wrapper: каждый SQL-запрос - отдельный интервал"""
+    with span('sql', 'db', sql=fingerprint(sql)[:MAX_SQL_LENGTH], many=many, database=context['connection'].alias):
+        return execute(sql, params, many, context)
+
+
+def write_trace(trace):
+    """Дописывает трассировку строкой JSON в TRACING_FILE"""
+    line = json.dumps(trace.as_dict(), ensure_ascii=False) + '\n'
+    with _write_lock:
+        with open(settings.TRACING_FILE, 'a', encoding='utf-8') as file:
+            file.write(line)
+
+
+class TracingMiddleware:
+    """
+    Трассирует долю запросов TRACING_SAMPLE_RATE: интервалы запроса целиком, представления,
+    каждого SQL-запроса, отрисовки шаблонов и сохранения сессии (последние два - если в настройках выбраны
+    TracedDjangoTemplates и SessionStore этого модуля). Результат - строки JSON в TRACING_FILE. Должен стоять в MIDDLEWARE первым, ViewTracingMiddleware - последним
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        rate = getattr(settings, 'TRACING_SAMPLE_RATE', 0)
+        if not rate or random.random() >= rate:
+            return self.get_response(request)
+
+        trace = Trace()
+        token = _current_trace.set(trace)
+        try:
+            with ExitStack() as stack:
+                root = stack.enter_context(span('request', 'http', method=request.method, path=request.path))
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(trace_sql))
+                response = self.get_response(request)
+                match = request.resolver_match
+                root['attributes'].update(
+                    view=match.view_name if match else None,
+                    status=response.status_code,
+                )
+        finally:
+            _current_trace.reset(token)
+        try:
+            write_trace(trace)
+        except OSError:
+            pass
+        return response
+
+
+class ViewTracingMiddleware:
+    """Интервал работы представления (вместе с разрешением URL); ставится в MIDDLEWARE последним"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with span('view', 'view'):
+            return self.get_response(request)
+
+
+class TracedTemplate(Template):
+    """Шаблон, отрисовка которого попадает в трассировку"""
+
+    def render(self, context=None, request=None):
+        with span(f'template {self.origin.template_name}', 'template'):
+            return super().render(context, request)
+
+
+class TracedDjangoTemplates(DjangoTemplates):
+    """
+    Бэкенд шаблонов Django с интервалами отрисовки в трассировке.
+    Настройки выбирают его вместо стандартного только при TRACING_SAMPLE_RATE > 0
+    """
+
+    def from_string(self, template_code):
+        return TracedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        try:
+            return TracedTemplate(self.engine.get_template(template_name), self)
+        except TemplateDoesNotExist as exc:
+            reraise(exc, self)
+
+
+class SessionStore(db.SessionStore):
+    """
+    Сессии в базе данных с интервалами загрузки и сохранения в трассировке (SESSION_ENGINE = 'voentorg.tracing').
+    Настройки выбирают его вместо стандартного только при TRACING_SAMPLE_RATE > 0
+    """
+
+    def load(self):
+        with span('session load', 'session'):
+            return super().load()
+
+    def save(self, must_create=False):
+        with span('session save', 'session'):
+            return super().save(must_create)
+
+
+def folded_stacks(trace_data):
+    """
+    Стеки трассировки в свернутом формате (стек;через;точку_с_запятой собственное_время_мкс)
+    для flamegraph.pl или speedscope
+    """
+    spans = {span['id']: span for span in trace_data['spans']}
+    children_time = {}
+    for item in trace_data['spans']:
+        if item['parent'] is not None:
+            children_time[item['parent']] = children_time.get(item['parent'], 0) + (item['duration_ms'] or 0)
+
+    stacks = {}
+    for item in trace_data['spans']:
+        names = []
+        current = item
+        while current is not None:
+            name = current['name']
+            if current['parent'] is None and trace_data.get('view'):
+                name = f'{trace_data.get("method", "")} {trace_data["view"]}'.strip()
+            names.append(name.replace(';', ','))
+            current = spans.get(current['parent'])
+        self_time = max((item['duration_ms'] or 0) - children_time.get(item['id'], 0), 0)
+        key = ';'.join(reversed(names))
+        stacks[key] = stacks.get(key, 0) + round(self_time * 1000)
+    return stacks
+
+
+def read_traces(path=None):
+    """Трассировки из файла JSON Lines"""
+    path = path or settings.TRACING_FILE
+    if not os.path.exists(path):
+        return
+    with open(path, encoding='utf-8') as file:
+        for line in file:
+            if line.strip():
+                yield json.loads(line)
@@ -1,65 +1,89 @@
+import heapq
+import itertools
 import json
 
+from django.conf import settings
+from django.core.paginator import Paginator
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth import login, authenticate
 from django.contrib.auth.forms import UserCreationForm
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.http import JsonResponse, HttpResponseRedirect
-from .models import Product, Category, Cart, CartItem, Order, OrderItem, OrderStatus
+from .models import Product, Category, Cart, CartItem, Order, OrderItem, OrderStatus, ArchivedOrder
 from .forms import CustomUserCreationForm
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth import logout as auth_logout
 from django.views.decorators.http import require_http_methods
+from . import catalog_engine, metrics
+from .recommendations import recommendations_for
+
+
+# Сортировки витрины: ключ параметра sort -> порядок в базе. id в конце - постоянный порядок
+# равных для постраничного вывода (в порядке, в котором его хранит индекс по первым столбцам)
+SORT_ORDERS = {
+    'price_asc': ('price', 'id'),
+    'price_desc': ('-price', '-id'),
+    'newest': ('-created_at', 'id'),
+    # По популярности: продажи с затуханием (update_popularity), товары без продаж - новые выше
+    'popular': ('-popularity_score', '-created_at', 'id'),
+}
+
+
+def parse_category(value):
+    """Номер категории из параметра запроса; None - все категории"""
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def product_listing(category_id, sort, page_number, with_price_range=False):
+    """
+    Страница доступных товаров и диапазон цен выборки. С CATALOG_ENGINE фильтрация, сортировка
+    и диапазон цен считаются по снимку каталога в памяти, из базы читается только страница
+    """
+    if catalog_engine.enabled():
+        snapshot = catalog_engine.get_snapshot()
+        positions = snapshot.select(category_id, sort)
+        page = Paginator(snapshot.ids(positions), settings.CATALOG_PAGE_SIZE).get_page(page_number)
+        page.object_list = catalog_engine.products_by_ids(page.object_list)
+        return page, snapshot.price_range(positions)
+
+    products = Product.objects.available()
+    if category_id is not None:
+        products = products.filter(category_id=category_id)
+    products = products.order_by(*SORT_ORDERS.get(sort, SORT_ORDERS['popular']))
+    page = Paginator(products, settings.CATALOG_PAGE_SIZE).get_page(page_number)
+    price_range = (None, None)
+    if with_price_range and page.paginator.count:
+        prices = products.aggregate(models.Min('price'), models.Max('price'))
+        price_range = prices['price__min'], prices['price__max']
+    return page, price_range
 
 
 # Главная страница
 def home(request):
     """Главная страница с каталогом товаров"""
-    products = Product.objects.filter(is_available=True)
     categories = Category.objects.all()
-
-    # Фильтрация по категории
-    category_id = request.GET.get('category')
-    if category_id and category_id != 'all':
-        try:
-            category_id = int(category_id)
-            products = products.filter(category_id=category_id)
-            selected_category = category_id
-        except ValueError:
-            selected_category = None
-    else:
-        selected_category = None
-
-    # Сортировка
+    selected_category = parse_category(request.GET.get('category'))
     sort = request.GET.get('sort', 'popular')
-    if sort == 'price_asc':
-        products = products.order_by('price')
-    elif sort == 'price_desc':
-        products = products.order_by('-price')
-    elif sort == 'newest':
-        products = products.order_by('-created_at')
-    else:
-        products = products.order_by('-stock', '-created_at')
-
-    # Определяем диапазон цен для фильтров
-    if products.exists():
-        min_price = products.aggregate(models.Min('price'))['price__min']
-        max_price = products.aggregate(models.Max('price'))['price__max']
-    else:
-        min_price = 0
-        max_price = 10000
+    page, (min_price, max_price) = product_listing(
+        selected_category, sort, request.GET.get('page'), with_price_range=True
+    )
 
     # Получаем данные корзины для отображения количества
     cart_data = get_cart_data(request)
 
     context = {
-        'products': products,
+        'products': page.object_list,
+        'page_obj': page,
         'categories': categories,
         'selected_category': selected_category,
         'sort': sort,
-        'min_price': min_price,
-        'max_price': max_price,
+        # Диапазон цен для фильтров
+        'min_price': 0 if min_price is None else min_price,
+        'max_price': 10000 if max_price is None else max_price,
         'cart_count': cart_data['total_items'],
         'title': 'Военторг - Каталог товаров'
     }
@@ -69,22 +93,14 @@ def home(request):
 # Каталог товаров
 def catalog(request):
     """Полный каталог товаров"""
-    products = Product.objects.filter(is_available=True)
+    # Шаблон каталога пока не выводит товары: QuerySet ленивый, без вывода запросов к базе нет
+    products = Product.objects.available()
     categories = Category.objects.all()
 
-    # Фильтрация по категории
-    category_id = request.GET.get('category')
-    if category_id:
+    category_id = parse_category(request.GET.get('category'))
+    if category_id is not None:
         products = products.filter(category_id=category_id)
-
-    # Сортировка
-    sort = request.GET.get('sort', 'popular')
-    if sort == 'price_asc':
-        products = products.order_by('price')
-    elif sort == 'price_desc':
-        products = products.order_by('-price')
-    elif sort == 'newest':
-        products = products.order_by('-created_at')
+    products = products.order_by(*SORT_ORDERS.get(request.GET.get('sort', 'popular'), SORT_ORDERS['popular']))
 
     context = {
         'products': products,
@@ -100,6 +116,8 @@ def product_detail(request, product_id):
     product = get_object_or_404(Product, id=product_id)
     context = {
         'product': product,
+        # Рекомендации заранее посчитаны командой build_recommendations - здесь один запрос
+        'recommendations': recommendations_for(product),
         'title': product.name
     }
     return render(request, 'voentorg/product_detail.html', context)
@@ -173,7 +191,7 @@ def custom_logout(request):
 @login_required
 def profile(request):
     """Личный кабинет пользователя"""
-    user_orders = Order.objects.filter(user=request.user).order_by('-created_at')
+    user_orders = get_order_history(request.user)
 
     context = {
         'user_orders': user_orders,
@@ -212,7 +230,7 @@ def contacts(request):
 def search(request):
     """Поиск товаров"""
     query = request.GET.get('q', '')
-    products = Product.objects.filter(is_available=True)
+    products = Product.objects.available()
 
     if query:
         products = products.filter(name__icontains=query)
@@ -234,7 +252,7 @@ def admin_redirect(request):
 def add_to_cart(request, product_id):
     """Добавление товара в корзину"""
     try:
-        product = Product.objects.get(id=product_id, is_available=True)
+        product = Product.objects.available().get(id=product_id)
         quantity = int(request.POST.get('quantity', 1))
 
         if request.user.is_authenticated:
@@ -253,6 +271,7 @@ def add_to_cart(request, product_id):
                     cart_item.quantity = new_quantity
                     cart_item.save()
                 else:
+                    metrics.STOCK_REJECTIONS.inc(source='cart')
                     if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
                         return JsonResponse({
                             'success': False,
@@ -286,6 +305,7 @@ def add_to_cart(request, product_id):
                     })
                 messages.success(request, f'Товар "{product.name}" добавлен в корзину')
             else:
+                metrics.STOCK_REJECTIONS.inc(source='cart')
                 if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
                     return JsonResponse({
                         'success': False,
@@ -385,13 +405,14 @@ def update_cart_item(request, product_id):
     if request.method == 'POST':
         try:
             quantity = int(request.POST.get('quantity', 1))
-            product = Product.objects.get(id=product_id, is_available=True)
+            product = Product.objects.available().get(id=product_id)
 
             if quantity <= 0:
                 return remove_from_cart(request, product_id)
 
             if quantity > product.stock:
                 quantity = product.stock
+                metrics.STOCK_REJECTIONS.inc(source='cart')
                 if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
                     return JsonResponse({
                         'success': False,
@@ -463,8 +484,7 @@ def clear_cart(request):
                 })
             messages.error(request, 'Корзина не найдена')
     else:
-        request.session['cart'] = '{}'
-        request.session.modified = True
+        save_session_cart(request, {})
 
         if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
             return JsonResponse({
@@ -483,10 +503,11 @@ def clear_cart(request):
 @login_required
 def user_orders(request):
     """Список заказов пользователя"""
-    orders = Order.objects.filter(user=request.user).order_by('-created_at')
+    orders = get_order_history(request.user, request.GET.get('page'))
 
     context = {
         'orders': orders,
+        'page_obj': orders,
         'title': 'Мои заказы'
     }
     return render(request, 'voentorg/orders.html', context)
@@ -520,6 +541,7 @@ def show_user_checkout_form(request):
         # Проверяем наличие товаров
         for item in cart_obj.items.all():
             if not item.product.is_available or item.product.stock < item.quantity:
+                metrics.STOCK_REJECTIONS.inc(source='checkout')
                 messages.error(request, f'Товар "{item.product.name}" недоступен')
                 return redirect('cart')
 
@@ -566,6 +588,7 @@ def process_user_order(request):
         # Проверяем наличие товаров
         for item in cart_obj.items.all():
             if not item.product.is_available or item.product.stock < item.quantity:
+                metrics.STOCK_REJECTIONS.inc(source='checkout')
                 messages.error(request, f'Товар "{item.product.name}" недоступен или недостаточно на складе')
                 return redirect('cart')
 
@@ -614,33 +637,35 @@ def guest_checkout(request):
             for item in cart_data['items']:
                 product = item['product']
                 if not product.is_available or product.stock < item['quantity']:
+                    metrics.STOCK_REJECTIONS.inc(source='checkout')
                     messages.error(request, f'Товар "{product.name}" недоступен или недостаточно на складе')
                     return redirect('cart')
 
             # Создаем заказ
-            order = Order.objects.create(
-                user=None,
-                status=OrderStatus.get_default_status(),
-                total_amount=cart_data['total_price'],
-                shipping_address=shipping_address,
-                contact_phone=phone,
-                notes=notes,
-                guest_email=email,
-                guest_name=f"{first_name} {last_name}".strip()
-            )
-
-            # Создаем элементы заказа
-            for item in cart_data['items']:
-                product = item['product']
-                OrderItem.objects.create(
-                    order=order,
-                    product=product,
-                    quantity=item['quantity'],
-                    price=product.price,
-                    subtotal=item['subtotal']
+            with transaction.atomic():
+                order = Order.objects.create(
+                    user=None,
+                    status=OrderStatus.get_default_status(),
+                    total_amount=cart_data['total_price'],
+                    shipping_address=shipping_address,
+                    contact_phone=phone,
+                    notes=notes,
+                    guest_email=email,
+                    guest_name=f"{first_name} {last_name}".strip()
                 )
-                # Уменьшаем количество на складе
-                product.decrease_stock(item['quantity'])
+
+                # Создаем элементы заказа
+                for item in cart_data['items']:
+                    product = item['product']
+                    OrderItem.objects.create(
+                        order=order,
+                        product=product,
+                        quantity=item['quantity'],
+                        price=product.price,
+                        subtotal=item['subtotal']
+                    )
+                    # Уменьшаем количество на складе
+                    product.decrease_stock(item['quantity'], order=order)
 
             # Очищаем сессионную корзину
             request.session['cart'] = '{}'
@@ -688,33 +713,35 @@ def process_guest_order(request, cart_data=None):
             for item in cart_data['items']:
                 product = item['product']  # Это объект Product
                 if not product.is_available or product.stock < item['quantity']:
+                    metrics.STOCK_REJECTIONS.inc(source='checkout')
                     messages.error(request, f'Товар "{product.name}" недоступен или недостаточно на складе')
                     return redirect('cart')
 
             # Создаем заказ без привязки к пользователю
-            order = Order.objects.create(
-                user=None,  # Заказ без пользователя
-                status=OrderStatus.get_default_status(),
-                total_amount=cart_data['total_price'],
-                shipping_address=shipping_address,
-                contact_phone=phone,
-                notes=notes,
-                guest_email=email,
-                guest_name=f"{first_name} {last_name}".strip()
-            )
-
-            # Создаем элементы заказа
-            for item in cart_data['items']:
-                product = item['product']
-                OrderItem.objects.create(
-                    order=order,
-                    product=product,
-                    quantity=item['quantity'],
-                    price=product.price,
-                    subtotal=item['subtotal']
+            with transaction.atomic():
+                order = Order.objects.create(
+                    user=None,  # Заказ без пользователя
+                    status=OrderStatus.get_default_status(),
+                    total_amount=cart_data['total_price'],
+                    shipping_address=shipping_address,
+                    contact_phone=phone,
+                    notes=notes,
+                    guest_email=email,
+                    guest_name=f"{first_name} {last_name}".strip()
                 )
-                # Уменьшаем количество на складе
-                product.decrease_stock(item['quantity'])
+
+                # Создаем элементы заказа
+                for item in cart_data['items']:
+                    product = item['product']
+                    OrderItem.objects.create(
+                        order=order,
+                        product=product,
+                        quantity=item['quantity'],
+                        price=product.price,
+                        subtotal=item['subtotal']
+                    )
+                    # Уменьшаем количество на складе
+                    product.decrease_stock(item['quantity'], order=order)
 
             # Очищаем сессионную корзину
             request.session['cart'] = '{}'
@@ -731,6 +758,42 @@ def process_guest_order(request, cart_data=None):
     return guest_checkout(request)
 
 
+# Заказов на странице истории
+ORDERS_PER_PAGE = 20
+
+
+class OrderHistory:
+    """
+    Текущие и архивные заказы пользователя одной последовательностью по дате создания.
+    Срез читает из каждой таблицы не больше stop заказов и сливает их, поэтому подходит для Paginator
+    """
+
+    def __init__(self, user):
+        self.sources = [
+            Order.objects.filter(user=user).select_related('status').prefetch_related('items'),
+            ArchivedOrder.objects.filter(user=user).select_related('status').prefetch_related('items'),
+        ]
+
+    def count(self):
+        return sum(source.count() for source in self.sources)
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            return self[index:index + 1][0]
+        start, stop = index.start or 0, index.stop
+        parts = [source.order_by('-created_at', '-id')[:stop] for source in self.sources]
+        merged = heapq.merge(*parts, key=lambda order: (order.created_at, order.id), reverse=True)
+        return list(itertools.islice(merged, start, stop))
+
+
+def get_order_history(user, page_number=None):
+    """Страница истории заказов пользователя: текущие и архивные заказы вместе"""
+    return Paginator(OrderHistory(user), ORDERS_PER_PAGE).get_page(page_number)
+
+
 def get_session_cart(request):
     """Получить корзину из сессии"""
     cart_data = request.session.get('cart', '{}')
@@ -742,6 +805,14 @@ def get_session_cart(request):
 
 def save_session_cart(request, cart):
     """Сохранить корзину в сессию"""
+    previous = get_session_cart(request)
+    for product_id in set(previous) | set(cart):
+        if product_id not in previous:
+            metrics.CART_MUTATIONS.inc(action='add', storage='session')
+        elif product_id not in cart:
+            metrics.CART_MUTATIONS.inc(action='remove', storage='session')
+        elif previous[product_id] != cart[product_id]:
+            metrics.CART_MUTATIONS.inc(action='update', storage='session')
     request.session['cart'] = json.dumps(cart)
     request.session.modified = True
 
@@ -838,7 +909,7 @@ def ajax_add_to_cart(request, product_id):
     """Добавление в корзину через AJAX"""
     if request.method == 'POST':
         try:
-            product = Product.objects.get(id=product_id, is_available=True)
+            product = Product.objects.available().get(id=product_id)
 
             if request.user.is_authenticated:
                 # Для авторизованных пользователей
@@ -854,6 +925,7 @@ def ajax_add_to_cart(request, product_id):
                         cart_item.quantity += 1
                         cart_item.save()
                     else:
+                        metrics.STOCK_REJECTIONS.inc(source='cart')
                         return JsonResponse({
                             'success': False,
                             'message': f'Достигнуто максимальное количество товара "{product.name}" на складе'
@@ -877,6 +949,7 @@ def ajax_add_to_cart(request, product_id):
                         'message': f'Товар "{product.name}" добавлен в корзину'
                     })
                 else:
+                    metrics.STOCK_REJECTIONS.inc(source='cart')
                     return JsonResponse({
                         'success': False,
                         'message': f'Достигнуто максимальное количество товара "{product.name}" на складе'
@@ -41,13 +41,20 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'voentorg.tracing.TracingMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'voentorg.middleware.MetricsMiddleware',
+    'voentorg.middleware.QueryBudgetMiddleware',
+    'voentorg.middleware.ResponseOptimizationMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'voentorg.profiling.ProfilingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'voentorg.middleware.AssetPreloadMiddleware',
+    'voentorg.tracing.ViewTracingMiddleware',
 ]
 
 ROOT_URLCONF = 'voentorgsystem.urls'
@@ -137,7 +144,72 @@ AUTH_USER_MODEL = 'voentorg.CustomUser'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Отдача медиафайлов: 'python' - силами Django (локальная работа, тесты),
+# 'nginx' - заголовок X-Accel-Redirect, 'apache' - заголовок X-Sendfile (mod_xsendfile)
+MEDIA_SENDFILE_BACKEND = 'python'
+# internal location nginx, который указывает на MEDIA_ROOT
+MEDIA_ACCEL_REDIRECT_PREFIX = '/protected-media/'
+
+# Метрики (/metrics): каждый процесс пишет значения в свой файл в этом каталоге, при выдаче они
+# суммируются. Очистку выполняют хуки из gunicorn.conf.py: on_starting удаляет файлы прошлого запуска,
+# child_exit переносит значения завершившегося воркера в общий архив и удаляет его файл.
+# При другом сервере приложений вызывайте voentorg.metrics.clear_metrics_dir и mark_process_dead сами
+METRICS_DIR = os.path.join(BASE_DIR, 'metrics')
+# Токен для сборщика Prometheus (Authorization: Bearer ...); без него метрики видят только сотрудники
+METRICS_BEARER_TOKEN = None
+
+# SELECT-запросы дольше этого времени (секунды) сохраняются с планом выполнения для команды
+# index_advisor; None - не сохранять
+SLOW_QUERY_THRESHOLD = 0.1
+
+# Трассировка запросов: доля запросов (0 - выключена, 1 - все), трассировки которых дописываются
+# строками JSON в TRACING_FILE; сводка для flame graph - команда trace_flamegraph
+TRACING_SAMPLE_RATE = 0.0
+TRACING_FILE = os.path.join(BASE_DIR, 'traces.jsonl')
+# Интервалы отрисовки шаблонов и работы с сессией дают бэкенды-обертки из voentorg.tracing;
+# без трассировки остаются стандартные. Переопределяя TRACING_SAMPLE_RATE в другом модуле настроек,
+# выберите там и эти бэкенды
+if TRACING_SAMPLE_RATE:
+    TEMPLATES[0]['BACKEND'] = 'voentorg.tracing.TracedDjangoTemplates'
+    SESSION_ENGINE = 'voentorg.tracing'
+
+# Главная страница фильтрует и сортирует товары в памяти процесса (voentorg.catalog_engine),
+# из базы читается только видимая страница. Версия каталога хранится в кэше default: при нескольких
+# воркерах он должен быть общим (Redis, Memcached), иначе изменения подхватываются раз в MAX_AGE секунд.
+# Версию меняют сохранение товара и сигнал products_changed (импорт, популярность); изменения через
+# QuerySet.update в обход них видны не позже чем через MAX_AGE. Остатки в снимок не входят:
+# количество на складе всегда читается из базы вместе со страницей, продажам версия не нужна
+CATALOG_ENGINE = False
+CATALOG_ENGINE_MAX_AGE = 300
+# Товаров на одной странице главной
+CATALOG_PAGE_SIZE = 48
+
+CACHES = {
+    'default': {
+        'BACKEND': 'voentorg.metrics.InstrumentedLocMemCache',
+    },
+}
+
 # Настройки аутентификации
 LOGIN_REDIRECT_URL = 'home'
 LOGOUT_REDIRECT_URL = 'home'
-LOGIN_URL = 'login'
\ No newline at end of file
+LOGIN_URL = 'login'
+
+# Журналы приложения выводятся в консоль. Сводки каждого запроса (размеры ответа до и после сжатия,
+# число SQL-запросов) пишутся с уровнем DEBUG, превышение бюджета запросов - WARNING;
+# для разбора конкретной страницы понизьте уровень логгера 'voentorg.middleware' до DEBUG
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'voentorg': {
+            'handlers': ['console'],
+            'level': 'INFO',
+        },
+    },
+}
@@ -17,12 +17,14 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path, include
 from django.conf import settings
-from django.conf.urls.static import static
+from voentorg.media import serve_media
+from voentorg.metrics import metrics_view
 
 urlpatterns = [
     path('admin/', admin.site.urls),
+    # Медиафайлы: в production передачу выполняет прокси (см. MEDIA_SENDFILE_BACKEND)
+    path(f"{settings.MEDIA_URL.lstrip('/')}<path:path>", serve_media, name='media'),
+    # Метрики Prometheus (только для сотрудников или по токену METRICS_BEARER_TOKEN)
+    path('metrics', metrics_view, name='metrics'),
     path('', include('voentorg.urls')),
 ]
-
-if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)